@@ -0,0 +1,401 @@
+# alert_dispatcher.py
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from alert_manager import alert_document, send_alert_to_firestore, update_alert_status, watch_alert_response
+from metrics import ALERT_NOTIFY_SECONDS, ALERT_ROUNDTRIP_SECONDS, ALERT_STATES, FIRESTORE_WRITE_SECONDS
+from outbox import encode_time
+
+# ---------------- States ---------------- #
+PENDING = "PENDING"
+PLAY = "PLAY"
+NOT_PLAY = "NOT_PLAY"
+TIMEOUT = "TIMEOUT"
+PROCESSED = "PROCESSED"
+
+TRANSITIONS = {
+    PENDING: (PLAY, NOT_PLAY, TIMEOUT),
+    PLAY: (PROCESSED,),
+    NOT_PLAY: (PROCESSED,),
+    TIMEOUT: (PROCESSED,),
+    PROCESSED: (),
+}
+
+FIRESTORE = "firestore"
+GSM = "gsm"
+
+
+def new_alert_id(camera_id):
+    return f"alert_{camera_id}_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+
+
+class AlertRecord:
+    """One alert and where it is in PENDING -> PLAY/NOT_PLAY/TIMEOUT -> PROCESSED."""
+
+    FIELDS = ("id", "animal", "confidence", "camera_id", "created", "deadline",
+              "state", "channel", "sent", "attempts", "sound_played", "history")
+
+    def __init__(self, id, animal, confidence, camera_id, created, deadline, state=PENDING,
+                 channel=FIRESTORE, sent=False, attempts=0, sound_played=False, history=None):
+        self.id = id
+        self.animal = animal
+        self.confidence = float(confidence)
+        self.camera_id = camera_id
+        self.created = created
+        self.deadline = deadline
+        self.state = state
+        self.channel = channel
+        self.sent = sent
+        self.attempts = attempts
+        self.sound_played = sound_played
+        self.history = history if history is not None else [[state, created]]
+        self.trace = None  # metrics.Trace of this run, not persisted
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data[name] for name in cls.FIELDS if name in data})
+
+
+# ---------------- Persistence ---------------- #
+class AlertStore:
+    """JSON file holding every alert record; rewritten atomically on each change."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                return [AlertRecord.from_dict(d) for d in json.load(f)]
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            print(f" Could not read alert state {self.path}: {e}")
+            return []
+
+    def save(self, records):
+        data = [r.to_dict() for r in records]
+        tmp = self.path + ".tmp"
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump(data, f, indent=1)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+
+
+# ---------------- Dispatcher ---------------- #
+class AlertDispatcher:
+    """
+    Runs any number of alerts at once, each as its own state machine.
+
+    submit() returns immediately. The alert document gets a unique ID; the
+    farmer's answer arrives through a Firestore snapshot listener, the
+    deadline through a timer, and the resulting action (sound, PROCESSED
+    update) runs on a single worker so sounds never overlap. Firestore
+    writes are retried with exponential backoff before falling back to GSM,
+    where `ask_via_gsm(record)` sends the SMS and returns a Future of the
+    reply ("1", "0", or None when the SMS failed); the alert then gets
+    `gsm_timeout` seconds from the fallback.
+
+    Every transition is written to `store`, and start() resumes alerts left
+    unfinished by a restart. With an `outbox`, each alert, its image and the
+    decision are also recorded there: alerts that never reached Firestore
+    are uploaded, already PROCESSED, once the connection is back, and the
+    final status of every alert goes through the outbox's sync worker. An
+    alarm is not played for an alert older than `stale_after` seconds; it is
+    only closed. `on_change(record)`, if given, is called after the alert is
+    created and after every transition.
+    A `trace` passed to submit() gets a mark for every step and is finished
+    when the alert is PROCESSED.
+    """
+
+    def __init__(self, db, store, play_alarm, ask_via_gsm=None, timeout=300, gsm_timeout=300,
+                 poll_interval=5, retries=3, retry_delay=2.0, stale_after=None, keep_processed=100,
+                 outbox=None, on_change=None):
+        self.db = db
+        self.store = store
+        self.outbox = outbox
+        self.play_alarm = play_alarm
+        self.ask_via_gsm = ask_via_gsm
+        self.timeout = timeout
+        self.gsm_timeout = gsm_timeout
+        self.poll_interval = poll_interval
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.stale_after = stale_after if stale_after is not None else max(timeout, gsm_timeout) + 60
+        self.keep_processed = keep_processed
+        self.on_change = on_change
+
+        self.records = {}
+        self._watchers = {}
+        self._replies = {}
+        self._timers = {}
+        self._lock = threading.RLock()
+        self._actions = ThreadPoolExecutor(max_workers=1, thread_name_prefix="alert-action")
+        self._closed = False
+        self.counts = {}
+
+    # ---------------- Lifecycle ---------------- #
+    def start(self):
+        """Load persisted alerts and resume the ones that are not PROCESSED."""
+        resumed = 0
+        with self._lock:
+            for record in self.store.load():
+                self.records[record.id] = record
+            for record in list(self.records.values()):
+                if record.state != PROCESSED:
+                    resumed += 1
+                    self._resume(record)
+        if resumed:
+            print(f" Resuming {resumed} unfinished alert(s).")
+        return self
+
+    def stop(self, wait=True):
+        with self._lock:
+            self._closed = True
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers.clear()
+            for watcher in self._watchers.values():
+                watcher.close()
+            self._watchers.clear()
+            for reply in self._replies.values():
+                reply.cancel()
+            self._replies.clear()
+        self._actions.shutdown(wait=wait)
+
+    def _resume(self, record):
+        now = time.time()
+        if record.state != PENDING:
+            self._actions.submit(self._finish, record.id)
+        elif record.channel == GSM or now >= record.deadline:
+            # an SMS conversation does not survive a restart
+            self._transition(record, TIMEOUT)
+        elif not record.sent:
+            self._send(record.id)
+        else:
+            self._watch(record)
+
+    # ---------------- Submit ---------------- #
+    def submit(self, animal, confidence, camera_id, alert_id=None, image=None, detections=None, trace=None):
+        now = time.time()
+        record = AlertRecord(alert_id or new_alert_id(camera_id), animal, confidence, camera_id,
+                             created=now, deadline=now + self.timeout)
+        record.trace = trace
+        with self._lock:
+            self.records[record.id] = record
+            self._count("submitted")
+            self._save()
+        if self.outbox is not None:
+            data = alert_document(animal, confidence, record.id, camera_id, timestamp=encode_time(now))
+            data.update(image=image and os.path.basename(image), detections=detections or [])
+            # held back until the alert is decided, so a late upload never shows a stale PENDING alert
+            self.outbox.record("alerts", record.id, data, hold=True, priority=1, file=image)
+        print(f" Alert {record.id} created: {animal} ({float(confidence)*100:.1f}%) on {camera_id}")
+        self._changed(record)
+        self._mark(record, "record alert")
+        self._send(record.id)
+        return record
+
+    def _send(self, alert_id):
+        with self._lock:
+            record = self.records[alert_id]
+            if self._closed or record.state != PENDING:
+                return
+            record.attempts += 1
+        if record.attempts > 1:
+            self._mark(record, "retry backoff")
+
+        t0 = time.perf_counter()
+        sent = send_alert_to_firestore(self.db, record.animal, record.confidence, record.id, location=record.camera_id)
+        FIRESTORE_WRITE_SECONDS.observe(time.perf_counter() - t0, "ok" if sent else "error")
+        self._mark(record, "firestore write" if sent else "firestore write failed")
+        if sent:
+            ALERT_NOTIFY_SECONDS.observe(time.time() - record.created, FIRESTORE)
+            with self._lock:
+                record.sent = True
+                self._save()
+            if self.outbox is not None:
+                self.outbox.mark_synced("alerts", record.id, keep=("image", "detections"))
+            self._watch(record)
+            return
+
+        if self.db is not None and record.attempts <= self.retries:
+            delay = self.retry_delay * 2 ** (record.attempts - 1)
+            print(f" Retrying alert {record.id} in {delay:.1f}s (attempt {record.attempts + 1})")
+            self._schedule(alert_id, delay, self._send)
+            return
+
+        with self._lock:
+            record.channel = GSM
+            record.deadline = time.time() + self.gsm_timeout
+            self._save()
+        if self.ask_via_gsm is None:
+            self._transition(record, TIMEOUT)
+        else:
+            self._ask_gsm(record)
+
+    # ---------------- Responses ---------------- #
+    def _watch(self, record):
+        with self._lock:
+            if self._closed:
+                return
+            self._watchers[record.id] = watch_alert_response(
+                self.db, record.id,
+                # off the listener thread: handling the answer closes the listener
+                callback=lambda status, alert_id=record.id: self._actions.submit(self._on_response, alert_id, status),
+                poll_interval=self.poll_interval,
+            )
+        self._schedule(record.id, max(0.0, record.deadline - time.time()), self._on_timeout)
+
+    def _on_response(self, alert_id, status):
+        with self._lock:
+            record = self.records.get(alert_id)
+            if record is not None and record.state == PENDING:
+                self._transition(record, status)
+
+    def _on_timeout(self, alert_id):
+        with self._lock:
+            record = self.records.get(alert_id)
+            if record is not None and record.state == PENDING:
+                print(f" No response to {alert_id} -> auto-play.")
+                self._transition(record, TIMEOUT)
+
+    def _ask_gsm(self, record):
+        reply = self.ask_via_gsm(record)
+        with self._lock:
+            if self._closed:
+                reply.cancel()
+                return
+            self._replies[record.id] = reply
+        reply.add_done_callback(
+            lambda f, alert_id=record.id: f.cancelled() or self._actions.submit(self._on_gsm_reply, alert_id, f.result()))
+        self._schedule(record.id, max(0.0, record.deadline - time.time()), self._on_timeout)
+
+    def _on_gsm_reply(self, alert_id, reply):
+        with self._lock:
+            record = self.records.get(alert_id)
+            if record is not None and record.state == PENDING:
+                self._transition(record, {"1": PLAY, "0": NOT_PLAY}.get(reply, TIMEOUT))
+
+    # ---------------- Transitions ---------------- #
+    def _transition(self, record, state):
+        with self._lock:
+            if state not in TRANSITIONS[record.state]:
+                print(f" Ignoring {record.state} -> {state} for {record.id}")
+                return False
+            now = time.time()
+            record.state = state
+            record.history.append([state, now])
+            self._count(state)
+            ALERT_STATES.inc(state, record.channel)
+            if state in (PLAY, NOT_PLAY, TIMEOUT):
+                ALERT_ROUNDTRIP_SECONDS.observe(now - record.created, record.channel, state)
+                self._mark(record, f"waiting for farmer ({record.channel})", now, wait=True)
+            self._release(record.id)
+            self._save()
+        if self.outbox is not None and state in (PLAY, NOT_PLAY, TIMEOUT):
+            self.outbox.record("alerts", record.id, {
+                "decision": state,
+                "channel": record.channel,
+                "decided_at": encode_time(now),
+            }, hold=True, priority=1)
+        self._changed(record)
+        if state == PROCESSED and record.trace is not None:
+            record.trace.mark("close")
+            record.trace.finish()
+        if state in (PLAY, NOT_PLAY, TIMEOUT) and not self._closed:
+            self._actions.submit(self._finish, record.id)
+        return True
+
+    def _finish(self, alert_id):
+        """Act on the decision, then mark the alert PROCESSED (locally and in Firestore)."""
+        record = self.records[alert_id]
+        wants_sound = record.state in (PLAY, TIMEOUT)
+        if wants_sound and not record.sound_played:
+            if time.time() - record.created > self.stale_after:
+                print(f" Alert {alert_id} is stale, closing without alarm.")
+            else:
+                self.play_alarm(record)
+                self._mark(record, "alarm start")
+                with self._lock:
+                    record.sound_played = True
+                    self._save()
+
+        if self.outbox is not None:
+            self.outbox.record("alerts", record.id, {
+                "status": PROCESSED,
+                "last_updated": datetime.utcnow().isoformat(),
+            }, priority=1)
+        elif record.sent:
+            for attempt in range(self.retries + 1):
+                if update_alert_status(self.db, record.id, PROCESSED):
+                    break
+                time.sleep(self.retry_delay * 2 ** attempt)
+        self._transition(record, PROCESSED)
+
+    # ---------------- Helpers ---------------- #
+    def _mark(self, record, segment, at=None, wait=False):
+        if record.trace is not None:
+            record.trace.mark(segment, at, wait)
+
+    def _changed(self, record):
+        if self.on_change is not None:
+            try:
+                self.on_change(record)
+            except Exception as e:
+                print(" Alert change handler error:", e)
+
+    def _schedule(self, alert_id, delay, fn):
+        timer = threading.Timer(delay, fn, args=(alert_id,))
+        timer.daemon = True
+        with self._lock:
+            if self._closed or self.records[alert_id].state != PENDING:
+                return
+            old = self._timers.pop(alert_id, None)
+            if old is not None:
+                old.cancel()
+            self._timers[alert_id] = timer
+        timer.start()
+
+    def _release(self, alert_id):
+        timer = self._timers.pop(alert_id, None)
+        if timer is not None:
+            timer.cancel()
+        watcher = self._watchers.pop(alert_id, None)
+        if watcher is not None:
+            watcher.close()
+        reply = self._replies.pop(alert_id, None)
+        if reply is not None:
+            reply.cancel()
+
+    def _save(self):
+        processed = [r for r in self.records.values() if r.state == PROCESSED]
+        for record in sorted(processed, key=lambda r: r.created)[:-self.keep_processed or None]:
+            del self.records[record.id]
+        self.store.save(list(self.records.values()))
+
+    def _count(self, key):
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def pending(self):
+        with self._lock:
+            return [r for r in self.records.values() if r.state != PROCESSED]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self.pending()),
+                "by_state": dict(self.counts),
+            }
@@ -1,9 +1,11 @@
 # alert_manager.py
-import firebase_admin
-from firebase_admin import credentials, firestore
+# firebase_admin is imported on first use: it takes seconds on a Pi and main.py
+# initializes Firebase in the background while the cameras start
 from datetime import datetime
+from concurrent.futures import Future, TimeoutError as FutureTimeout
 
 import os
+import threading
 os.environ["GRPC_ENABLE_FORK_SUPPORT"] = "0"
 os.environ["GRPC_VERBOSITY"] = "NONE"
 os.environ["GRPC_ENABLE_HTTP_PROXY"] = "0"
@@ -13,14 +15,21 @@ os.environ["GRPC_POLL_STRATEGY"] = "epoll1,poll"
 
 _db = None  # store global reference
 
+FINAL_RESPONSES = ("PLAY", "NOT_PLAY")
+RESPONSE_POLL_INTERVAL = 5  # seconds between reads when no snapshot listener is running
+
 def init_firebase():
     global _db
     if _db is not None:
         return _db  # Prevent multiple initializations
 
     try:
-        cred = credentials.Certificate("firebase_config.json")
-        firebase_admin.initialize_app(cred)
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+        try:
+            firebase_admin.get_app()  # left over from an earlier attempt that failed later on
+        except ValueError:
+            firebase_admin.initialize_app(credentials.Certificate("firebase_config.json"))
         _db = firestore.client()
         print("Firebase initialized successfully.")
         return _db
@@ -29,9 +38,26 @@ def init_firebase():
         return None
 
 
-def send_alert_to_firestore(db, animal, confidence, alert_doc_id):
+def alert_document(animal, confidence, alert_doc_id, location="farm_camera_1", timestamp=None):
+    """Fields of a new alert document; `timestamp` defaults to the server time."""
+    if timestamp is None:
+        from firebase_admin import firestore
+        timestamp = firestore.SERVER_TIMESTAMP
+    return {
+        "alert_id": alert_doc_id,
+        "animal": str(animal),
+        "confidence": float(confidence),
+        "timestamp": timestamp,
+        "status": "PENDING",
+        "user_id": "001",
+        "location": str(location),
+    }
+
+
+def send_alert_to_firestore(db, animal, confidence, alert_doc_id, location="farm_camera_1"):
     """
     Send or update alert in Firestore.
+    `location` is the ID of the camera that saw the animal.
     Returns True if successful, False if offline.
     """
     if db is None:
@@ -40,18 +66,10 @@ def send_alert_to_firestore(db, animal, confidence, alert_doc_id):
 
     try:
         confidence_float = float(confidence)
-        alert_data = {
-            "alert_id": alert_doc_id,
-            "animal": str(animal),
-            "confidence": confidence_float,
-            "timestamp": firestore.SERVER_TIMESTAMP,
-            "status": "PENDING",
-            "user_id": "001",
-            "location": "farm_camera_1",
-        }
+        alert_data = alert_document(animal, confidence_float, alert_doc_id, location)
 
         db.collection("alerts").document(alert_doc_id).set(alert_data)
-        print(f" Firestore alert created for {animal} ({confidence_float*100:.1f}%)")
+        print(f" Firestore alert created for {animal} ({confidence_float*100:.1f}%) at {location}")
         return True
     except Exception as e:
         print(f" Failed to send alert to Firestore: {e}")
@@ -79,14 +97,108 @@ def check_alert_response(db, alert_doc_id):
 
 
 def update_alert_status(db, alert_doc_id, new_status):
-    """Safely update alert document status."""
+    """Safely update alert document status. Returns True if the write went through."""
     if db is None:
-        return
+        return False
     try:
         db.collection("alerts").document(alert_doc_id).update({
             "status": new_status,
             "last_updated": datetime.utcnow().isoformat(),
         })
         print(f" Firestore alert updated → {new_status}")
+        return True
     except Exception as e:
-        print(f" Could not update Firestore alert: {e}")
\ No newline at end of file
+        print(f" Could not update Firestore alert: {e}")
+        return False
+
+
+# ---------------- Response Listener ---------------- #
+class AlertResponseWatcher:
+    """
+    Waits for the farmer's answer to one alert.
+
+    A Firestore snapshot listener pushes every change of the alert document,
+    so the answer arrives within a round trip and costs one read per change
+    instead of one read per poll. If the listener cannot be attached, or
+    stops while waiting, the watcher falls back to check_alert_response()
+    every `poll_interval` seconds.
+
+    `future` resolves to "PLAY" or "NOT_PLAY"; `callback(status)` is called
+    once when it does.
+    """
+
+    def __init__(self, db, alert_doc_id, callback=None, poll_interval=RESPONSE_POLL_INTERVAL):
+        self.db = db
+        self.alert_doc_id = alert_doc_id
+        self.poll_interval = poll_interval
+        self.future = Future()
+        self.listener = None
+        self.polls = 0
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+        if callback is not None:
+            self.future.add_done_callback(lambda f: f.cancelled() or callback(f.result()))
+
+    def start(self):
+        try:
+            doc_ref = self.db.collection("alerts").document(self.alert_doc_id)
+            self.listener = doc_ref.on_snapshot(self._on_snapshot)
+        except Exception as e:
+            print(f" Snapshot listener unavailable, polling every {self.poll_interval}s: {e}")
+            self.listener = None
+
+        self._thread = threading.Thread(target=self._supervise, name="alert-response", daemon=True)
+        self._thread.start()
+        return self
+
+    def _resolve(self, status):
+        status = (status or "").upper()
+        if status not in FINAL_RESPONSES:
+            return
+        with self._lock:
+            if self.future.done():
+                return
+            self.future.set_result(status)
+        self._stop.set()
+
+    def _on_snapshot(self, doc_snapshots, changes, read_time):
+        # runs on the Firestore listener thread
+        for doc in doc_snapshots:
+            if doc.exists:
+                self._resolve((doc.to_dict() or {}).get("status"))
+
+    def _listening(self):
+        return self.listener is not None and getattr(self.listener, "is_active", True)
+
+    def _supervise(self):
+        while not self._stop.wait(self.poll_interval):
+            if self._listening():
+                continue
+            if self.listener is not None:
+                print(" Snapshot listener stopped, falling back to polling.")
+                self.listener = None
+            self.polls += 1
+            self._resolve(check_alert_response(self.db, self.alert_doc_id))
+
+    def wait(self, timeout=None):
+        """Farmer's answer, or None if none arrived within `timeout` seconds."""
+        try:
+            return self.future.result(timeout=timeout)
+        except FutureTimeout:
+            return None
+
+    def close(self):
+        self._stop.set()
+        if self.listener is not None:
+            try:
+                self.listener.unsubscribe()
+            except Exception as e:
+                print(f" Could not stop snapshot listener: {e}")
+            self.listener = None
+
+
+def watch_alert_response(db, alert_doc_id, callback=None, poll_interval=RESPONSE_POLL_INTERVAL):
+    """Start watching an alert document; returns the running AlertResponseWatcher."""
+    return AlertResponseWatcher(db, alert_doc_id, callback, poll_interval).start()
@@ -0,0 +1,27 @@
+# avi.py
+# Shared by the API (image_store) and the Raspberry Pi (clip_buffer, which imports it as api.avi),
+# so it only depends on the standard library.
+import struct
+
+JPEG_SOI = b"\xff\xd8\xff"  # start-of-image marker followed by the first segment marker
+
+
+def read_avi(data):
+    """(fps, [JPEG bytes]) of an MJPEG AVI as written by clip_buffer.write_avi (or any simple one)."""
+    if data[:4] != b"RIFF" or data[8:12] != b"AVI ":
+        raise ValueError("not an AVI file")
+    fps, frames, stack = 0.0, [], [(12, len(data))]
+    while stack:
+        pos, end = stack.pop()
+        while pos + 8 <= end:
+            fourcc, size = struct.unpack_from("<4sI", data, pos)
+            body = pos + 8
+            if fourcc == b"LIST":
+                stack.append((body + 4, min(body + size, end)))
+            elif fourcc == b"avih" and size >= 4:
+                micro = struct.unpack_from("<I", data, body)[0]
+                fps = 1e6 / micro if micro else 0.0
+            elif fourcc[2:] == b"dc" and data[body:body + 3] == JPEG_SOI:
+                frames.append(data[body:body + size])
+            pos = body + size + (size & 1)
+    return fps, frames
@@ -0,0 +1,104 @@
+# events.py
+import asyncio
+import collections
+import itertools
+import json
+import time
+
+HEARTBEAT = 15          # seconds between keep-alive comments on an idle stream
+SUBSCRIBER_BUFFER = 64  # events queued per client before it counts as too slow
+REPLAY_SIZE = 256       # recent events kept for reconnecting clients (Last-Event-ID)
+
+
+class Subscriber:
+    def __init__(self, maxsize, types=None):
+        self.queue = collections.deque()
+        self.maxsize = maxsize
+        self.types = types
+        self.ready = asyncio.Event()
+        self.evicted = False
+
+
+class EventHub:
+    """
+    In-process fan-out of server events to Server-Sent Events clients.
+
+    publish() appends the event to each subscriber's bounded buffer and
+    wakes it; it never waits on a client. A subscriber whose buffer is full
+    is evicted (its stream ends) and can reconnect with Last-Event-ID to
+    replay what it missed from the last REPLAY_SIZE events. An idle
+    subscriber costs one parked coroutine, so thousands are cheap.
+    publish() must be called from the event loop.
+    """
+
+    def __init__(self, buffer=SUBSCRIBER_BUFFER, replay=REPLAY_SIZE, max_subscribers=10000):
+        self.buffer = buffer
+        self.max_subscribers = max_subscribers
+        self.subscribers = set()
+        self.recent = collections.deque(maxlen=replay)
+        # millisecond-based ids keep increasing across restarts, so an old Last-Event-ID stays comparable
+        self._ids = itertools.count(int(time.time() * 1000))
+        self.published = 0
+        self.evicted = 0
+
+    def publish(self, event_type, data):
+        event = (next(self._ids), event_type, json.dumps(data), time.time())
+        self.recent.append(event)
+        self.published += 1
+        for sub in list(self.subscribers):
+            if sub.types and event_type not in sub.types:
+                continue
+            if len(sub.queue) >= sub.maxsize:
+                self._evict(sub)
+                continue
+            sub.queue.append(event)
+            sub.ready.set()
+        return event[0]
+
+    def _evict(self, sub):
+        sub.evicted = True
+        sub.queue.clear()
+        sub.ready.set()
+        self.subscribers.discard(sub)
+        self.evicted += 1
+
+    def subscribe(self, types=None, last_event_id=None):
+        """A new subscriber, pre-filled with the events after `last_event_id`; None when full."""
+        if len(self.subscribers) >= self.max_subscribers:
+            return None
+        sub = Subscriber(self.buffer, types)
+        if last_event_id is not None:
+            missed = [e for e in self.recent if e[0] > last_event_id and (not types or e[1] in types)]
+            for event in missed[-self.buffer:]:
+                sub.queue.append(event)
+            sub.ready.set()
+        self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        self.subscribers.discard(sub)
+
+    async def stream(self, sub, heartbeat=HEARTBEAT):
+        """SSE text for one subscriber, until it disconnects (generator closed) or is evicted."""
+        try:
+            yield f"retry: 3000\n: connected, {len(self.subscribers)} subscriber(s)\n\n"
+            while not sub.evicted:
+                try:
+                    await asyncio.wait_for(sub.ready.wait(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                sub.ready.clear()
+                while sub.queue:
+                    event_id, event_type, data, _ = sub.queue.popleft()
+                    yield f"id: {event_id}\nevent: {event_type}\ndata: {data}\n\n"
+        finally:
+            self.unsubscribe(sub)
+
+    def stats(self):
+        return {
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "evicted": self.evicted,
+            "last_event_id": self.recent[-1][0] if self.recent else 0,
+        }
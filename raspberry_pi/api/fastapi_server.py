@@ -1,54 +1,365 @@
-from fastapi import FastAPI, UploadFile, File
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, BackgroundTasks, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+from datetime import datetime, timezone
+from typing import Optional
+import asyncio
+import hmac
 import os
-import shutil
+import time
 import uvicorn
 
+from events import EventHub
+from http_cache import IMMUTABLE_CACHE_CONTROL, cached_response, http_date, not_modified
+from image_store import ImageStore, ImageTooLarge, InvalidImage, read_clip
+
 app = FastAPI(title="ChFarmGuard Cloud API")
 
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+RETENTION_DAYS = float(os.environ.get("RETENTION_DAYS", 30))
+MAX_IMAGES = int(os.environ.get("MAX_IMAGES", 5000))
+PRUNE_INTERVAL = 3600  # seconds between automatic pruning runs
+HISTORY_MAX_LIMIT = 100
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 10 * 1024 * 1024))
+MAX_CLIP_BYTES = int(os.environ.get("MAX_CLIP_BYTES", 20 * 1024 * 1024))
+FORM_OVERHEAD = 64 * 1024  # multipart boundaries and metadata fields on top of the image
+MAX_SUBSCRIBERS = int(os.environ.get("MAX_SUBSCRIBERS", 10000))
+EVENT_TYPES = ("image", "alert", "clip")
+API_KEY = os.environ.get("API_KEY")  # shared secret the Raspberry Pi sends as X-Api-Key; writes are open while unset
+
+store = ImageStore(UPLOAD_DIR)
+hub = EventHub(max_subscribers=MAX_SUBSCRIBERS)
+_last_prune = 0.0
+if not API_KEY:
+    print(" API_KEY is not set: uploads and alert events are accepted without X-Api-Key")
+
+
+# ---------------- Upload Size Limit ---------------- #
+class UploadSizeLimit:
+    """
+    ASGI middleware rejecting oversized upload bodies with 413 before they
+    are parsed: at once from Content-Length, or as soon as a chunked body
+    goes past the limit.
+    """
+
+    def __init__(self, app, max_bytes, paths=("/upload",)):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            response = JSONResponse(content={"status": "error", "detail": "Upload too large"}, status_code=413)
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail="Upload too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+app.add_middleware(UploadSizeLimit, max_bytes=MAX_UPLOAD_BYTES + FORM_OVERHEAD)
+app.add_middleware(UploadSizeLimit, max_bytes=MAX_CLIP_BYTES + FORM_OVERHEAD, paths=("/clips",))
+
+
+# ---------------- Helpers ---------------- #
+def require_api_key(x_api_key: Optional[str] = Header(None)):
+    """Once API_KEY is set, write routes only accept the Pi's shared secret."""
+    if not API_KEY:
+        return
+    if x_api_key is None or not hmac.compare_digest(x_api_key.encode(), API_KEY.encode()):
+        raise HTTPException(status_code=401, detail="Invalid or missing X-Api-Key")
+
 
+def parse_since(value):
+    """`since=` accepts epoch seconds or an ISO 8601 date/time (UTC if no zone)."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid since: {value}")
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def iso(t):
+    return datetime.fromtimestamp(t, tz=timezone.utc).isoformat()
+
+
+def describe(row):
+    return {
+        "id": row["id"],
+        "sha256": row["sha256"],
+        "size": row["size"],
+        "camera_id": row["camera_id"],
+        "animal": row["animal"],
+        "confidence": row["confidence"],
+        "alert_id": row["alert_id"],
+        "captured_at": iso(row["captured_at"]),
+        "uploaded_at": iso(row["uploaded_at"]),
+        "url": f"/images/{row['id']}.jpg",
+        "thumb_url": f"/images/{row['id']}/thumb.jpg",
+        "clip_url": f"/clips/{row['alert_id']}.avi" if row.get("has_clip") else None,
+    }
+
+
+def describe_clip(row):
+    return {
+        "alert_id": row["alert_id"],
+        "sha256": row["sha256"],
+        "size": row["size"],
+        "frames": row["frames"],
+        "fps": row["fps"],
+        "camera_id": row["camera_id"],
+        "animal": row["animal"],
+        "captured_at": iso(row["captured_at"]),
+        "uploaded_at": iso(row["uploaded_at"]),
+        "url": f"/clips/{row['alert_id']}.avi",
+        "stream_url": f"/clips/{row['alert_id']}.mjpg",
+    }
+
+
+def maybe_prune():
+    """Background task: retention pruning at most once per PRUNE_INTERVAL."""
+    global _last_prune
+    if time.time() - _last_prune < PRUNE_INTERVAL:
+        return
+    _last_prune = time.time()
+    result = store.prune(max_age=RETENTION_DAYS * 86400, max_images=MAX_IMAGES)
+    if result["rows"] or result["files"]:
+        print(f" Pruned {result['rows']} index rows and {result['files']} files")
+
+
+# ---------------- Routes ---------------- #
 @app.get("/")
 def home():
-    return {"status": "FastAPI server running globally!"}
+    return {"status": "FastAPI server running globally!", "events": hub.stats()}
 
 
 @app.get("/latest.jpg")
-def latest_image():
-    """Serve the latest uploaded image."""
-    latest_path = os.path.join(UPLOAD_DIR, "latest.jpg")
-    if os.path.exists(latest_path):
-        return FileResponse(latest_path, media_type="image/jpeg")
-    return JSONResponse(content={"error": "No image found"}, status_code=404)
+def latest_image(request: Request):
+    """Serve the latest uploaded image from memory, with ETag/Last-Modified revalidation and ranges."""
+    try:
+        row, data = store.latest_image()
+    except OSError:
+        row = None
+    if row is None:
+        return JSONResponse(content={"error": "No image found"}, status_code=404)
+    return cached_response(request, data, f'"{row["sha256"]}"', row["uploaded_at"])
+
+
+def immutable_file(request, path, etag, last_modified, media_type="image/jpeg"):
+    """Content-addressed file: cacheable forever, 304 on revalidation; FileResponse handles ranges."""
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL, "Last-Modified": http_date(last_modified)}
+    if not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
 
 
-@app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    """Receive an image from Raspberry Pi and replace the latest one."""
+@app.post("/upload", dependencies=[Depends(require_api_key)])
+async def upload_file(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    camera_id: Optional[str] = Form(None),
+    animal: Optional[str] = Form(None),
+    confidence: Optional[float] = Form(None),
+    alert_id: Optional[str] = Form(None),
+    captured_at: Optional[float] = Form(None),
+):
+    """
+    Receive an image from Raspberry Pi, keep it in the history and make it the latest one.
+
+    The multipart parser spools the body to a temporary file as it arrives;
+    copying, hashing and indexing it run in the thread pool so a slow or
+    large upload never blocks the event loop.
+    """
     try:
-        # --- Auto-clean before saving new file ---
-        for filename in os.listdir(UPLOAD_DIR):
-            file_path = os.path.join(UPLOAD_DIR, filename)
-            try:
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
-            except Exception:
-                pass
-
-        save_path = os.path.join(UPLOAD_DIR, "latest.jpg")
-        with open(save_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        print(f" New image uploaded: {save_path}")
-        return {"status": "success", "message": "Image uploaded successfully"}
+        row = await run_in_threadpool(
+            store.ingest, file.file, MAX_UPLOAD_BYTES, camera_id, animal, confidence, alert_id, captured_at)
+    except InvalidImage as e:
+        return JSONResponse(content={"status": "error", "detail": str(e)}, status_code=400)
+    except ImageTooLarge as e:
+        return JSONResponse(content={"status": "error", "detail": str(e)}, status_code=413)
+    except Exception as e:
+        return JSONResponse(content={"status": "error", "detail": str(e)}, status_code=500)
+    finally:
+        await file.close()
+
+    # thumbnails and pruning run after the response has been sent
+    background_tasks.add_task(store.make_thumbnail, row["id"])
+    background_tasks.add_task(maybe_prune)
 
+    image = describe(row)
+    hub.publish("image", image)
+    print(f" New image uploaded: {row['path']}")
+    return {"status": "success", "message": "Image uploaded successfully", "image": image}
+
+
+@app.post("/clips", dependencies=[Depends(require_api_key)])
+async def upload_clip(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    alert_id: str = Form(...),
+    camera_id: Optional[str] = Form(None),
+    animal: Optional[str] = Form(None),
+    captured_at: Optional[float] = Form(None),
+):
+    """Receive the short MJPEG AVI clip recorded around an alert, linked to its images by alert_id."""
+    try:
+        row = await run_in_threadpool(
+            store.ingest_clip, file.file, alert_id, MAX_CLIP_BYTES, camera_id, animal, captured_at)
+    except InvalidImage as e:
+        return JSONResponse(content={"status": "error", "detail": str(e)}, status_code=400)
+    except ImageTooLarge as e:
+        return JSONResponse(content={"status": "error", "detail": str(e)}, status_code=413)
     except Exception as e:
         return JSONResponse(content={"status": "error", "detail": str(e)}, status_code=500)
+    finally:
+        await file.close()
+
+    background_tasks.add_task(maybe_prune)
+    clip = describe_clip(row)
+    hub.publish("clip", clip)
+    print(f" New clip uploaded for {alert_id}: {row['frames']} frames")
+    return {"status": "success", "message": "Clip uploaded successfully", "clip": clip}
+
+
+@app.get("/clips/{alert_id}.avi")
+def clip(alert_id: str, request: Request):
+    row = store.get_clip(alert_id)
+    if row is None or not os.path.exists(row["path"]):
+        return JSONResponse(content={"error": "No clip found"}, status_code=404)
+    return immutable_file(request, row["path"], f'"{row["sha256"]}"', row["uploaded_at"], "video/x-msvideo")
+
+
+@app.get("/clips/{alert_id}.mjpg")
+async def clip_stream(alert_id: str):
+    """Replay a clip as an MJPEG stream at its recorded frame rate, for browsers and the app's image view."""
+    row = store.get_clip(alert_id)
+    if row is None or not os.path.exists(row["path"]):
+        return JSONResponse(content={"error": "No clip found"}, status_code=404)
+
+    def load():
+        with open(row["path"], "rb") as f:
+            return read_clip(f.read())
+
+    fps, frames = await run_in_threadpool(load)
+
+    async def replay():
+        for jpeg in frames:
+            yield (b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: "
+                   + str(len(jpeg)).encode() + b"\r\n\r\n" + jpeg + b"\r\n")
+            await asyncio.sleep(1.0 / (fps or 5))
+
+    return StreamingResponse(replay(), media_type="multipart/x-mixed-replace; boundary=frame",
+                             headers={"Cache-Control": "no-cache"})
+
+
+class AlertEvent(BaseModel):
+    state: str
+    animal: Optional[str] = None
+    confidence: Optional[float] = None
+    camera_id: Optional[str] = None
+    channel: Optional[str] = None
+    time: Optional[float] = None
+
+
+@app.post("/alerts/{alert_id}", dependencies=[Depends(require_api_key)])
+async def alert_event(alert_id: str, event: AlertEvent):
+    """State change of an alert, reported by the Raspberry Pi and pushed to /events subscribers."""
+    data = dict(event.model_dump(), alert_id=alert_id)
+    data["time"] = iso(data["time"] or time.time())
+    return {"status": "success", "event_id": hub.publish("alert", data)}
+
+
+@app.get("/events")
+async def events(
+    request: Request,
+    types: Optional[str] = Query(None, description="comma separated: image, alert, clip (default all)"),
+    last_event_id: Optional[int] = Query(None, description="for clients that cannot send Last-Event-ID"),
+):
+    """
+    Server-Sent Events: `image` when an upload is stored, `alert` when an
+    alert changes state, `clip` when an alert's clip arrives. Reconnecting
+    with Last-Event-ID replays missed events.
+    """
+    wanted = set(types.split(",")) if types else None
+    if wanted and not wanted <= set(EVENT_TYPES):
+        raise HTTPException(status_code=400, detail=f"Unknown event type in {types}")
+    header = request.headers.get("last-event-id")
+    if header is not None and header.isdigit():
+        last_event_id = int(header)
+
+    sub = hub.subscribe(wanted, last_event_id)
+    if sub is None:
+        return JSONResponse(content={"error": "Too many subscribers"}, status_code=503,
+                            headers={"Retry-After": "30"})
+    return StreamingResponse(
+        hub.stream(sub),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/history")
+def history(
+    limit: int = Query(20, ge=1, le=HISTORY_MAX_LIMIT),
+    before: Optional[int] = Query(None, description="id cursor from the previous page's next_before"),
+    since: Optional[str] = Query(None, description="epoch seconds or ISO 8601"),
+    camera_id: Optional[str] = None,
+    animal: Optional[str] = None,
+):
+    """Uploaded images, newest first, paginated with an id cursor."""
+    rows = store.history(limit + 1, before, parse_since(since), camera_id, animal)
+    page = rows[:limit]
+    return {
+        "items": [describe(row) for row in page],
+        "next_before": page[-1]["id"] if len(rows) > limit else None,
+    }
+
+
+@app.get("/images/{image_id}.jpg")
+def image(image_id: int, request: Request):
+    row = store.get(image_id)
+    if row is None or not os.path.exists(row["path"]):
+        return JSONResponse(content={"error": "No image found"}, status_code=404)
+    return immutable_file(request, row["path"], f'"{row["sha256"]}"', row["uploaded_at"])
+
+
+@app.get("/images/{image_id}/thumb.jpg")
+def thumbnail(image_id: int, request: Request):
+    row = store.get(image_id)
+    if row is None:
+        return JSONResponse(content={"error": "No image found"}, status_code=404)
+    path = row["thumb_path"]
+    if not path or not os.path.exists(path):
+        # not generated yet (or lost): build it now rather than failing
+        path = store.make_thumbnail(image_id)
+    return immutable_file(request, path, f'"{row["sha256"]}-thumb"', row["uploaded_at"])
 
 
 # ---------------- Run (for Render deployment) ---------------- #
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))  # Render assigns dynamic port
-    uvicorn.run("fastapi_server:app", host="0.0.0.0", port=port)
\ No newline at end of file
+    uvicorn.run("fastapi_server:app", host="0.0.0.0", port=port)
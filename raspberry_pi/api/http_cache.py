@@ -0,0 +1,84 @@
+# http_cache.py
+"""
+Conditional GET (ETag / Last-Modified -> 304) and byte ranges for in-memory images.
+
+Shared by the cloud API and the Pi's LAN viewer (image_server imports it as
+api.http_cache), so it only depends on Starlette and the standard library.
+"""
+from email.utils import formatdate, parsedate_to_datetime
+
+from starlette.responses import Response
+
+LATEST_CACHE_CONTROL = "public, no-cache"  # may be stored, but revalidated every time
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"  # content-addressed files never change
+
+
+def http_date(t):
+    return formatdate(t, usegmt=True)
+
+
+def _etag_matches(header, etag):
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison: W/"x" matches "x"
+    tags = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return etag in tags
+
+
+def not_modified(request, etag, last_modified):
+    """True when the client's cached copy is current (RFC 9110: If-None-Match wins over If-Modified-Since)."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _parse_range(header, size):
+    """(start, end) of a single 'bytes=' range, end exclusive; None to send everything; False if unsatisfiable."""
+    units, _, spec = header.partition("=")
+    if units.strip() != "bytes" or "," in spec:
+        return None  # multiple ranges are allowed to be answered with the whole image
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            length = int(last)
+            return (max(0, size - length), size) if length > 0 else False
+        start = int(first)
+        end = int(last) + 1 if last else size
+    except ValueError:
+        return None
+    if start >= size or end <= start:
+        return False
+    return start, min(end, size)
+
+
+def cached_response(request, data, etag, last_modified=None, cache_control=LATEST_CACHE_CONTROL,
+                    media_type="image/jpeg"):
+    """
+    Response for image bytes held in memory: 304 when the client is up to
+    date, 206 for a satisfiable Range (honouring If-Range), else 200.
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    if not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range in (etag, headers.get("Last-Modified"))):
+        byte_range = _parse_range(range_header, len(data))
+        if byte_range is False:
+            headers["Content-Range"] = f"bytes */{len(data)}"
+            return Response(status_code=416, headers=headers)
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{len(data)}"
+            return Response(data[start:end], status_code=206, headers=headers, media_type=media_type)
+    return Response(data, headers=headers, media_type=media_type)
@@ -0,0 +1,333 @@
+# image_store.py
+import hashlib
+import io
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from PIL import Image
+
+from avi import JPEG_SOI, read_avi
+
+THUMB_SIZE = (320, 240)
+CHUNK_SIZE = 64 * 1024
+RIFF = b"RIFF"
+TMP_MAX_AGE = 3600           # leftover temp files older than this are removed at startup
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sha256 TEXT NOT NULL,
+    path TEXT NOT NULL,
+    thumb_path TEXT,
+    size INTEGER NOT NULL,
+    camera_id TEXT,
+    animal TEXT,
+    confidence REAL,
+    alert_id TEXT,
+    captured_at REAL NOT NULL,
+    uploaded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_captured ON images (captured_at);
+CREATE INDEX IF NOT EXISTS images_sha ON images (sha256);
+CREATE TABLE IF NOT EXISTS clips (
+    alert_id TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    frames INTEGER NOT NULL,
+    fps REAL NOT NULL,
+    camera_id TEXT,
+    animal TEXT,
+    captured_at REAL NOT NULL,
+    uploaded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS clips_captured ON clips (captured_at);
+"""
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+class InvalidClip(InvalidImage):
+    pass
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def check_jpeg_header(path):
+    """Parse the JPEG headers (markers up to the frame header) without decoding pixels."""
+    try:
+        with Image.open(path) as img:
+            if img.format != "JPEG" or not img.size[0] or not img.size[1]:
+                raise InvalidImage(f"not a JPEG image ({img.format})")
+            return img.size
+    except InvalidImage:
+        raise
+    except Exception as e:
+        raise InvalidImage(f"bad JPEG header: {e}")
+
+
+def read_clip(data):
+    """(fps, [JPEG bytes]) of an MJPEG AVI clip as recorded by the Pi; InvalidClip otherwise."""
+    try:
+        fps, frames = read_avi(data)
+    except ValueError:
+        raise InvalidClip("not an AVI clip")
+    if not frames:
+        raise InvalidClip("AVI clip without MJPEG frames")
+    return fps, frames
+
+
+class ImageStore:
+    """
+    Content-addressed image files plus an SQLite index of their metadata.
+
+    Files live at images/<sha[:2]>/<sha>.jpg, so the same picture uploaded
+    twice is stored once and two uploads racing never overwrite each other.
+    Alert clips (MJPEG AVI) are stored the same way under clips/, one per alert ID.
+    The newest row and, once read, its bytes are cached in memory, so hot
+    /latest.jpg requests never touch the disk; a new upload invalidates them.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.image_dir = os.path.join(root, "images")
+        self.thumb_dir = os.path.join(root, "thumbs")
+        self.clip_dir = os.path.join(root, "clips")
+        self.tmp_dir = os.path.join(root, "tmp")
+        for directory in (self.image_dir, self.thumb_dir, self.clip_dir, self.tmp_dir):
+            os.makedirs(directory, exist_ok=True)
+        self._clean_tmp()
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, "index.sqlite3"), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self.latest = self._query("SELECT * FROM images ORDER BY id DESC LIMIT 1")
+        self.latest = self.latest[0] if self.latest else None
+        self._latest_data = None  # (image id, bytes)
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, args).fetchall()]
+
+    def path_for(self, sha):
+        return os.path.join(self.image_dir, sha[:2], sha + ".jpg")
+
+    def thumb_path_for(self, sha):
+        return os.path.join(self.thumb_dir, sha[:2], sha + ".jpg")
+
+    def clip_path_for(self, sha):
+        return os.path.join(self.clip_dir, sha[:2], sha + ".avi")
+
+    def _clean_tmp(self):
+        cutoff = time.time() - TMP_MAX_AGE
+        for name in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    # ---------------- Writes ---------------- #
+    def add(self, data, camera_id=None, animal=None, confidence=None, alert_id=None, captured_at=None):
+        """Store JPEG bytes and index them. Returns the new row."""
+        return self.ingest(io.BytesIO(data), None, camera_id, animal, confidence, alert_id, captured_at)
+
+    def ingest(self, src, max_bytes=None, camera_id=None, animal=None, confidence=None, alert_id=None,
+               captured_at=None):
+        """
+        Copy a JPEG from file object `src` in chunks to a temp file, hashing
+        as it goes, then rename it into place and index it. Blocking: the
+        server calls it from a worker thread. Raises InvalidImage when the
+        data is not a JPEG and ImageTooLarge past `max_bytes`.
+        """
+        sha, path, size = self._receive(src, max_bytes, JPEG_SOI, InvalidImage("not a JPEG file"),
+                                        check_jpeg_header, self.path_for)
+        return self.index(sha, path, size, camera_id, animal, confidence, alert_id, captured_at)
+
+    def ingest_clip(self, src, alert_id, max_bytes=None, camera_id=None, animal=None, captured_at=None):
+        """Like ingest(), for the MJPEG AVI clip of an alert; a second upload for the alert replaces it."""
+        clip = {}
+
+        def check(path):
+            with open(path, "rb") as f:
+                clip["fps"], frames = read_clip(f.read())
+            clip["frames"] = len(frames)
+
+        sha, path, size = self._receive(src, max_bytes, RIFF, InvalidClip("not an AVI clip"), check,
+                                        self.clip_path_for)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO clips (alert_id, sha256, path, size, frames, fps, camera_id, animal, "
+                "captured_at, uploaded_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (alert_id, sha, path, size, clip["frames"], clip["fps"], camera_id, animal, captured_at or now, now))
+            self._conn.commit()
+        return self.get_clip(alert_id)
+
+    def _receive(self, src, max_bytes, magic, invalid, check, path_for):
+        """
+        Copy file object `src` in chunks to a temp file, hashing as it goes,
+        raise `invalid` unless it starts with `magic`, check(temp path) it, then
+        rename it to its content address. Returns (sha, path, size).
+        """
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.tmp_dir)
+        try:
+            sha, size = hashlib.sha256(), 0
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = src.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if size == 0 and not chunk.startswith(magic):
+                        raise invalid
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise ImageTooLarge(f"upload larger than {max_bytes} bytes")
+                    sha.update(chunk)
+                    out.write(chunk)
+            if size == 0:
+                raise InvalidImage("empty file")
+            check(tmp)
+
+            sha = sha.hexdigest()
+            path = path_for(sha)
+            if os.path.exists(path):
+                os.utime(path)  # keeps a concurrent prune() from treating it as unreferenced
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return sha, path, size
+
+    def index(self, sha, path, size, camera_id=None, animal=None, confidence=None, alert_id=None, captured_at=None):
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO images (sha256, path, size, camera_id, animal, confidence, alert_id, captured_at, uploaded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (sha, path, size, camera_id, animal, confidence, alert_id, captured_at or now, now))
+            self._conn.commit()
+            row = dict(self._conn.execute("SELECT * FROM images WHERE id=?", (cur.lastrowid,)).fetchone())
+        self.latest = row
+        self._latest_data = None
+        return row
+
+    def make_thumbnail(self, image_id):
+        """Background task: write the thumbnail of an indexed image."""
+        rows = self._query("SELECT * FROM images WHERE id=?", (image_id,))
+        if not rows:
+            return None
+        row = rows[0]
+        thumb = self.thumb_path_for(row["sha256"])
+        if not os.path.exists(thumb):
+            os.makedirs(os.path.dirname(thumb), exist_ok=True)
+            with Image.open(row["path"]) as img:
+                img.draft("RGB", THUMB_SIZE)  # let the JPEG decoder downscale while decoding
+                img = img.convert("RGB")
+                img.thumbnail(THUMB_SIZE)
+                tmp = thumb + ".tmp"
+                img.save(tmp, "JPEG", quality=80)
+            os.replace(tmp, thumb)
+        with self._lock:
+            self._conn.execute("UPDATE images SET thumb_path=? WHERE sha256=?", (thumb, row["sha256"]))
+            self._conn.commit()
+        if self.latest and self.latest["sha256"] == row["sha256"]:
+            self.latest = dict(self.latest, thumb_path=thumb)
+        return thumb
+
+    # ---------------- Reads ---------------- #
+    def latest_image(self):
+        """(row, bytes) of the newest image, read from disk once per upload."""
+        row, cached = self.latest, self._latest_data
+        if row is None:
+            return None, None
+        if cached is None or cached[0] != row["id"]:
+            with open(row["path"], "rb") as f:
+                cached = (row["id"], f.read())
+            self._latest_data = cached
+        return row, cached[1]
+
+    def get(self, image_id):
+        rows = self._query("SELECT * FROM images WHERE id=?", (image_id,))
+        return rows[0] if rows else None
+
+    def get_clip(self, alert_id):
+        rows = self._query("SELECT * FROM clips WHERE alert_id=?", (alert_id,))
+        return rows[0] if rows else None
+
+    def history(self, limit=20, before=None, since=None, camera_id=None, animal=None):
+        """Newest first; `before` is the id cursor of the previous page, `since` an epoch time."""
+        where, args = [], []
+        if before is not None:
+            where.append("images.id < ?")
+            args.append(before)
+        if since is not None:
+            where.append("images.captured_at >= ?")
+            args.append(since)
+        if camera_id:
+            where.append("images.camera_id = ?")
+            args.append(camera_id)
+        if animal:
+            where.append("images.animal = ?")
+            args.append(animal)
+        sql = ("SELECT images.*, clips.alert_id IS NOT NULL AS has_clip FROM images "
+               "LEFT JOIN clips ON clips.alert_id = images.alert_id")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY images.id DESC LIMIT ?"
+        return self._query(sql, args + [limit])
+
+    # ---------------- Retention ---------------- #
+    def prune(self, max_age=None, max_images=None):
+        """Drop index rows older than max_age seconds / beyond max_images, then unreferenced files."""
+        with self._lock:
+            removed = 0
+            if max_age is not None:
+                removed += self._conn.execute(
+                    "DELETE FROM images WHERE captured_at < ? AND id != (SELECT MAX(id) FROM images)",
+                    (time.time() - max_age,)).rowcount
+            if max_images is not None:
+                removed += self._conn.execute(
+                    "DELETE FROM images WHERE id NOT IN (SELECT id FROM images ORDER BY id DESC LIMIT ?)",
+                    (max(1, max_images),)).rowcount
+            if max_age is not None:
+                removed += self._conn.execute(
+                    "DELETE FROM clips WHERE captured_at < ?", (time.time() - max_age,)).rowcount
+            # a clip goes with the last image of its alert
+            removed += self._conn.execute(
+                "DELETE FROM clips WHERE alert_id NOT IN (SELECT alert_id FROM images WHERE alert_id IS NOT NULL)"
+            ).rowcount
+            self._conn.commit()
+            live = {row[0] for row in self._conn.execute("SELECT DISTINCT sha256 FROM images")}
+            live |= {row[0] for row in self._conn.execute("SELECT DISTINCT sha256 FROM clips")}
+
+        # files younger than a minute may be an upload that is not indexed yet
+        files, fresh = 0, time.time() - 60
+        for directory in (self.image_dir, self.thumb_dir, self.clip_dir):
+            for dirpath, _, filenames in os.walk(directory):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    if name[-4:] not in (".jpg", ".avi") or name[:-4] in live:
+                        continue
+                    try:
+                        if os.path.getmtime(path) < fresh:
+                            os.remove(path)
+                            files += 1
+                    except OSError:
+                        pass
+        return {"rows": removed, "files": files}
+
+    def count(self):
+        return self._query("SELECT COUNT(*) AS n FROM images")[0]["n"]
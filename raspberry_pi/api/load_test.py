@@ -0,0 +1,153 @@
+# load_test.py
+"""
+Upload load test for the FastAPI server (standard library only).
+
+Runs N concurrent clients, each posting JPEG uploads in a loop over its own
+keep-alive connection, and reports requests per second and latency
+percentiles. --slow-clients adds uploads that trickle their body at 2G
+speed the whole time; fast-client latency should not change while they run.
+
+    python load_test.py --url http://127.0.0.1:8000 --clients 50 --duration 30
+    python load_test.py --clients 50 --slow-clients 10 --slow-rate 4000
+"""
+import argparse
+import http.client
+import os
+import statistics
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+
+def make_jpeg(size):
+    """A JPEG of roughly `size` bytes: SOI, a minimal baseline header and random scan data."""
+    header = bytes.fromhex(
+        "ffd8ffe000104a46494600010100000100010000"                     # SOI + APP0 (JFIF)
+        "ffdb004300" + "01" * 64 +                                      # DQT
+        "ffc0000b080010001001011100"                                    # SOF0 16x16, 1 component
+        "ffc4001f0000010501010101010100000000000000000102030405060708090a0b"  # DHT (DC)
+        "ffda0008010100003f00"                                          # SOS
+    )
+    body = os.urandom(max(0, size - len(header) - 2)).replace(b"\xff", b"\x00")
+    return header + body + b"\xff\xd9"
+
+
+def multipart(jpeg, fields):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="latest.jpg"\r\n'
+                 f'Content-Type: image/jpeg\r\n\r\n'.encode())
+    parts.append(jpeg)
+    parts.append(f"\r\n--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+class Client(threading.Thread):
+    def __init__(self, url, name, images, deadline, rate=None, api_key=None):
+        super().__init__(name=name, daemon=True)
+        self.url = urlparse(url)
+        self.api_key = api_key
+        self.images = images
+        self.deadline = deadline
+        self.rate = rate  # bytes per second; None sends the body at once
+        self.latencies = []
+        self.errors = 0
+        self.statuses = {}
+
+    def connect(self):
+        cls = http.client.HTTPSConnection if self.url.scheme == "https" else http.client.HTTPConnection
+        return cls(self.url.hostname, self.url.port, timeout=120)
+
+    def run(self):
+        conn = self.connect()
+        n = 0
+        while time.time() < self.deadline:
+            jpeg = self.images[n % len(self.images)]
+            n += 1
+            body, content_type = multipart(jpeg, {"camera_id": self.name, "animal": "load-test",
+                                                  "confidence": "0.9", "captured_at": str(time.time())})
+            t0 = time.perf_counter()
+            try:
+                conn.putrequest("POST", "/upload")
+                conn.putheader("Content-Type", content_type)
+                conn.putheader("Content-Length", str(len(body)))
+                if self.api_key:
+                    conn.putheader("X-Api-Key", self.api_key)
+                conn.endheaders()
+                if self.rate is None:
+                    conn.send(body)
+                else:
+                    step = max(1, self.rate // 10)
+                    for i in range(0, len(body), step):
+                        conn.send(body[i:i + step])
+                        time.sleep(0.1)
+                response = conn.getresponse()
+                response.read()
+                self.statuses[response.status] = self.statuses.get(response.status, 0) + 1
+                if response.status == 200:
+                    self.latencies.append(time.perf_counter() - t0)
+                else:
+                    self.errors += 1
+            except (OSError, http.client.HTTPException):
+                self.errors += 1
+                conn.close()
+                conn = self.connect()
+        conn.close()
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent upload load test")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--api-key", default=os.environ.get("API_KEY"), help="X-Api-Key (default: $API_KEY)")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--size", type=int, default=60 * 1024, help="JPEG size in bytes")
+    parser.add_argument("--slow-clients", type=int, default=0, help="extra clients uploading at --slow-rate")
+    parser.add_argument("--slow-rate", type=int, default=4000, help="bytes per second of a slow client")
+    args = parser.parse_args()
+
+    # a few distinct images so the server stores some and deduplicates the rest
+    images = [make_jpeg(args.size) for _ in range(8)]
+    deadline = time.time() + args.duration
+    fast = [Client(args.url, f"load-{i}", images, deadline, api_key=args.api_key) for i in range(args.clients)]
+    slow = [Client(args.url, f"slow-{i}", images, deadline, rate=args.slow_rate, api_key=args.api_key)
+            for i in range(args.slow_clients)]
+
+    print(f"{args.clients} clients (+{args.slow_clients} slow) uploading {args.size/1024:.0f} KB "
+          f"JPEGs to {args.url} for {args.duration:.0f}s...")
+    started = time.time()
+    for client in fast + slow:
+        client.start()
+    for client in fast + slow:
+        client.join()
+    elapsed = time.time() - started
+
+    for label, clients in (("fast", fast), ("slow", slow)):
+        if not clients:
+            continue
+        latencies = [l for c in clients for l in c.latencies]
+        errors = sum(c.errors for c in clients)
+        statuses = {}
+        for c in clients:
+            for status, count in c.statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+        print(f"\n{label}: {len(latencies)} uploads, {errors} errors, {len(latencies)/elapsed:.1f} req/s, "
+              f"{len(latencies) * args.size / elapsed / 1024 / 1024:.2f} MB/s  statuses {statuses}")
+        if latencies:
+            print(f"  latency ms: mean {statistics.mean(latencies)*1000:.0f}  "
+                  f"p50 {percentile(latencies, 50)*1000:.0f}  p95 {percentile(latencies, 95)*1000:.0f}  "
+                  f"p99 {percentile(latencies, 99)*1000:.0f}  max {max(latencies)*1000:.0f}")
+
+
+if __name__ == "__main__":
+    main()
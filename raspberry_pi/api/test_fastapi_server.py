@@ -0,0 +1,164 @@
+# test_fastapi_server.py
+import importlib
+import io
+import json
+import struct
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+API_KEY = "test-secret"
+AUTH = {"X-Api-Key": API_KEY}
+
+
+def make_jpeg(color=(0, 128, 0), size=(64, 48)):
+    buf = io.BytesIO()
+    Image.new("RGB", size, color).save(buf, "JPEG")
+    return buf.getvalue()
+
+
+def _chunk(fourcc, data):
+    return struct.pack("<4sI", fourcc, len(data)) + data + b"\0" * (len(data) & 1)
+
+
+def make_avi(jpegs, fps=5.0):
+    """Smallest MJPEG AVI read_clip() accepts: an avih header and a movi list."""
+    avih = struct.pack("<I", int(1e6 / fps)) + b"\0" * 52
+    movi = b"movi" + b"".join(_chunk(b"00dc", jpeg) for jpeg in jpegs)
+    body = b"AVI " + _chunk(b"LIST", b"hdrl" + _chunk(b"avih", avih)) + _chunk(b"LIST", movi)
+    return _chunk(b"RIFF", body)
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """fastapi_server imported fresh in an empty directory, with API_KEY set."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("API_KEY", API_KEY)
+    import fastapi_server
+    return importlib.reload(fastapi_server)
+
+
+@pytest.fixture
+def client(server):
+    with TestClient(server.app) as c:
+        yield c
+
+
+def upload(client, jpeg, headers=AUTH, **fields):
+    return client.post("/upload", files={"file": ("a.jpg", jpeg, "image/jpeg")}, data=fields, headers=headers)
+
+
+def test_prune_is_not_exposed(client):
+    assert client.post("/prune", params={"older_than_days": 0}).status_code in (404, 405)
+
+
+def test_history_pages_and_filters(client):
+    for i, animal in enumerate(("goat", "sheep", "goat")):
+        assert upload(client, make_jpeg((i * 80, 0, 0)), camera_id="cam1", animal=animal).status_code == 200
+
+    page = client.get("/history", params={"limit": 2}).json()
+    assert len(page["items"]) == 2
+    assert page["items"][0]["id"] > page["items"][1]["id"]
+    rest = client.get("/history", params={"limit": 2, "before": page["next_before"]}).json()
+    assert len(rest["items"]) == 1
+    assert rest["next_before"] is None
+
+    goats = client.get("/history", params={"animal": "goat"}).json()["items"]
+    assert [item["animal"] for item in goats] == ["goat", "goat"]
+    assert client.get("/history", params={"since": "not a date"}).status_code == 400
+
+
+def test_image_and_thumbnail_are_immutable(client):
+    image = upload(client, make_jpeg(size=(640, 480))).json()["image"]
+    full = client.get(image["url"])
+    assert full.status_code == 200
+    assert "immutable" in full.headers["cache-control"]
+    assert client.get(image["url"], headers={"If-None-Match": full.headers["etag"]}).status_code == 304
+
+    thumb = client.get(image["thumb_url"])
+    assert thumb.status_code == 200
+    assert Image.open(io.BytesIO(thumb.content)).size[0] < 640
+    assert client.get("/images/999.jpg").status_code == 404
+
+
+def test_rejects_non_jpeg_uploads(client):
+    assert upload(client, b"GIF89a not a jpeg").status_code == 400
+
+
+def test_rejects_oversized_uploads(server, client, monkeypatch):
+    monkeypatch.setattr(server, "MAX_UPLOAD_BYTES", 100)
+    assert upload(client, make_jpeg(size=(256, 256))).status_code == 413
+
+
+def test_upload_then_latest_with_revalidation_and_ranges(client):
+    jpeg = make_jpeg()
+    response = upload(client, jpeg, camera_id="cam1", animal="goat", confidence="0.9", alert_id="a1")
+    assert response.status_code == 200
+    image = response.json()["image"]
+    assert (image["camera_id"], image["animal"], image["alert_id"]) == ("cam1", "goat", "a1")
+
+    latest = client.get("/latest.jpg")
+    assert latest.status_code == 200
+    assert latest.content == jpeg
+    etag = latest.headers["etag"]
+    assert client.get("/latest.jpg", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/latest.jpg", headers={"If-None-Match": f"W/{etag}"}).status_code == 304
+
+    part = client.get("/latest.jpg", headers={"Range": "bytes=0-9"})
+    assert part.status_code == 206
+    assert part.content == jpeg[:10]
+    assert part.headers["content-range"] == f"bytes 0-9/{len(jpeg)}"
+    assert client.get("/latest.jpg", headers={"Range": "bytes=-0"}).status_code == 416
+    stale = client.get("/latest.jpg", headers={"Range": "bytes=0-9", "If-Range": '"old"'})
+    assert stale.status_code == 200
+
+
+def test_writes_need_the_api_key(client):
+    jpeg = make_jpeg()
+    assert upload(client, jpeg, headers={}).status_code == 401
+    assert upload(client, jpeg, headers={"X-Api-Key": "wrong"}).status_code == 401
+    assert client.post("/alerts/a1", json={"state": "PENDING"}).status_code == 401
+    assert client.post("/clips", files={"file": ("a.avi", b"RIFF", "video/x-msvideo")},
+                       data={"alert_id": "a1"}).status_code == 401
+    assert client.get("/latest.jpg").status_code == 404  # nothing was stored
+
+
+def test_writes_are_open_until_a_key_is_configured(server, client, monkeypatch):
+    monkeypatch.setattr(server, "API_KEY", None)
+    assert client.post("/alerts/a1", json={"state": "PENDING"}).status_code == 200
+    assert upload(client, make_jpeg()).status_code == 200
+
+
+def test_alert_events_reach_subscribers(server, client):
+    response = client.post("/alerts/a1", json={"state": "PENDING", "animal": "goat", "time": 0}, headers=AUTH)
+    assert response.status_code == 200
+    event_id = response.json()["event_id"]
+
+    # a client reconnecting with an older Last-Event-ID gets the event replayed
+    sub = server.hub.subscribe({"alert"}, event_id - 1)
+    (replayed_id, event_type, data, _), = sub.queue
+    server.hub.unsubscribe(sub)
+    assert (replayed_id, event_type) == (event_id, "alert")
+    assert json.loads(data)["alert_id"] == "a1"
+
+    assert client.get("/events", params={"types": "image,bogus"}).status_code == 400
+
+
+def test_clip_upload_download_and_history_link(client):
+    jpegs = [make_jpeg((v, v, v)) for v in (0, 100, 200)]
+    upload(client, jpegs[0], alert_id="a1")
+    response = client.post("/clips", files={"file": ("a1.avi", make_avi(jpegs), "video/x-msvideo")},
+                           data={"alert_id": "a1", "camera_id": "cam1"}, headers=AUTH)
+    assert response.status_code == 200
+    assert response.json()["clip"]["frames"] == 3
+
+    clip = client.get("/clips/a1.avi")
+    assert clip.status_code == 200
+    assert clip.headers["content-type"] == "video/x-msvideo"
+    assert client.get("/history").json()["items"][0]["clip_url"] == "/clips/a1.avi"
+    assert client.get("/clips/missing.avi").status_code == 404
+
+    bad = client.post("/clips", files={"file": ("a2.avi", b"RIFF....WAVE", "video/x-msvideo")},
+                      data={"alert_id": "a2"}, headers=AUTH)
+    assert bad.status_code == 400
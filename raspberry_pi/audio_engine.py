@@ -0,0 +1,357 @@
+# audio_engine.py
+import shutil
+import subprocess
+import threading
+import time
+import wave
+
+import numpy as np
+
+try:
+    import sounddevice
+except Exception:  # not installed, or the PortAudio library is missing
+    sounddevice = None
+
+try:
+    import miniaudio  # optional MP3/FLAC/Vorbis decoder without ffmpeg
+except ImportError:
+    miniaudio = None
+
+RATE = 44100
+CHANNELS = 2
+BLOCK = 512              # frames per output block (11.6 ms at 44.1 kHz)
+APLAY_BUFFER_US = 50000  # ALSA buffer of the aplay backend; bounds its start latency
+
+
+# ---------------- Decoding ---------------- #
+class Clip:
+    """A sound decoded once into int16 PCM frames (frames x channels) at the engine rate."""
+
+    def __init__(self, name, pcm, rate=RATE):
+        self.name = name
+        self.pcm = pcm
+        self.rate = rate
+
+    @property
+    def duration(self):
+        return len(self.pcm) / self.rate
+
+
+def _wav_data_offset(path):
+    """Byte offset of the sample data in a RIFF/WAVE file."""
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            raise ValueError(f"not a WAV file: {path}")
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise ValueError(f"no data chunk in {path}")
+            size = int.from_bytes(chunk[4:], "little")
+            if chunk[:4] == b"data":
+                return f.tell()
+            f.seek(size + (size & 1), 1)
+
+
+def _read_wav(path, mmap=False):
+    with wave.open(path, "rb") as w:
+        width, channels, rate, frames = w.getsampwidth(), w.getnchannels(), w.getframerate(), w.getnframes()
+        raw = None if mmap and width == 2 else w.readframes(frames)
+    if raw is None:
+        # 16-bit samples are used straight from the page cache instead of being copied into memory
+        pcm = np.memmap(path, dtype="<i2", mode="r", offset=_wav_data_offset(path), shape=(frames * channels,))
+    elif width == 1:
+        pcm = (np.frombuffer(raw, np.uint8).astype(np.int16) - 128) << 8
+    elif width == 2:
+        pcm = np.frombuffer(raw, "<i2")
+    elif width == 4:
+        pcm = (np.frombuffer(raw, "<i4") >> 16).astype(np.int16)
+    else:
+        raise ValueError(f"unsupported WAV sample width {width} in {path}")
+    return pcm.reshape(-1, channels), rate
+
+
+def _decode_other(path, rate, channels):
+    """MP3/AAC/OGG/...: miniaudio if installed, else ffmpeg (which also reads MP4/AAC)."""
+    if miniaudio is not None:
+        try:
+            decoded = miniaudio.decode_file(path, output_format=miniaudio.SampleFormat.SIGNED16,
+                                            nchannels=channels, sample_rate=rate)
+            return np.frombuffer(decoded.samples, np.int16).reshape(-1, channels), rate
+        except miniaudio.DecodeError:
+            pass  # e.g. AAC in an .mp3 file; try ffmpeg
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError(f"cannot decode {path}: install ffmpeg (or miniaudio for MP3)")
+    raw = subprocess.run([ffmpeg, "-v", "error", "-i", path, "-f", "s16le", "-ac", str(channels),
+                          "-ar", str(rate), "-"], capture_output=True, check=True).stdout
+    return np.frombuffer(raw, "<i2").reshape(-1, channels), rate
+
+
+def convert(pcm, src_rate, rate=RATE, channels=CHANNELS):
+    """Mix/duplicate channels and resample (linear) to the engine format."""
+    pcm = np.asarray(pcm)
+    if pcm.ndim == 1:
+        pcm = pcm[:, None]
+    if pcm.shape[1] != channels:
+        mono = pcm.astype(np.float32).mean(axis=1, keepdims=True)
+        pcm = np.repeat(mono, channels, axis=1)
+    if src_rate != rate and len(pcm):
+        n = int(round(len(pcm) * rate / src_rate))
+        src = np.arange(len(pcm), dtype=np.float32)
+        dst = np.linspace(0, len(pcm) - 1, n, dtype=np.float32)
+        pcm = np.stack([np.interp(dst, src, pcm[:, c].astype(np.float32)) for c in range(channels)], axis=1)
+    if pcm.dtype != np.int16:
+        pcm = np.clip(np.rint(pcm), -32768, 32767).astype(np.int16)
+    return np.ascontiguousarray(pcm)
+
+
+def decode(path, rate=RATE, channels=CHANNELS, mmap=False):
+    """PCM of an audio file in the engine format; `mmap` maps 16-bit WAVs that need no conversion."""
+    if path.lower().endswith(".wav"):
+        pcm, src_rate = _read_wav(path, mmap)
+    else:
+        pcm, src_rate = _decode_other(path, rate, channels)
+    return convert(pcm, src_rate, rate, channels)
+
+
+# ---------------- Outputs ---------------- #
+class _SoundDeviceOutput:
+    """PortAudio stream; the engine fills each block from the audio callback."""
+
+    def __init__(self, engine):
+        self.stream = sounddevice.OutputStream(
+            samplerate=engine.rate, channels=engine.channels, dtype="int16",
+            blocksize=engine.block, latency="low", callback=self._callback)
+        self.engine = engine
+        self.latency = self.stream.latency
+        self.stream.start()
+
+    def _callback(self, outdata, frames, time_info, status):
+        self.engine._fill(outdata)
+
+    def close(self):
+        self.stream.stop()
+        self.stream.close()
+
+
+class _PipeOutput:
+    """
+    Writes blocks to a long-lived sink in a thread, paced by the sink itself
+    (aplay's blocking pipe) or by the clock when there is no sink (null).
+    """
+
+    def __init__(self, engine, command=None):
+        self.engine = engine
+        self.process = None
+        self.latency = engine.block / engine.rate
+        if command is not None:
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            try:
+                import fcntl
+                fcntl.fcntl(self.process.stdin, 1031, 4096)  # F_SETPIPE_SZ: keep the pipe from queueing audio
+            except (ImportError, OSError):
+                pass
+            self.latency += APLAY_BUFFER_US / 1e6
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="audio-output", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        buffer = np.zeros((self.engine.block, self.engine.channels), np.int16)
+        period = self.engine.block / self.engine.rate
+        next_time = time.monotonic()
+        while self._running:
+            self.engine._fill(buffer)
+            if self.process is not None:
+                try:
+                    self.process.stdin.write(buffer.tobytes())
+                except (BrokenPipeError, ValueError):
+                    print(" Audio output closed (aplay exited).")
+                    self.engine._output_failed()
+                    return
+            else:
+                next_time += period
+                time.sleep(max(0.0, next_time - time.monotonic()))
+
+    def close(self):
+        self._running = False
+        self._thread.join(timeout=1)
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+            self.process.terminate()
+
+
+def _aplay_command(rate, channels):
+    aplay = shutil.which("aplay")
+    if aplay is None:
+        return None
+    return [aplay, "-q", "-t", "raw", "-f", "S16_LE", "-r", str(rate), "-c", str(channels),
+            f"--buffer-time={APLAY_BUFFER_US}"]
+
+
+# ---------------- Engine ---------------- #
+class _Voice:
+    def __init__(self, clip, loop, duration, priority):
+        self.clip = clip
+        self.loop = loop
+        self.priority = priority
+        self.pos = 0
+        if duration is not None:
+            self.remaining = int(duration * clip.rate)
+        else:
+            self.remaining = float("inf") if loop else len(clip.pcm)
+        self.requested = time.perf_counter()
+        self.started = None
+
+
+class AudioEngine:
+    """
+    One long-lived audio output with clips preloaded as PCM.
+
+    play() only swaps the voice the output reads from, so it returns at
+    once and the sound starts with the next block (plus the device buffer):
+    milliseconds instead of the time it takes to spawn `aplay`. A new
+    sound preempts the current one unless that one has a higher priority
+    (or preempt=False), in which case it is queued. Clips can loop, for a
+    fixed `duration` or until stop().
+
+    Outputs, in order of preference: a sounddevice (PortAudio) callback
+    stream, a single persistent `aplay` process fed raw PCM, or "null"
+    (discards audio in real time; headless tests).
+    """
+
+    def __init__(self, rate=RATE, channels=CHANNELS, block=BLOCK):
+        self.rate = rate
+        self.channels = channels
+        self.block = block
+        self.clips = {}
+        self.output = None
+        self.backend = None
+        self._current = None
+        self._queue = []
+        self._lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+        self.last_latency = None
+        self.counts = {"played": 0, "preempted": 0, "stopped": 0}
+
+    # ---------------- Clips ---------------- #
+    def load(self, name, path, mmap=False):
+        clip = Clip(name, decode(path, self.rate, self.channels, mmap), self.rate)
+        self.clips[name] = clip
+        return clip
+
+    def add(self, name, pcm, rate=None):
+        clip = Clip(name, convert(pcm, rate or self.rate, self.rate, self.channels), self.rate)
+        self.clips[name] = clip
+        return clip
+
+    # ---------------- Output ---------------- #
+    def start(self, backend="auto"):
+        """Open the output; returns the backend name, or None when there is no audio device."""
+        if backend in ("auto", "sounddevice") and sounddevice is not None:
+            try:
+                self.output = _SoundDeviceOutput(self)
+                self.backend = "sounddevice"
+            except Exception as e:
+                print(" sounddevice output unavailable:", e)
+        if self.output is None and backend in ("auto", "aplay"):
+            command = _aplay_command(self.rate, self.channels)
+            if command is not None:
+                self.output = _PipeOutput(self, command)
+                self.backend = "aplay"
+        if self.output is None and backend == "null":
+            self.output = _PipeOutput(self)
+            self.backend = "null"
+        return self.backend
+
+    def _output_failed(self):
+        self.output = None
+        self.backend = None
+        self.stop()
+
+    def close(self):
+        self.stop()
+        if self.output is not None:
+            self.output.close()
+            self.output = None
+
+    # ---------------- Commands ---------------- #
+    def play(self, name, loop=False, duration=None, priority=0, preempt=True):
+        """Start clip `name` (non-blocking). Returns False if it is unknown or there is no output."""
+        clip = self.clips.get(name)
+        if clip is None or self.output is None:
+            return False
+        voice = _Voice(clip, loop, duration, priority)
+        with self._lock:
+            current = self._current
+            if current is None:
+                self._current = voice
+            elif preempt and priority >= current.priority:
+                self._current = voice
+                self.counts["preempted"] += 1
+            else:
+                self._queue.append(voice)
+            self._idle.clear()
+        return True
+
+    def stop(self):
+        """Silence the current sound and drop the queued ones."""
+        with self._lock:
+            if self._current is not None:
+                self.counts["stopped"] += 1
+            self._current = None
+            self._queue.clear()
+            self._idle.set()
+
+    def wait(self, timeout=None):
+        """Block until nothing is playing (looping clips without a duration never end)."""
+        return self._idle.wait(timeout)
+
+    @property
+    def playing(self):
+        voice = self._current
+        return voice.clip.name if voice is not None else None
+
+    # ---------------- Mixing ---------------- #
+    def _fill(self, out):
+        """Called by the output for every block: copy the next frames of the current voice, pad with silence."""
+        frames, filled = len(out), 0
+        with self._lock:
+            while filled < frames and self._current is not None:
+                voice = self._current
+                if voice.started is None:
+                    voice.started = time.perf_counter()
+                    self.last_latency = voice.started - voice.requested
+                    self.counts["played"] += 1
+                pcm = voice.clip.pcm
+                n = int(min(frames - filled, len(pcm) - voice.pos, voice.remaining))
+                out[filled:filled + n] = pcm[voice.pos:voice.pos + n]
+                filled += n
+                voice.pos += n
+                voice.remaining -= n
+                if voice.pos >= len(pcm) and voice.loop:
+                    voice.pos = 0
+                if voice.remaining <= 0 or voice.pos >= len(pcm):
+                    self._current = self._queue.pop(0) if self._queue else None
+                    if self._current is None:
+                        self._idle.set()
+                    else:
+                        self._current.requested = time.perf_counter()  # start latency excludes the wait
+        out[filled:] = 0
+
+    def stats(self):
+        output_latency = self.output.latency if self.output is not None else None
+        return dict(
+            self.counts,
+            backend=self.backend,
+            clips=len(self.clips),
+            playing=self.playing,
+            queued=len(self._queue),
+            last_start_latency_ms=round(self.last_latency * 1000, 2) if self.last_latency is not None else None,
+            output_latency_ms=round(output_latency * 1000, 1) if output_latency is not None else None,
+        )
@@ -0,0 +1,299 @@
+# benchmark.py
+"""
+Replay recorded footage through the detection pipeline and report latency,
+throughput and memory as JSON.
+
+    python3 benchmark.py --source field.mp4 --output results/base.json
+    python3 benchmark.py --source frames/ --fps 10 --motion-threshold 1500 --input-size 416
+
+Camera, Firestore and the GSM modem (a pty) are replaced by the fakes in fakes.py,
+so no hardware or network is needed and no alarm is played.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import main as farmguard
+from fakes import ReplayCamera, FakeFirestore, FakeModem
+from pipeline import Pipeline, BLOCK, DROP_NEWEST
+
+
+# ---------------- Stats ---------------- #
+class LatencyRecorder:
+    """Collects durations per stage name (seconds) from several threads."""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def add_all(self, timings):
+        for stage, seconds in timings.items():
+            self.add(stage, seconds)
+
+    def summary(self):
+        out = {}
+        with self._lock:
+            for stage, values in sorted(self.samples.items()):
+                ms = np.asarray(values) * 1000.0
+                p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+                out[stage] = {
+                    "count": len(values),
+                    "mean_ms": round(float(ms.mean()), 3),
+                    "p50_ms": round(float(p50), 3),
+                    "p95_ms": round(float(p95), 3),
+                    "p99_ms": round(float(p99), 3),
+                    "max_ms": round(float(ms.max()), 3),
+                }
+        return out
+
+
+def peak_rss_mb():
+    # ru_maxrss is kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if platform.system() == "Darwin" else 1024), 1)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=farmguard.BASE_DIR, stderr=subprocess.DEVNULL, universal_newlines=True
+        ).strip()
+    except Exception:
+        return None
+
+
+# ---------------- Fake Environment ---------------- #
+def install_fakes(args, workdir):
+    """Point main.py at the fake Firestore / GSM modem and a scratch capture path."""
+    if args.alert_mode == "firestore":
+        farmguard.db = FakeFirestore(auto_response="NOT_PLAY", response_delay=args.response_delay)
+    else:
+        farmguard.db = None
+        farmguard.firebase_client = lambda: None  # never reach a real Firestore from the outbox
+        farmguard.gsm = None
+        farmguard.GSM_SERIAL_PORT = FakeModem(reply="0", reply_delay=args.response_delay).start().port
+
+    farmguard.CAPTURE_PATH = os.path.join(workdir, "latest.jpg")
+    farmguard.ALERT_STATE_PATH = os.path.join(workdir, "alerts.json")
+    farmguard.ALERT_IMAGE_DIR = os.path.join(workdir, "images")
+    farmguard.OUTBOX_PATH = os.path.join(workdir, "outbox.sqlite3")
+    farmguard.upload_image = lambda jpeg, **fields: None
+    farmguard.REPORT_ALERT_EVENTS = False
+    farmguard.alert_dispatcher = None
+    farmguard.outbox = None
+    farmguard.init_outbox()
+
+
+# ---------------- Benchmark ---------------- #
+def run_benchmark(args):
+    farmguard.MOTION_THRESHOLD = args.motion_threshold
+    farmguard.MOTION_OFF_THRESHOLD = args.motion_off_threshold
+    farmguard.MOTION_ALGORITHM = args.motion_algorithm
+    farmguard.MOTION_SCALE = args.motion_scale
+    farmguard.MOTION_IDLE_STRIDE = args.idle_stride
+    farmguard.DETECTION_BASE_INTERVAL = args.base_interval
+    farmguard.DETECTION_MIN_INTERVAL = args.min_interval
+    farmguard.DETECTION_MAX_INTERVAL = args.max_interval
+    input_size = (args.input_size, args.input_size)
+    farmguard.INPUT_SIZE = input_size
+    farmguard.load_model(args.model, args.labels, args.threads, input_size)
+    farmguard.load_cascade_model(args.cascade_model, args.cascade_labels, args.threads)
+
+    workdir = tempfile.mkdtemp(prefix="farmguard_bench_")
+    install_fakes(args, workdir)
+
+    camera = ReplayCamera(args.source, fps=args.fps, loops=args.loops)
+    processor = farmguard.FrameProcessor()
+    if args.no_thermal:
+        processor.scheduler.thermal_path = None
+    latencies = LatencyRecorder()
+    counters = {"frames": 0, "skipped_frames": 0, "motion_frames": 0, "inference_frames": 0, "cascade_frames": 0,
+                "detections": 0, "alerts": 0}
+    first_motion_frame = None
+    detections_by_class = {}
+
+    pipeline = Pipeline()
+    # replay must not lose frames, so capture waits for detection instead of dropping
+    frame_queue = pipeline.add_queue("frames", farmguard.FRAME_QUEUE_SIZE, BLOCK)
+    alert_queue = pipeline.add_queue("alerts", farmguard.ALERT_QUEUE_SIZE, DROP_NEWEST)
+    capture_done = threading.Event()
+
+    def capture_step():
+        ret, frame = camera.read()
+        if not ret:
+            capture_done.set()
+            return False
+        latencies.add("capture", camera.read_time)
+        frame_queue.put((camera.timestamp, time.perf_counter(), frame))
+
+    def detection_step():
+        nonlocal first_motion_frame
+        item = frame_queue.get(timeout=0.1)
+        if item is None:
+            if capture_done.is_set():
+                return False
+            return
+        timestamp, captured_at, frame = item
+
+        t0 = time.perf_counter()
+        alerts = processor.process(frame, timestamp)
+        latencies.add("frame_total", time.perf_counter() - t0)
+        latencies.add_all(processor.last_timings)
+
+        counters["frames"] += 1
+        if processor.motion.skipped:
+            counters["skipped_frames"] += 1
+        if processor.motion.motion:
+            counters["motion_frames"] += 1
+            if first_motion_frame is None:
+                first_motion_frame = counters["frames"] - 1
+        if "detect" in processor.last_timings:
+            counters["inference_frames"] += 1
+            if "cascade" in processor.last_timings:
+                counters["cascade_frames"] += 1
+            for det in processor.last_detections:
+                label = farmguard.label_for(det["class_id"])
+                detections_by_class[label] = detections_by_class.get(label, 0) + 1
+                counters["detections"] += 1
+
+        for alert in alerts:
+            alert["captured_at"] = captured_at
+            alert["capture_age"] = time.perf_counter() - captured_at  # frame times are replay-relative
+            alert_queue.put(alert)
+
+    def alert_step():
+        alert = alert_queue.get(timeout=0.1)
+        if alert is None:
+            return
+        t0 = time.perf_counter()
+        farmguard.handle_alert(alert)
+        latencies.add("alert_dispatch", time.perf_counter() - t0)
+        latencies.add("alert_end_to_end", time.perf_counter() - alert["captured_at"])
+        counters["alerts"] += 1
+
+    pipeline.add_stage("bench-capture", capture_step)
+    detection_stage = pipeline.add_stage("bench-detection", detection_step)
+    pipeline.add_stage("bench-alerts", alert_step)
+
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    pipeline.start()
+    detection_stage.join()
+    processing_time = time.perf_counter() - started
+    cpu_time = time.process_time() - cpu_started
+
+    # let queued and in-flight alerts finish before stopping the dispatcher
+    dispatcher = farmguard.init_alert_dispatcher()
+    while ((alert_queue.qsize() or dispatcher.pending())
+           and time.perf_counter() - started < processing_time + args.alert_timeout):
+        time.sleep(0.1)
+    time.sleep(0.2)
+    pipeline.stop(timeout=args.alert_timeout)
+    dispatcher.stop(wait=False)
+    farmguard.sync_worker.stop()
+    camera.release()
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "python": sys.version.split()[0],
+        "config": {
+            "source": args.source,
+            "model": args.model,
+            "labels": args.labels,
+            "cascade_model": args.cascade_model if farmguard.cascade else None,
+            "threads": args.threads,
+            "input_size": list(input_size),
+            "motion_threshold": [args.motion_off_threshold, args.motion_threshold],
+            "motion_algorithm": args.motion_algorithm,
+            "motion_scale": args.motion_scale,
+            "idle_stride": args.idle_stride,
+            "detection_interval_s": [args.min_interval, args.base_interval, args.max_interval],
+            "alert_mode": args.alert_mode,
+            "replay_fps": camera.fps,
+        },
+        "counts": dict(counters, detections_by_class=detections_by_class, first_motion_frame=first_motion_frame),
+        "throughput_fps": round(counters["frames"] / processing_time, 2) if processing_time else 0.0,
+        "wall_time_s": round(processing_time, 3),
+        # whole process (capture, decoding included); compare runs on the same source
+        "cpu_time_s": round(cpu_time, 3),
+        "cpu_ms_per_frame": round(cpu_time * 1000 / counters["frames"], 3) if counters["frames"] else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "latency": latencies.summary(),
+        "queues": pipeline.stats(),
+        "models": farmguard.model_registry.stats(),
+        "motion": processor.motion.stats(),
+        "scheduler": processor.scheduler.stats(),
+        "tracker": processor.tracker.stats(),
+        "alerts": dispatcher.stats(),
+        "outbox": farmguard.sync_worker.stats(),
+        "firestore": {"reads": farmguard.db.reads, "writes": farmguard.db.writes} if farmguard.db else None,
+        "gsm": farmguard.gsm.stats() if farmguard.gsm else None,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay footage through the ChFarmGuard detection pipeline.")
+    parser.add_argument("--source", required=True, help="video file or directory of JPEG frames")
+    parser.add_argument("--output", help="write the JSON report here (default: stdout only)")
+    parser.add_argument("--fps", type=float, help="replay clock for image directories / override video FPS")
+    parser.add_argument("--loops", type=int, default=1, help="replay the source this many times")
+    parser.add_argument("--model", default=farmguard.MODEL_PATH)
+    parser.add_argument("--labels", default=farmguard.LABELS_PATH)
+    parser.add_argument("--cascade-model", default=farmguard.CASCADE_MODEL_PATH,
+                        help="model re-examining uncertain hits ('' to benchmark the screening model alone)")
+    parser.add_argument("--cascade-labels", default=farmguard.CASCADE_LABELS_PATH)
+    parser.add_argument("--threads", type=int, default=farmguard.NUM_THREADS)
+    parser.add_argument("--input-size", type=int, default=farmguard.INPUT_SIZE[0])
+    parser.add_argument("--motion-threshold", type=int, default=farmguard.MOTION_THRESHOLD)
+    parser.add_argument("--motion-off-threshold", type=int, default=farmguard.MOTION_OFF_THRESHOLD,
+                        help="motion ends at or below this many foreground pixels")
+    parser.add_argument("--motion-algorithm", choices=["mog2", "knn", "diff"], default=farmguard.MOTION_ALGORITHM)
+    parser.add_argument("--motion-scale", type=float, default=farmguard.MOTION_SCALE,
+                        help="downscale factor of the motion gate (1 = full resolution)")
+    parser.add_argument("--idle-stride", type=int, default=farmguard.MOTION_IDLE_STRIDE,
+                        help="examine every Nth frame while the scene is quiet")
+    parser.add_argument("--base-interval", type=float, default=farmguard.DETECTION_BASE_INTERVAL,
+                        help="seconds between inferences during motion before adaptation")
+    parser.add_argument("--min-interval", type=float, default=farmguard.DETECTION_MIN_INTERVAL)
+    parser.add_argument("--max-interval", type=float, default=farmguard.DETECTION_MAX_INTERVAL)
+    parser.add_argument("--no-thermal", action="store_true",
+                        help="ignore the host CPU temperature (when not benchmarking on the Pi)")
+    parser.add_argument("--alert-mode", choices=["firestore", "gsm"], default="firestore")
+    parser.add_argument("--response-delay", type=float, default=0.0,
+                        help="seconds before the fake farmer answers an alert")
+    parser.add_argument("--alert-timeout", type=float, default=30.0,
+                        help="how long to wait for outstanding alerts at the end")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_benchmark(args)
+    text = json.dumps(report, indent=2)
+    print(text)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Benchmark report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# cameras.py
+import os
+import platform
+import time
+
+import cv2
+
+from metrics import FRAME_STAGE_SECONDS
+
+FPS_SMOOTHING = 0.1
+RECONNECT_DELAY = 5  # seconds before reopening a failed live stream
+
+
+def is_video_file(source):
+    return isinstance(source, str) and os.path.isfile(source)
+
+
+def open_capture(source, width=None, height=None):
+    """
+    Open a V4L2 device (index or /dev/videoN), an RTSP/HTTP URL or a video file.
+    """
+    if isinstance(source, int) or (isinstance(source, str) and source.startswith("/dev/video")):
+        cap = cv2.VideoCapture(source, cv2.CAP_V4L2) if platform.system() == "Linux" else cv2.VideoCapture(source)
+    elif isinstance(source, str) and "://" in source:
+        cap = cv2.VideoCapture(source, cv2.CAP_FFMPEG)
+        # keep only the newest frame buffered so a slow reader sees live video
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    else:
+        cap = cv2.VideoCapture(source)
+
+    if width and height:
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    return cap
+
+
+class Camera:
+    """
+    One configured camera: its capture handle, frame queue and counters.
+    `config` is an entry of main.CAMERA_SOURCES: {"id", "source", "width", "height"}.
+    `on_frame(timestamp, frame)`, if given, is called for every captured frame
+    from the capture thread, so it must return at once.
+    """
+
+    def __init__(self, config, frame_queue, on_frame=None):
+        self.id = config["id"]
+        self.on_frame = on_frame
+        self.source = config["source"]
+        self.width = config.get("width", 640)
+        self.height = config.get("height", 480)
+        self.frame_queue = frame_queue
+
+        self.cap = open_capture(self.source, self.width, self.height)
+        self.is_file = is_video_file(self.source)
+        # files are paced at their own frame rate so they behave like a live feed
+        file_fps = self.cap.get(cv2.CAP_PROP_FPS) if self.is_file else 0
+        self.frame_period = 1.0 / file_fps if file_fps else 0.0
+
+        self.captured = 0
+        self.processed = 0
+        self.read_errors = 0
+        self.fps = 0.0
+        self._last_frame_time = None
+
+        if not self.cap.isOpened():
+            print(f"[{self.id}] could not open camera source: {self.source}")
+
+    def capture_step(self):
+        """Pipeline step: read one frame into the queue (oldest frame dropped when full)."""
+        t0 = time.perf_counter()
+        ret, frame = self.cap.read()
+        if not ret:
+            self.read_errors += 1
+            if self.is_file:
+                print(f"[{self.id}] end of video.")
+                return False
+            print(f"[{self.id}] camera read error, reconnecting in {RECONNECT_DELAY}s.")
+            self.cap.release()
+            time.sleep(RECONNECT_DELAY)
+            self.cap = open_capture(self.source, self.width, self.height)
+            return
+
+        FRAME_STAGE_SECONDS.observe(time.perf_counter() - t0, self.id, "capture")
+        now = time.time()
+        if self._last_frame_time is not None:
+            dt = now - self._last_frame_time
+            if self.frame_period and dt < self.frame_period:
+                time.sleep(self.frame_period - dt)
+                now = time.time()
+                dt = now - self._last_frame_time
+            if dt > 0:
+                self.fps += FPS_SMOOTHING * (1.0 / dt - self.fps)
+        self._last_frame_time = now
+
+        self.captured += 1
+        self.frame_queue.put((now, frame))
+        if self.on_frame is not None:
+            self.on_frame(now, frame)
+
+    def release(self):
+        self.cap.release()
+
+    def stats(self):
+        return {
+            "fps": round(self.fps, 2),
+            "captured": self.captured,
+            "processed": self.processed,
+            "dropped": self.frame_queue.dropped,
+            "read_errors": self.read_errors,
+        }
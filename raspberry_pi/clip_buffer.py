@@ -0,0 +1,320 @@
+# clip_buffer.py
+import os
+import struct
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from metrics import CLIP_ENCODE_SECONDS, CLIPS
+from pipeline import BoundedQueue, DROP_OLDEST
+
+ENTRY_DTYPE = np.dtype([("time", "f8"), ("offset", "i8"), ("size", "i4"), ("score", "f4"), ("sharpness", "f4")])
+NO_SCORE = -1.0
+
+
+def sharpness(frame):
+    """Variance of the Laplacian of a half-size grayscale copy: higher is sharper."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    gray = cv2.resize(gray, (gray.shape[1] // 2, gray.shape[0] // 2), interpolation=cv2.INTER_AREA)
+    _, std = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_16S))
+    return float(std[0][0] ** 2)
+
+
+# ---------------- Ring Buffer ---------------- #
+class FrameRing:
+    """
+    The last few seconds of one camera as JPEGs, in fixed memory.
+
+    Frames are copied into one preallocated bytearray, written
+    circularly; their time, offset, size, detection score and sharpness
+    go in a preallocated entry table. The oldest frames are overwritten
+    when either runs out, so memory never grows.
+    Not thread-safe: owned by the ClipRecorder thread.
+    """
+
+    def __init__(self, capacity_bytes, max_frames=256):
+        self.buffer = bytearray(capacity_bytes)
+        self.view = memoryview(self.buffer)
+        self.entries = np.zeros(max_frames, ENTRY_DTYPE)
+        self.head = 0    # index of the oldest entry
+        self.count = 0
+        self.pos = 0     # next write offset in the buffer
+        self.written = 0
+        self.evicted = 0
+
+    def _pop_oldest(self):
+        self.head = (self.head + 1) % len(self.entries)
+        self.count -= 1
+        self.evicted += 1
+
+    def append(self, t, jpeg, score=NO_SCORE, sharp=0.0):
+        """Copy JPEG bytes in, evicting the oldest frames they overlap. False if larger than the buffer."""
+        size = len(jpeg)
+        capacity = len(self.buffer)
+        if size > capacity:
+            return False
+        if self.pos + size > capacity:
+            # no room before the end: the frames left there are the oldest ones
+            while self.count and self.entries[self.head]["offset"] >= self.pos:
+                self._pop_oldest()
+            self.pos = 0
+        end = self.pos + size
+        while self.count:
+            oldest = self.entries[self.head]
+            if oldest["offset"] < end and oldest["offset"] + oldest["size"] > self.pos:
+                self._pop_oldest()
+            else:
+                break
+        if self.count == len(self.entries):
+            self._pop_oldest()
+
+        self.view[self.pos:end] = jpeg
+        slot = (self.head + self.count) % len(self.entries)
+        self.entries[slot] = (t, self.pos, size, score, sharp)
+        self.count += 1
+        self.pos = end
+        self.written += 1
+        return True
+
+    def _indices(self):
+        return [(self.head + i) % len(self.entries) for i in range(self.count)]
+
+    def annotate(self, t, score):
+        """Attach a detection score to the frame captured at `t`; False if it is not buffered."""
+        for i in reversed(self._indices()):
+            if self.entries[i]["time"] == t:
+                self.entries[i]["score"] = max(float(self.entries[i]["score"]), score)
+                return True
+        return False
+
+    def latest_time(self):
+        if not self.count:
+            return None
+        return float(self.entries[(self.head + self.count - 1) % len(self.entries)]["time"])
+
+    def window(self, start, end):
+        """Copies of the frames captured in [start, end], oldest first: [(time, jpeg, score, sharpness)]."""
+        frames = []
+        for i in self._indices():
+            entry = self.entries[i]
+            if start <= entry["time"] <= end:
+                offset, size = int(entry["offset"]), int(entry["size"])
+                frames.append((float(entry["time"]), bytes(self.view[offset:offset + size]),
+                               float(entry["score"]), float(entry["sharpness"])))
+        frames.sort(key=lambda f: f[0])
+        return frames
+
+    def stats(self):
+        times = self.entries["time"][self._indices()] if self.count else []
+        return {
+            "frames": self.count,
+            "seconds": round(float(times.max() - times.min()), 1) if self.count else 0.0,
+            "capacity_mb": round(len(self.buffer) / 1e6, 1),
+            "written": self.written,
+            "evicted": self.evicted,
+        }
+
+
+def best_frame(frames, score_margin=0.1):
+    """
+    The frame to show the farmer: among the frames scoring within
+    `score_margin` of the best detection, the sharpest one. Without any
+    scored frame, the sharpest of all.
+    """
+    if not frames:
+        return None
+    scored = [f for f in frames if f[2] > NO_SCORE]
+    if scored:
+        top = max(f[2] for f in scored)
+        frames = [f for f in scored if f[2] >= top - score_margin]
+    return max(frames, key=lambda f: f[3])
+
+
+# ---------------- MJPEG AVI ---------------- #
+def write_avi(path, jpegs, fps, width, height):
+    """Write JPEG frames as-is into an MJPEG AVI (no re-encoding); replaced atomically. See api.avi.read_avi."""
+    fps = max(fps, 0.1)
+    chunks, index, offset = [], [], 4  # idx1 offsets count from the 'movi' fourcc
+    for jpeg in jpegs:
+        pad = len(jpeg) & 1
+        chunks.append(struct.pack("<4sI", b"00dc", len(jpeg)) + jpeg + b"\0" * pad)
+        index.append(struct.pack("<4sIII", b"00dc", 0x10, offset, len(jpeg)))
+        offset += 8 + len(jpeg) + pad
+    largest = max((len(j) for j in jpegs), default=0)
+
+    avih = struct.pack("<14I", int(1e6 / fps), int(largest * fps), 0, 0x10, len(jpegs), 0, 1, largest,
+                       width, height, 0, 0, 0, 0)
+    strh = struct.pack("<4s4sIHHIIIIIIiI4h", b"vids", b"MJPG", 0, 0, 0, 0, 1000, int(round(fps * 1000)), 0,
+                       len(jpegs), largest, -1, 0, 0, 0, width, height)
+    strf = struct.pack("<IiiHH4sIiiII", 40, width, height, 1, 24, b"MJPG", width * height * 3, 0, 0, 0, 0)
+    strl = b"strl" + _chunk(b"strh", strh) + _chunk(b"strf", strf)
+    hdrl = b"hdrl" + _chunk(b"avih", avih) + _chunk(b"LIST", strl)
+    movi = b"movi" + b"".join(chunks)
+    body = b"AVI " + _chunk(b"LIST", hdrl) + _chunk(b"LIST", movi) + _chunk(b"idx1", b"".join(index))
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_chunk(b"RIFF", body))
+    os.replace(tmp, path)
+
+
+def _chunk(fourcc, data):
+    return struct.pack("<4sI", fourcc, len(data)) + data + b"\0" * (len(data) & 1)
+
+
+# ---------------- Recorder ---------------- #
+class ClipRecorder(threading.Thread):
+    """
+    Keeps a FrameRing per camera and turns alerts into clips.
+
+    offer() is called from capture threads and only queues the raw frame
+    reference (newest kept, at most `fps` per second while there is motion,
+    `idle_fps` otherwise); JPEG encoding happens on this thread. Frames the
+    model looked at are offered with their best detection score.
+    request() asks for the `pre` + `post` seconds around an alert; once the
+    post-trigger frames are buffered the clip is written to
+    `directory`/<alert_id>.avi and `on_done(alert_id, path, best, info)` is
+    called with the best frame's JPEG. Every encoded frame is also passed to
+    `on_frame(camera_id, t, jpeg)` (the viewer's live preview), if given.
+    """
+
+    def __init__(self, directory, pre=3.0, post=3.0, fps=5.0, idle_fps=1.0, buffer_bytes=4 * 1024 * 1024,
+                 max_frames=256, quality=80, keep=50, queue_size=4, on_frame=None):
+        super().__init__(name="clip-recorder", daemon=True)
+        self.directory = directory
+        self.pre = pre
+        self.post = post
+        self.fps = fps
+        self.idle_fps = idle_fps
+        self.buffer_bytes = buffer_bytes
+        self.max_frames = max_frames
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        self.keep = keep
+        self.on_frame = on_frame
+        self.queue = BoundedQueue("clip-frames", queue_size, DROP_OLDEST)
+        self.rings = {}
+        self._sizes = {}
+        self._last_offer = {}
+        self._jobs = []
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.clips = 0
+        self.failed = 0
+        os.makedirs(directory, exist_ok=True)
+
+    # ---------------- Producers ---------------- #
+    def offer(self, camera_id, t, frame, active=False, score=None):
+        """Non-blocking; rate-limited unless the frame carries a detection score."""
+        if score is None:
+            period = 1.0 / (self.fps if active else self.idle_fps)
+            last = self._last_offer.get(camera_id)
+            if last is not None and 0 <= t - last < period:
+                return False
+            self._last_offer[camera_id] = t
+        return self.queue.put((camera_id, t, frame, score))
+
+    def request(self, camera_id, alert_id, t, on_done, **info):
+        with self._lock:
+            self._jobs.append((camera_id, alert_id, t, on_done, dict(info, camera_id=camera_id), time.time()))
+
+    # ---------------- Worker ---------------- #
+    def run(self):
+        while not self._stopping.is_set():
+            item = self.queue.get(timeout=0.2)
+            if item is not None:
+                self._store(*item)
+            self._run_due_jobs()
+
+    def _store(self, camera_id, t, frame, score):
+        ring = self.rings.get(camera_id)
+        if ring is None:
+            ring = self.rings[camera_id] = FrameRing(self.buffer_bytes, self.max_frames)
+        if score is not None and ring.annotate(t, score):
+            return
+        t0 = time.perf_counter()
+        ok, jpeg = cv2.imencode(".jpg", frame, self.params)
+        if ok:
+            ring.append(t, jpeg.reshape(-1), NO_SCORE if score is None else score, sharpness(frame))
+            self._sizes[camera_id] = (frame.shape[1], frame.shape[0])
+        CLIP_ENCODE_SECONDS.observe(time.perf_counter() - t0)
+        if ok and self.on_frame is not None:
+            self.on_frame(camera_id, t, jpeg)
+
+    def _run_due_jobs(self, flush=False):
+        with self._lock:
+            jobs, self._jobs = self._jobs, []
+        waiting = []
+        for job in jobs:
+            camera_id, alert_id, t, on_done, info, requested = job
+            ring = self.rings.get(camera_id)
+            latest = ring.latest_time() if ring else None
+            # a camera that stopped delivering frames must not hold the clip back forever
+            due = flush or (latest is not None and latest >= t + self.post) or \
+                time.time() - requested > self.post + 5
+            if due:
+                self._make_clip(job)
+            else:
+                waiting.append(job)
+        if waiting:
+            with self._lock:
+                self._jobs = waiting + self._jobs
+
+    def _make_clip(self, job):
+        camera_id, alert_id, t, on_done, info, _ = job
+        ring = self.rings.get(camera_id)
+        frames = ring.window(t - self.pre, t + self.post) if ring else []
+        if not frames:
+            self.failed += 1
+            CLIPS.inc("empty")
+            print(f" No buffered frames for alert {alert_id}, no clip.")
+            return
+        span = frames[-1][0] - frames[0][0]
+        fps = (len(frames) - 1) / span if span > 0 else self.fps
+        width, height = self._sizes[camera_id]
+        path = os.path.join(self.directory, f"{alert_id}.avi")
+        try:
+            write_avi(path, [f[1] for f in frames], fps, width, height)
+            best = best_frame(frames)
+            with open(os.path.join(self.directory, f"{alert_id}.jpg"), "wb") as f:
+                f.write(best[1])
+        except OSError as e:
+            self.failed += 1
+            CLIPS.inc("error")
+            print(f" Could not write clip for {alert_id}: {e}")
+            return
+        self.clips += 1
+        CLIPS.inc("ok")
+        self._prune()
+        print(f" Clip for {alert_id}: {len(frames)} frames, {span:.1f}s "
+              f"(best frame {best[0] - t:+.1f}s, score {best[2]:.2f})")
+        try:
+            on_done(alert_id, path, best[1], dict(info, frames=len(frames), seconds=round(span, 2),
+                                                  trigger_time=t, best_time=best[0], best_score=best[2]))
+        except Exception as e:
+            print(" Clip handler error:", e)
+
+    def _prune(self):
+        clips = sorted((f for f in os.listdir(self.directory) if f.endswith(".avi")),
+                       key=lambda f: os.path.getmtime(os.path.join(self.directory, f)))
+        for name in clips[:max(0, len(clips) - self.keep)]:
+            for path in (name, name[:-4] + ".jpg"):
+                try:
+                    os.remove(os.path.join(self.directory, path))
+                except OSError:
+                    pass
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self.join(timeout)
+        self._run_due_jobs(flush=True)  # clips with whatever post-trigger frames were buffered
+
+    def stats(self):
+        return {
+            "clips": self.clips,
+            "failed": self.failed,
+            "pending": len(self._jobs),
+            "dropped_frames": self.queue.dropped,
+            "rings": {camera_id: ring.stats() for camera_id, ring in self.rings.items()},
+        }
@@ -0,0 +1,400 @@
+# fakes.py
+"""
+Offline stand-ins for the camera, Firestore and the SIM800L modem (on a pty).
+Used by benchmark.py to replay recorded footage without hardware or network.
+"""
+import glob
+import os
+import threading
+import time
+
+import cv2
+
+
+# ---------------- Camera ---------------- #
+class ReplayCamera:
+    """
+    cv2.VideoCapture look-alike that replays a video file or a directory of images.
+    `timestamp` is the position of the last frame in the recording (seconds),
+    so time-based logic sees the footage's own clock instead of wall time.
+    """
+
+    IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+    def __init__(self, source, fps=None, loops=1):
+        self.source = source
+        self.loops = loops
+        self.timestamp = 0.0
+        self.frames_read = 0
+        self.read_time = 0.0
+        self._loop = 0
+        self._capture = None
+        self._images = None
+        self._index = 0
+
+        if os.path.isdir(source):
+            self._images = sorted(
+                p for p in glob.glob(os.path.join(source, "*"))
+                if p.lower().endswith(self.IMAGE_EXTENSIONS)
+            )
+            if not self._images:
+                raise ValueError(f"No images found in {source}")
+            self.fps = fps or 10.0
+        else:
+            self._capture = cv2.VideoCapture(source)
+            if not self._capture.isOpened():
+                raise ValueError(f"Could not open video: {source}")
+            self.fps = fps or self._capture.get(cv2.CAP_PROP_FPS) or 10.0
+
+    def _read_next(self):
+        if self._images is not None:
+            if self._index >= len(self._images):
+                return False, None
+            frame = cv2.imread(self._images[self._index])
+            self._index += 1
+            return frame is not None, frame
+        return self._capture.read()
+
+    def _rewind(self):
+        if self._images is not None:
+            self._index = 0
+        else:
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def read(self):
+        t0 = time.perf_counter()
+        ret, frame = self._read_next()
+        if not ret and self._loop + 1 < self.loops:
+            self._loop += 1
+            self._rewind()
+            ret, frame = self._read_next()
+        self.read_time = time.perf_counter() - t0
+
+        if ret:
+            self.timestamp = self.frames_read / self.fps
+            self.frames_read += 1
+        return ret, frame
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        return True
+
+    def release(self):
+        if self._capture is not None:
+            self._capture.release()
+
+
+# ---------------- Firestore ---------------- #
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = dict(data) if data is not None else None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, store, collection, doc_id):
+        self._store = store
+        self._key = (collection, doc_id)
+        self.id = doc_id
+
+    def set(self, data, merge=False):
+        self._store._write(self._key, dict(data), replace=not merge or self._key not in self._store.docs)
+
+    def update(self, data):
+        if self._key not in self._store.docs:
+            raise KeyError(f"No document to update: {self._key}")
+        self._store._write(self._key, dict(data), replace=False)
+
+    def get(self):
+        self._store._check_online()
+        self._store.reads += 1
+        with self._store.lock:
+            data = self._store.docs.get(self._key)
+        return FakeSnapshot(self.id, data)
+
+    def on_snapshot(self, callback):
+        return self._store._listen(self._key, callback)
+
+
+class FakeWatch:
+    """Handle returned by on_snapshot(), like google.cloud.firestore_v1.watch.Watch."""
+
+    def __init__(self, store, key, callback):
+        self._store = store
+        self._key = key
+        self.callback = callback
+        self.is_active = True
+
+    def unsubscribe(self):
+        self.is_active = False
+        with self._store.lock:
+            watches = self._store.listeners.get(self._key, [])
+            if self in watches:
+                watches.remove(self)
+
+
+class FakeBatch:
+    def __init__(self, store):
+        self._store = store
+        self._writes = []
+
+    def set(self, doc_ref, data, merge=False):
+        self._writes.append((doc_ref, data, merge))
+
+    def commit(self, timeout=None):
+        self._store._check_online()
+        self._store.batches += 1
+        for doc_ref, data, merge in self._writes:
+            doc_ref.set(data, merge=merge)
+        return []
+
+
+class FakeCollection:
+    def __init__(self, store, name):
+        self._store = store
+        self._name = name
+
+    def document(self, doc_id):
+        return FakeDocument(self._store, self._name, doc_id)
+
+
+class FakeFirestore:
+    """
+    In-memory Firestore client covering the calls made by alert_manager.
+    With `auto_response` set, a farmer answer ("PLAY" / "NOT_PLAY") is written
+    to every new PENDING alert after `response_delay` seconds.
+    Snapshot listeners get the current document on attach and on every write;
+    each delivered snapshot counts as a read, as Firestore bills it. With
+    `listeners=False` on_snapshot() raises, to exercise the polling fallback.
+    Setting `online = False` makes every read and write fail like an outage.
+    """
+
+    def __init__(self, auto_response=None, response_delay=0.0, listeners=True):
+        self.docs = {}
+        self.listeners = {}
+        self.lock = threading.Lock()
+        self.reads = 0
+        self.writes = 0
+        self.auto_response = auto_response
+        self.response_delay = response_delay
+        self.supports_listeners = listeners
+        self.online = True
+        self.batches = 0
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def _check_online(self):
+        if not self.online:
+            raise ConnectionError("Firestore unreachable")
+
+    def _write(self, key, data, replace):
+        self._check_online()
+        with self.lock:
+            self.writes += 1
+            if replace:
+                self.docs[key] = data
+            else:
+                self.docs[key].update(data)
+            current = dict(self.docs[key])
+
+        self._notify(key)
+        if self.auto_response and current.get("status") == "PENDING":
+            self._schedule_response(key)
+
+    def _listen(self, key, callback):
+        if not self.supports_listeners:
+            raise RuntimeError("snapshot listeners disabled")
+        watch = FakeWatch(self, key, callback)
+        with self.lock:
+            self.listeners.setdefault(key, []).append(watch)
+        self._deliver(watch)
+        return watch
+
+    def _deliver(self, watch):
+        with self.lock:
+            data = self.docs.get(watch._key)
+            self.reads += 1
+        watch.callback([FakeSnapshot(watch._key[1], data)], [], time.time())
+
+    def _notify(self, key):
+        with self.lock:
+            watches = list(self.listeners.get(key, []))
+        for watch in watches:
+            self._deliver(watch)
+
+    def _schedule_response(self, key):
+        def respond():
+            with self.lock:
+                if key not in self.docs or self.docs[key].get("status") != "PENDING":
+                    return
+                self.docs[key]["status"] = self.auto_response
+            self._notify(key)
+
+        if self.response_delay <= 0:
+            respond()
+        else:
+            timer = threading.Timer(self.response_delay, respond)
+            timer.daemon = True
+            timer.start()
+
+
+# ---------------- GSM Modem ---------------- #
+class FakeModem:
+    """
+    SIM800L simulator on the master side of a pseudo-terminal. `port` is the
+    slave device, so the real driver opens it with pyserial like /dev/serial0.
+
+    Commands are echoed until ATE0. `reply_delay` seconds after each SMS is
+    sent, the farmer's answer is stored in the inbox and announced with
+    +CMTI (or pushed with +CMT after AT+CNMI=2,2). `reply` is "1" / "0", a
+    callable(message) returning the reply text, or None for a silent farmer.
+    """
+
+    def __init__(self, reply="0", reply_delay=0.0, sender="+250700000000", response_delay=0.0):
+        self.reply = reply
+        self.reply_delay = reply_delay
+        self.sender = sender
+        self.response_delay = response_delay
+        self.sent_messages = []
+        self.commands = []
+        self.inbox = {}
+        self.echo = True
+        self.push_mode = False
+        self._next_index = 1
+        self._in = bytearray()
+        self._awaiting_body = False
+        self._lock = threading.Lock()
+        self._running = False
+        self._master = None
+        self.port = None
+
+    def start(self):
+        import pty
+        import tty
+
+        self._master, slave = pty.openpty()
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        self._slave = slave
+        self._running = True
+        threading.Thread(target=self._serve, name="fake-modem", daemon=True).start()
+        return self
+
+    def close(self):
+        self._running = False
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def _serve(self):
+        import select
+
+        while self._running:
+            try:
+                ready, _, _ = select.select([self._master], [], [], 0.1)
+                if not ready:
+                    continue
+                data = os.read(self._master, 1024)
+            except OSError:
+                return
+            with self._lock:
+                self._in += data
+                self._process()
+
+    def _respond(self, text):
+        if self.response_delay:
+            time.sleep(self.response_delay)
+        try:
+            os.write(self._master, text.encode())
+        except OSError:
+            pass
+
+    def _store_reply(self, message):
+        text = self.reply(message) if callable(self.reply) else self.reply
+        if text is None:
+            return
+        with self._lock:
+            if self.push_mode:
+                self._respond(f'\r\n+CMT: "{self.sender}","","24/01/01,00:00:00+00"\r\n{text}\r\n')
+                return
+            index = self._next_index
+            self._next_index += 1
+            self.inbox[index] = text
+            self._respond(f'\r\n+CMTI: "SM",{index}\r\n')
+
+    def _schedule_reply(self, message):
+        timer = threading.Timer(self.reply_delay, self._store_reply, args=(message,))
+        timer.daemon = True
+        timer.start()
+
+    def _listing(self, index, status="REC UNREAD"):
+        return f'"{status}","{self.sender}","","24/01/01,00:00:00+00"\r\n{self.inbox[index]}\r\n'
+
+    def _process(self):
+        while True:
+            if self._awaiting_body:
+                end = self._in.find(b"\x1a")
+                if self._in[:1] == b"\x1b":
+                    del self._in[:1]
+                    self._awaiting_body = False
+                    continue
+                if end < 0:
+                    return
+                message = self._in[:end].decode(errors="ignore")
+                del self._in[:end + 1]
+                self._awaiting_body = False
+                self.sent_messages.append(message)
+                self._respond(f"\r\n+CMGS: {len(self.sent_messages)}\r\n\r\nOK\r\n")
+                self._schedule_reply(message)
+                continue
+
+            end = self._in.find(b"\r")
+            if end < 0:
+                return
+            cmd = self._in[:end].decode(errors="ignore").strip()
+            del self._in[:end + 1]
+            if not cmd:
+                continue
+            self.commands.append(cmd)
+            if self.echo:
+                self._respond(cmd + "\r\n")
+
+            if cmd == "ATE0":
+                self.echo = False
+                self._respond("\r\nOK\r\n")
+            elif cmd.startswith("AT+CNMI="):
+                self.push_mode = cmd.startswith("AT+CNMI=2,2")
+                self._respond("\r\nOK\r\n")
+            elif cmd.startswith("AT+CMGS="):
+                self._awaiting_body = True
+                self._respond("\r\n> ")
+            elif cmd.startswith("AT+CMGR="):
+                index = int(cmd.split("=", 1)[1])
+                if index in self.inbox:
+                    self._respond("\r\n+CMGR: " + self._listing(index) + "\r\nOK\r\n")
+                else:
+                    self._respond("\r\n+CMS ERROR: 321\r\n")
+            elif cmd.startswith("AT+CMGL"):
+                listing = "".join(f"+CMGL: {i}," + self._listing(i) for i in sorted(self.inbox))
+                self._respond("\r\n" + listing + "\r\nOK\r\n")
+            elif cmd.startswith("AT+CMGD="):
+                args = cmd.split("=", 1)[1].split(",")
+                if len(args) > 1 and args[1].strip() == "4":
+                    self.inbox.clear()
+                else:
+                    self.inbox.pop(int(args[0]), None)
+                self._respond("\r\nOK\r\n")
+            else:
+                self._respond("\r\nOK\r\n")
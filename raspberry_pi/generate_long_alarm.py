@@ -1,28 +1,20 @@
-import numpy as np
-from scipy.io.wavfile import write
+# generate_long_alarm.py
+"""Writes sounds/alarm_long.wav (60 s pulsed 1 kHz tone), rendered in small chunks."""
 import os
 
+from sound_synth import RATE, pulse, write_wav
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SOUND_DIR = os.path.join(BASE_DIR, "sounds")
-os.makedirs(SOUND_DIR, exist_ok=True)
-
-def create_long_alarm(filename, frequency=1000, duration=60, volume=0.7):
-    rate = 44100  # Sample rate
 
-    # Time line for 60 seconds
-    t = np.linspace(0, duration, int(rate * duration), False)
 
-    # Create tone
-    tone = np.sin(2 * np.pi * frequency * t)
-
-    # Make pulsing effect (1 second ON, 0.2 off)
-    envelope = ((np.sin(2 * np.pi * (1/1.2) * t) > 0) * 1.0).astype(float)
-
-    # Apply envelope & volume
-    audio = (tone * envelope * volume * 32767).astype(np.int16)
+def create_long_alarm(filename, frequency=1000, duration=60, volume=0.7):
+    # pulsing effect: 0.6 s on, 0.6 s off
+    write_wav(pulse(duration, frequency=frequency, on=0.6, off=0.6, volume=volume), filename, RATE, channels=1)
 
-    write(filename, rate, audio)
 
-print("🔧 Creating 60-second continuous alarm WAV...")
-create_long_alarm(os.path.join(SOUND_DIR, "alarm_long.wav"))
-print("alarm_long.wav created in /sounds/")
+if __name__ == "__main__":
+    os.makedirs(SOUND_DIR, exist_ok=True)
+    print("🔧 Creating 60-second continuous alarm WAV...")
+    create_long_alarm(os.path.join(SOUND_DIR, "alarm_long.wav"))
+    print("alarm_long.wav created in /sounds/")
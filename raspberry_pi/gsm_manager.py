@@ -0,0 +1,339 @@
+# gsm_manager.py
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+import serial
+
+from metrics import SMS_REPLY_SECONDS, SMS_SEND_SECONDS
+
+COMMAND_TIMEOUT = 5    # seconds for ordinary AT commands
+SEND_TIMEOUT = 60      # AT+CMGS can take this long on a weak network
+READ_TIMEOUT = 0.1     # serial read timeout of the reader thread
+
+FINAL_OK = ("OK",)
+FINAL_ERROR = ("ERROR", "+CME ERROR", "+CMS ERROR")
+URC_PREFIXES = ("+CMTI:", "+CMT:", "RING", "Call Ready", "SMS Ready", "+CPIN:",
+                "+CFUN:", "NORMAL POWER DOWN", "UNDER-VOLTAGE", "OVER-VOLTAGE")
+
+REPLY_PATTERN = re.compile(r"^\s*([01])\b\s*([A-Za-z0-9]*)")
+
+
+class GsmError(Exception):
+    pass
+
+
+class ModemTimeout(GsmError):
+    pass
+
+
+class _Command:
+    def __init__(self, text, timeout, body=None):
+        self.text = text
+        self.timeout = timeout
+        self.body = body
+        self.lines = []
+        self.future = Future()
+        self.prompt = threading.Event()
+        self.done = threading.Event()
+
+
+# ---------------- SIM800L Driver ---------------- #
+class Sim800:
+    """
+    Event-driven SIM800L driver.
+
+    A reader thread splits everything the modem sends into lines as it
+    arrives: lines belonging to the command in flight are collected until
+    its final result code, URCs (+CMTI, +CMT, RING, ...) are handled at once.
+    A writer thread sends queued commands one at a time, each with its own
+    timeout; command() returns a Future of the response lines.
+    Incoming SMS are passed to `on_sms(sender, body)`.
+    """
+
+    def __init__(self, ser, on_sms=None, command_timeout=COMMAND_TIMEOUT):
+        self.ser = ser
+        self.on_sms = on_sms
+        self.command_timeout = command_timeout
+        self._queue = queue.Queue()
+        self._current = None
+        self._pending_cmt = None
+        self._buffer = b""
+        self._running = False
+        self._threads = []
+        self.counts = {"commands": 0, "errors": 0, "timeouts": 0, "sms_sent": 0, "sms_received": 0, "urcs": 0}
+
+    @classmethod
+    def open(cls, port, baudrate, **kwargs):
+        return cls(serial.Serial(port, baudrate, timeout=READ_TIMEOUT), **kwargs)
+
+    def start(self):
+        self._running = True
+        for name, target in (("gsm-reader", self._read_loop), ("gsm-writer", self._write_loop)):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def setup(self):
+        """Text mode, no echo, new SMS stored and announced with +CMTI; inbox wiped once."""
+        for cmd in ("AT", "ATE0", "AT+CMGF=1", "AT+CNMI=2,1,0,0,0", "AT+CMGD=1,4"):
+            self.command(cmd).result(timeout=self.command_timeout * 2)
+
+    def close(self):
+        self._running = False
+        self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=1)
+        try:
+            self.ser.close()
+        except Exception:
+            pass
+
+    # ---------------- Commands ---------------- #
+    def command(self, text, timeout=None, body=None):
+        """Queue an AT command; `body` is sent after the '>' prompt (AT+CMGS)."""
+        cmd = _Command(text, timeout or self.command_timeout, body)
+        self._queue.put(cmd)
+        return cmd.future
+
+    def send_sms(self, number, text, timeout=SEND_TIMEOUT):
+        """Future of the message reference returned in +CMGS."""
+        result = Future()
+        started = time.perf_counter()
+
+        def sent(future):
+            try:
+                lines = future.result()
+            except Exception as e:
+                SMS_SEND_SECONDS.observe(time.perf_counter() - started, "error")
+                result.set_exception(e)
+                return
+            SMS_SEND_SECONDS.observe(time.perf_counter() - started, "ok")
+            self.counts["sms_sent"] += 1
+            ref = next((l.split(":", 1)[1].strip() for l in lines if l.startswith("+CMGS:")), None)
+            result.set_result(int(ref) if ref and ref.isdigit() else ref)
+
+        self.command(f'AT+CMGS="{number}"', timeout=timeout, body=text).add_done_callback(sent)
+        return result
+
+    def _write_loop(self):
+        while self._running:
+            cmd = self._queue.get()
+            if cmd is None:
+                break
+            self.counts["commands"] += 1
+            self._current = cmd
+            deadline = time.monotonic() + cmd.timeout
+            try:
+                self.ser.write(cmd.text.encode() + b"\r")
+                if cmd.body is not None:
+                    if not cmd.prompt.wait(cmd.timeout):
+                        raise ModemTimeout(f"no prompt for {cmd.text}")
+                    if not cmd.done.is_set():
+                        self.ser.write(cmd.body.encode() + b"\x1a")
+                if not cmd.done.wait(max(0.0, deadline - time.monotonic())):
+                    raise ModemTimeout(f"{cmd.text} timed out after {cmd.timeout}s")
+            except Exception as e:
+                if isinstance(e, ModemTimeout):
+                    self.counts["timeouts"] += 1
+                if cmd.body is not None and not cmd.done.is_set():
+                    # leave text-entry mode so the next command is not swallowed
+                    try:
+                        self.ser.write(b"\x1b")
+                    except (serial.SerialException, OSError) as write_error:
+                        print("GSM write error:", write_error)
+                self._current = None
+                if not cmd.future.done():
+                    cmd.future.set_exception(e)
+            self._current = None
+
+    # ---------------- Reader ---------------- #
+    def _read_loop(self):
+        while self._running:
+            try:
+                data = self.ser.read(self.ser.in_waiting or 1)
+            except Exception as e:
+                print("GSM read error:", e)
+                time.sleep(1)
+                continue
+            if not data:
+                continue
+            self._buffer += data
+            while b"\n" in self._buffer:
+                raw, self._buffer = self._buffer.split(b"\n", 1)
+                self._handle_line(raw.decode(errors="ignore").strip())
+            # the SMS text prompt is not terminated by a newline
+            if self._buffer.strip() == b">":
+                self._buffer = b""
+                if self._current is not None:
+                    self._current.prompt.set()
+
+    def _handle_line(self, line):
+        if not line:
+            return
+        if self._pending_cmt is not None:
+            sender, self._pending_cmt = self._pending_cmt, None
+            self._deliver_sms(sender, line)
+            return
+        if line.startswith(URC_PREFIXES):
+            self._handle_urc(line)
+            return
+
+        cmd = self._current
+        if cmd is None:
+            return
+        if line == cmd.text:
+            return  # echo
+        if line == ">":
+            cmd.prompt.set()
+        elif line in FINAL_OK:
+            self._finish(cmd, None)
+        elif line.startswith(FINAL_ERROR):
+            self.counts["errors"] += 1
+            self._finish(cmd, GsmError(f"{cmd.text}: {line}"))
+        else:
+            cmd.lines.append(line)
+
+    def _finish(self, cmd, error):
+        cmd.done.set()
+        cmd.prompt.set()  # an error instead of the prompt must not wait for it
+        if cmd.future.done():
+            return
+        if error is None:
+            cmd.future.set_result(cmd.lines)
+        else:
+            cmd.future.set_exception(error)
+
+    def _handle_urc(self, line):
+        self.counts["urcs"] += 1
+        if line.startswith("+CMTI:"):
+            # +CMTI: "SM",3 -> read message 3, then delete it
+            index = line.rsplit(",", 1)[-1].strip()
+            self.command(f"AT+CMGR={index}").add_done_callback(
+                lambda future, index=index: self._on_stored_sms(future, index))
+        elif line.startswith("+CMT:"):
+            # +CMT: "<sender>","","<time>" followed by the body line
+            fields = line.split(":", 1)[1].split(",")
+            self._pending_cmt = fields[0].strip().strip('"')
+        else:
+            print("GSM:", line)
+
+    def _on_stored_sms(self, future, index):
+        try:
+            lines = future.result()
+        except Exception as e:
+            print(f"Could not read SMS {index}: {e}")
+            return
+        header = next((l for l in lines if l.startswith("+CMGR:")), None)
+        if header is not None:
+            fields = header.split(":", 1)[1].split(",")
+            sender = fields[1].strip().strip('"') if len(fields) > 1 else ""
+            body = "\n".join(lines[lines.index(header) + 1:])
+            self._deliver_sms(sender, body)
+        self.command(f"AT+CMGD={index}")
+
+    def _deliver_sms(self, sender, body):
+        self.counts["sms_received"] += 1
+        if self.on_sms is not None:
+            try:
+                self.on_sms(sender, body)
+            except Exception as e:
+                print("SMS handler error:", e)
+
+    def stats(self):
+        return dict(self.counts, queued=self._queue.qsize())
+
+
+# ---------------- Farmer Replies ---------------- #
+class GsmManager:
+    """
+    Asks the farmer about alerts by SMS and matches the answers.
+
+    ask() sends the question with a short reference and returns a Future
+    that resolves to "1" or "0" when the farmer answers, or to None if the
+    SMS could not be sent. A reply "1 <ref>" goes to that alert; a bare
+    "1" / "0" goes to the most recent alert still waiting.
+    `on_sent(ok)`, if given to ask(), is called once the modem has sent the
+    question (or failed to).
+    """
+
+    def __init__(self, modem):
+        self.modem = modem
+        modem.on_sms = self._on_sms
+        self._waiting = {}  # ref -> Future, in ask order
+        self._sent_at = {}  # ref -> when the question went out, for the reply latency
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, port, baudrate):
+        """Open and configure the modem; None when it is not reachable."""
+        modem = None
+        try:
+            modem = Sim800.open(port, baudrate).start()
+            manager = cls(modem)
+            modem.setup()
+            print("GSM modem initialized")
+            return manager
+        except Exception as e:
+            print("Could not initialize GSM:", e)
+            if modem is not None:
+                modem.close()
+            return None
+
+    def ask(self, number, text, ref, on_sent=None):
+        reply = Future()
+        with self._lock:
+            self._waiting[ref] = reply
+
+        def sent(future):
+            try:
+                print(f"SMS {ref} sent (ref {future.result()}) -> waiting for reply...")
+                ok = True
+                with self._lock:
+                    self._sent_at[ref] = time.time()
+            except Exception as e:
+                print(f"SMS {ref} failed: {e}")
+                ok = False
+            if on_sent is not None:
+                on_sent(ok)
+            if not ok:
+                self._resolve(ref, None)
+
+        self.modem.send_sms(number, f"{text} Ref {ref}").add_done_callback(sent)
+        return reply
+
+    def _resolve(self, ref, answer):
+        with self._lock:
+            reply = self._waiting.pop(ref, None)
+            sent_at = self._sent_at.pop(ref, None)
+        if answer is not None and sent_at is not None:
+            SMS_REPLY_SECONDS.observe(time.time() - sent_at)
+        if reply is not None and not reply.done():
+            reply.set_result(answer)
+
+    def _on_sms(self, sender, body):
+        match = REPLY_PATTERN.match(body)
+        if not match:
+            print(f"Ignoring SMS from {sender}: {body!r}")
+            return
+        answer, ref = match.group(1), match.group(2).upper()
+        with self._lock:
+            for key in [k for k, f in self._waiting.items() if f.done()]:
+                del self._waiting[key]  # cancelled by the dispatcher
+                self._sent_at.pop(key, None)
+            if ref not in self._waiting:
+                ref = next(reversed(self._waiting), None)
+        if ref is None:
+            print(f"SMS reply {answer} from {sender} but no alert is waiting.")
+            return
+        print(f"Farmer replied {answer} to {ref}.")
+        self._resolve(ref, answer)
+
+    def close(self):
+        self.modem.close()
+
+    def stats(self):
+        return dict(self.modem.stats(), waiting=len(self._waiting))
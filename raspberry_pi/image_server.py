@@ -1,68 +1,339 @@
 # image_server.py
-from flask import Flask, send_file, jsonify
+"""
+Optional read-only LAN viewer: the latest alert image, live MJPEG previews
+of the cameras, alert clips, /metrics and /traces.
+
+An ASGI app (Starlette) served by uvicorn from a single event-loop thread.
+Run from main.py, images come from in-memory FrameBuffers the detector
+publishes to and are written to the socket straight from their buffers;
+run standalone, latest.jpg is read from disk (once per change).
+"""
+import asyncio
+import contextlib
+import hashlib
 import os
-import requests
+import re
+import threading
+import time
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
 
-app = Flask(__name__)
+import metrics
+from api.avi import read_avi
+from api.http_cache import cached_response, not_modified
+from metrics import PREVIEW_CLIENTS, PREVIEW_FRAMES
 
 # Get absolute path to the image directory
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 IMAGE_PATH = os.path.join(BASE_DIR, "captured_image", "latest.jpg")
+CLIP_DIR = os.path.join(BASE_DIR, "state", "clips")
+CLIP_ID = re.compile(r"^[A-Za-z0-9_.-]{1,128}$")
+
+LIVE_FPS = 5             # default frame rate of one preview stream (?fps= up to LIVE_MAX_FPS)
+LIVE_MAX_FPS = 15
+LIVE_KEEPALIVE = 10      # seconds without a new frame before the current one is sent again
+VIEWER_NICE = 10         # the server thread runs at a lower CPU priority than inference
+BOUNDARY = "frame"
+
+
+# ---------------- Frame Buffers ---------------- #
+class FrameBuffer:
+    """
+    The current JPEG of one source. publish() may be called from any thread;
+    readers get a memoryview of the very object that was published (an
+    imencode() array or bytes, never modified afterwards), so nothing is
+    copied per request. Waiting streams are woken through the event loop,
+    and only while there are any: publishing to an unwatched buffer is a
+    few attribute writes.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.frame = None   # (seq, memoryview, etag, time)
+        self.seq = 0
+        self.watchers = 0   # open streams; only changed on the event loop
+        self._event = None
+        self._lock = threading.Lock()
+
+    def publish(self, jpeg, t=None):
+        t = time.time() if t is None else t
+        view = memoryview(jpeg).cast("B")
+        with self._lock:
+            self.seq += 1
+            self.frame = (self.seq, view, f'"{self.name}-{int(t * 1000)}-{self.seq}"', t)
+        loop = _loop
+        if self.watchers and loop is not None:
+            loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        if self._event is not None:
+            self._event.set()
+            self._event = None
+
+    async def wait(self, seq, timeout):
+        """The newest frame once it is newer than `seq`, or None after `timeout` seconds."""
+        while self.frame is None or self.frame[0] <= seq:
+            if self._event is None:
+                self._event = asyncio.Event()
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self.frame
+
+
+_loop = None                  # the server's event loop, once it runs
+LATEST = FrameBuffer("latest")  # latest alert image, published by main.py
+LIVE = {}                     # camera id -> FrameBuffer of its preview frames
+_live_lock = threading.Lock()
+
+
+def live_buffer(camera_id):
+    buffer = LIVE.get(camera_id)
+    if buffer is None:
+        with _live_lock:
+            buffer = LIVE.setdefault(camera_id, FrameBuffer(camera_id))
+    return buffer
 
-# Your FastAPI endpoint
-FASTAPI_UPLOAD_URL = "https://capstone-project-hbck.onrender.com/upload"
 
-@app.route("/")
-def home():
-    return """
-    <h2> ChFarmGuard Image Server</h2>
-    <p>Server is running locally on port 5000.</p>
+def publish_live(camera_id, t, jpeg):
+    """Preview frame of a camera (JPEG bytes or imencode() array)."""
+    live_buffer(camera_id).publish(jpeg, t)
+
+
+PREVIEW_CLIENTS.set_function(lambda: {(camera_id,): b.watchers for camera_id, b in list(LIVE.items())})
+
+# ---------------- Image Cache (standalone) ---------------- #
+# main.py replaces latest.jpg atomically; a changed mtime/size reloads it,
+# otherwise requests are served from memory after a single stat().
+_cache = {"key": None, "data": None, "etag": None, "mtime": None}
+_cache_lock = threading.Lock()
+
+
+def load_latest():
+    """(bytes, etag, mtime) of latest.jpg on disk, or None if there is none."""
+    try:
+        st = os.stat(IMAGE_PATH)
+    except OSError:
+        return None
+    key = (st.st_mtime_ns, st.st_size)
+    with _cache_lock:
+        if _cache["key"] != key:
+            with open(IMAGE_PATH, "rb") as f:
+                data = f.read()
+            _cache.update(key=key, data=data, etag=f'"{hashlib.sha256(data).hexdigest()}"', mtime=st.st_mtime)
+            print(f" Loaded new image ({len(data)/1024:.0f} KB)")
+        return _cache["data"], _cache["etag"], _cache["mtime"]
+
+
+def mjpeg_part(jpeg):
+    return (f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n").encode()
+
+
+# ---------------- Routes ---------------- #
+async def home(request):
+    cameras = "".join(f"<li><a href='/live/{camera_id}.mjpg'>Live: {camera_id}</a></li>" for camera_id in LIVE)
+    return HTMLResponse(f"""
+    <h2> ChFarmGuard Image Viewer</h2>
+    <p>Read-only viewer running locally on port 5000. Cloud uploads are done by main.py.</p>
     <ul>
         <li><a href='/status'>Check Status</a></li>
         <li><a href='/latest.jpg'>View Latest Captured Image</a></li>
+        {cameras}
+        <li><a href='/clips'>Alert clips</a></li>
+        <li><a href='/metrics'>Metrics</a> (Prometheus) and <a href='/traces'>alert traces</a></li>
     </ul>
-    """
+    """)
+
 
+async def latest_image(request):
+    """Serve the latest image from memory; 304 when the phone's copy is current, 206 for ranges."""
+    frame = LATEST.frame
+    if frame is not None:
+        latest = frame[1], frame[2], frame[3]
+    else:
+        latest = await run_in_threadpool(load_latest)
+    if latest is None:
+        return JSONResponse({"error": "No image found"}, status_code=404)
+    return cached_response(request, *latest)
 
-@app.route("/latest.jpg")
-def latest_image():
-    """Serve the latest image locally."""
-    print(" Checking image at:", IMAGE_PATH)
-    if os.path.exists(IMAGE_PATH):
-        print(" Image found, sending it.")
-        return send_file(IMAGE_PATH, mimetype="image/jpeg")
-    print(" Image not found at:", IMAGE_PATH)
-    return jsonify({"error": "No image found"}), 404
 
+async def live_snapshot(request):
+    """Current preview frame of a camera."""
+    buffer = LIVE.get(request.path_params["camera_id"])
+    frame = buffer.frame if buffer is not None else None
+    if frame is None:
+        return JSONResponse({"error": "No live frames (are clips enabled?)"}, status_code=404)
+    return cached_response(request, frame[1], frame[2], frame[3])
 
-@app.route("/upload", methods=["POST"])
-def upload_to_fastapi():
-    """Manually push the latest image to your FastAPI cloud server."""
-    if not os.path.exists(IMAGE_PATH):
-        return jsonify({"error": "No local image found"}), 404
 
+async def live_stream(request):
+    """
+    MJPEG preview of a camera at up to ?fps= frames per second. Each client
+    gets the newest frame whenever it is ready for one, so a slow phone
+    drops frames instead of queueing them or slowing down the others.
+    """
+    camera_id = request.path_params["camera_id"]
+    buffer = LIVE.get(camera_id)
+    if buffer is None:
+        return JSONResponse({"error": "No live frames (are clips enabled?)"}, status_code=404)
     try:
-        with open(IMAGE_PATH, "rb") as f:
-            files = {"file": f}
-            response = requests.post(FASTAPI_UPLOAD_URL, files=files)
-        if response.status_code == 200:
-            print(" Uploaded image to FastAPI cloud successfully.")
-            return jsonify({"status": "success"})
-        return jsonify({"status": "error", "detail": response.text}), 500
-    except Exception as e:
-        print(" Upload error:", e)
-        return jsonify({"status": "failed", "error": str(e)}), 500
-
-
-@app.route("/status")
-def status():
-    return jsonify({
+        fps = min(max(float(request.query_params.get("fps", LIVE_FPS)), 0.1), LIVE_MAX_FPS)
+    except ValueError:
+        return JSONResponse({"error": "Invalid fps"}, status_code=400)
+
+    async def frames():
+        buffer.watchers += 1
+        seq, period = 0, 1.0 / fps
+        try:
+            while True:
+                frame = await buffer.wait(seq, LIVE_KEEPALIVE)
+                if frame is None:
+                    frame = buffer.frame  # nothing new: resend, so idle connections stay open
+                elif seq and frame[0] > seq + 1:
+                    PREVIEW_FRAMES.inc(camera_id, "dropped", amount=frame[0] - seq - 1)
+                seq = frame[0]
+                sent_at = time.monotonic()
+                yield mjpeg_part(frame[1])
+                yield frame[1]
+                yield b"\r\n"
+                PREVIEW_FRAMES.inc(camera_id, "sent")
+                delay = sent_at + period - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+        finally:
+            buffer.watchers -= 1
+
+    return StreamingResponse(frames(), media_type=f"multipart/x-mixed-replace; boundary={BOUNDARY}",
+                             headers={"Cache-Control": "no-cache"})
+
+
+async def status(request):
+    return JSONResponse({
         "status": "running",
-        "image_exists": os.path.exists(IMAGE_PATH)
+        "image_exists": LATEST.frame is not None or os.path.exists(IMAGE_PATH),
+        "live": {camera_id: {"frames": b.seq, "viewers": b.watchers} for camera_id, b in list(LIVE.items())},
     })
 
 
+async def metrics_endpoint(request):
+    """Counters and histograms of the agent (populated when served from main.py's process)."""
+    return Response(metrics.REGISTRY.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+async def traces(request):
+    """Recent sampled or slow alert timelines."""
+    return JSONResponse(metrics.TRACER.traces())
+
+
+# ---------------- Alert Clips ---------------- #
+def clip_path(alert_id, ext):
+    if not CLIP_ID.match(alert_id) or alert_id.startswith("."):
+        return None
+    path = os.path.join(CLIP_DIR, f"{alert_id}.{ext}")
+    return path if os.path.isfile(path) else None
+
+
+def list_clips():
+    try:
+        names = [n for n in os.listdir(CLIP_DIR) if n.endswith(".avi")]
+    except OSError:
+        names = []
+    items = []
+    for name in names:
+        st = os.stat(os.path.join(CLIP_DIR, name))
+        alert_id = name[:-4]
+        items.append({"alert_id": alert_id, "size": st.st_size, "created_at": st.st_mtime,
+                      "clip_url": f"/clips/{alert_id}.avi", "stream_url": f"/clips/{alert_id}.mjpg",
+                      "image_url": f"/clips/{alert_id}.jpg"})
+    items.sort(key=lambda item: item["created_at"], reverse=True)
+    return items
+
+
+async def clips(request):
+    """Clips on the Pi, newest first."""
+    return JSONResponse(await run_in_threadpool(list_clips))
+
+
+async def clip_file(request):
+    """The clip (MJPEG AVI) or its best frame; clips never change once written."""
+    alert_id, ext = request.path_params["alert_id"], request.path_params["ext"]
+    path = clip_path(alert_id, ext) if ext in ("avi", "jpg") else None
+    if path is None:
+        return JSONResponse({"error": "No such clip"}, status_code=404)
+    st = os.stat(path)
+    etag = f'"{alert_id}-{st.st_size}-{int(st.st_mtime)}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=86400"}
+    if not_modified(request, etag, st.st_mtime):
+        return Response(status_code=304, headers=headers)
+    media_type = "video/x-msvideo" if ext == "avi" else "image/jpeg"
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=st)
+
+
+async def clip_stream(request):
+    """Replay a clip as an MJPEG stream at its own frame rate (plays in any browser)."""
+    path = clip_path(request.path_params["alert_id"], "avi")
+    if path is None:
+        return JSONResponse({"error": "No such clip"}, status_code=404)
+
+    def load():
+        with open(path, "rb") as f:
+            return read_avi(f.read())
+
+    fps, frames = await run_in_threadpool(load)
+
+    async def replay():
+        for jpeg in frames:
+            yield mjpeg_part(jpeg) + jpeg + b"\r\n"
+            await asyncio.sleep(1.0 / (fps or 5))
+
+    return StreamingResponse(replay(), media_type=f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global _loop
+    _loop = asyncio.get_running_loop()
+    yield
+    _loop = None
+
+
+app = Starlette(routes=[
+    Route("/", home),
+    Route("/latest.jpg", latest_image),
+    Route("/live/{camera_id}.jpg", live_snapshot),
+    Route("/live/{camera_id}.mjpg", live_stream),
+    Route("/clips", clips),
+    Route("/clips/{alert_id}.mjpg", clip_stream),
+    Route("/clips/{alert_id}.{ext}", clip_file),
+    Route("/metrics", metrics_endpoint),
+    Route("/traces", traces),
+    Route("/status", status),
+], lifespan=lifespan)
+
+
+# ---------------- Server ---------------- #
+def make_server(host="0.0.0.0", port=5000):
+    # no access log: a phone refreshing latest.jpg would otherwise print a line per request
+    return uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning", access_log=False))
+
+
+def serve(server, nice=VIEWER_NICE):
+    """Run the server in the calling thread, at a lower priority than the detector's threads."""
+    if nice and hasattr(os, "setpriority"):
+        try:
+            # Linux: a thread's id is a process id as far as scheduling priority goes
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), nice)
+        except OSError:
+            pass
+    server.run()
+
+
 if __name__ == "__main__":
-    print(" Local image server running at http://0.0.0.0:5000")
+    print(" Local image viewer running at http://0.0.0.0:5000")
     print(f" Watching for image: {IMAGE_PATH}")
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    serve(make_server(), nice=0)
@@ -0,0 +1,247 @@
+# inference.py
+import collections
+import contextlib
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from roi import letterbox_into
+
+try:
+    from tflite_runtime.interpreter import Interpreter
+except ImportError:  # full TensorFlow install on a dev machine
+    from tensorflow.lite.python.interpreter import Interpreter
+
+
+class InferenceEngine:
+    """
+    TFLite interpreter wrapper with an allocation-free input path.
+
+    Frames are resized straight into a preallocated uint8 buffer and then
+    written into the interpreter's own input tensor through a 256-entry cv2.LUT
+    table that folds in /255 normalisation and the model's quantization
+    (scale, zero-point). uint8 models whose quantization is the identity skip
+    the table and are resized directly into the input tensor.
+    Outputs are dequantized into preallocated float32 buffers, only when read.
+    With max_batch > 1 several crops can be packed into one invoke, provided the
+    model accepts a resized batch dimension.
+    """
+
+    BATCH_SHRINK_AFTER = 3  # smaller invokes in a row before the batch is reduced (realloc ~ one invoke)
+
+    def __init__(self, model_path, num_threads=None, input_size=None, max_batch=1):
+        self.model_path = model_path
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+
+        detail = self.interpreter.get_input_details()[0]
+        _, height, width, _ = detail["shape"]
+        if input_size is not None:
+            width, height = input_size
+        self.input_size = (int(width), int(height))
+
+        self.batch_size = 0
+        self.max_batch = max(1, max_batch)
+        self._small_batches = 0
+        if self.max_batch > 1:
+            try:
+                self._configure(self.max_batch)
+            except Exception as e:
+                print(f"Model does not accept batched input ({e}); running crops one at a time.")
+                self.max_batch = 1
+        self._configure(1)
+
+        self.last_timings = {}
+
+        print(f"Inference engine ready: {model_path} "
+              f"input={self.input_dtype.name}{list(self.input_details[0]['shape'])} "
+              f"quant=({self.input_scale}, {self.input_zero_point}) threads={num_threads} "
+              f"max_batch={self.max_batch}")
+
+    def _configure(self, batch):
+        """(Re)allocate tensors for `batch` images and rebuild the buffers that depend on them."""
+        width, height = self.input_size
+        index = self.interpreter.get_input_details()[0]["index"]
+        self._outputs = []
+        self.interpreter.resize_tensor_input(index, [batch, height, width, 3])
+        self.interpreter.allocate_tensors()
+        self.batch_size = batch
+
+        self.input_details = self.interpreter.get_input_details()
+        self.output_details = self.interpreter.get_output_details()
+
+        detail = self.input_details[0]
+        self.input_index = detail["index"]
+        self.input_dtype = np.dtype(detail["dtype"])
+        self.input_scale, self.input_zero_point = detail["quantization"]
+
+        # Function returning a numpy view onto the interpreter's input buffer.
+        # The view must not be held across invoke(), so it is fetched per frame.
+        self._input_view = self.interpreter.tensor(self.input_index)
+
+        self._lut = self._build_input_lut()
+        self._direct_input = self._lut is None
+        self._resized = np.empty((height, width, 3), dtype=np.uint8)
+
+        self._outputs = [None] * len(self.output_details)
+        self._output_views = [self.interpreter.tensor(o["index"]) for o in self.output_details]
+        self._output_buffers = []
+        for o in self.output_details:
+            scale, _ = o["quantization"]
+            if np.dtype(o["dtype"]) != np.float32 and scale:
+                self._output_buffers.append(np.empty(o["shape"], dtype=np.float32))
+            else:
+                self._output_buffers.append(None)
+
+    def ensure_batch(self, n, force=False):
+        """
+        Make room for n images per invoke (capped at max_batch). Grows at once,
+        shrinks only after BATCH_SHRINK_AFTER smaller requests (or at once with
+        `force`) to avoid reallocating tensors every frame. Returns the usable slot count.
+        """
+        n = max(1, min(n, self.max_batch))
+        if n > self.batch_size or (force and n < self.batch_size):
+            self._configure(n)
+            self._small_batches = 0
+        elif n < self.batch_size:
+            self._small_batches += 1
+            if self._small_batches >= self.BATCH_SHRINK_AFTER:
+                self._configure(n)
+                self._small_batches = 0
+        else:
+            self._small_batches = 0
+        return self.batch_size
+
+    def _build_input_lut(self):
+        """Map every uint8 pixel value to the model's input value, or None if identity."""
+        pixels = np.arange(256, dtype=np.float32) / 255.0
+
+        if self.input_dtype == np.float32:
+            return pixels
+
+        scale, zero_point = self.input_scale, self.input_zero_point
+        if not scale:
+            # un-quantized integer input: feed raw pixels
+            if self.input_dtype == np.uint8:
+                return None
+            scale, zero_point = 1.0 / 255.0, 0
+
+        info = np.iinfo(self.input_dtype)
+        lut = np.clip(np.round(pixels / scale + zero_point), info.min, info.max).astype(self.input_dtype)
+        if self.input_dtype == np.uint8 and np.array_equal(lut, np.arange(256, dtype=np.uint8)):
+            return None
+        return lut
+
+    # ---------------- Input ---------------- #
+    def set_input(self, frame, slot=0):
+        """Resize a BGR frame into the interpreter input without per-frame allocations."""
+        input_tensor = self._input_view()[slot]
+        if self._direct_input:
+            cv2.resize(frame, self.input_size, dst=input_tensor)
+        else:
+            cv2.resize(frame, self.input_size, dst=self._resized)
+            cv2.LUT(self._resized, self._lut, dst=input_tensor)
+        del input_tensor
+
+    def set_input_letterbox(self, frame, box, slot=0):
+        """Letterbox frame[box] into input slot `slot`. Returns the roi.map_to_frame transform."""
+        input_tensor = self._input_view()[slot]
+        if self._direct_input:
+            transform = letterbox_into(frame, box, input_tensor)
+        else:
+            transform = letterbox_into(frame, box, self._resized)
+            cv2.LUT(self._resized, self._lut, dst=input_tensor)
+        del input_tensor
+        return transform
+
+    # ---------------- Inference ---------------- #
+    def invoke(self):
+        # cached output views reference the interpreter's buffers and must be
+        # released before it runs again
+        for i in range(len(self._outputs)):
+            self._outputs[i] = None
+        self.interpreter.invoke()
+
+    def output(self, i):
+        """Float32 view of output i, dequantized on first access after each invoke."""
+        if self._outputs[i] is None:
+            detail = self.output_details[i]
+            raw = self._output_views[i]()
+            buf = self._output_buffers[i]
+            if buf is None:
+                self._outputs[i] = raw
+            else:
+                scale, zero_point = detail["quantization"]
+                np.subtract(raw, zero_point, out=buf, dtype=np.float32)
+                buf *= scale
+                self._outputs[i] = buf
+        return self._outputs[i]
+
+    def outputs(self):
+        return [self.output(i) for i in range(len(self.output_details))]
+
+    def run(self, frame):
+        """Preprocess + invoke. Outputs are read lazily through output()/outputs()."""
+        t0 = time.perf_counter()
+        self.set_input(frame)
+        t1 = time.perf_counter()
+        self.invoke()
+        t2 = time.perf_counter()
+        self.last_timings = {"resize": t1 - t0, "invoke": t2 - t1}
+        return self
+
+
+class EnginePool:
+    """
+    Shared set of interpreters for several cameras.
+
+    Callers wait in strict FIFO order and hold one engine per acquire(), so
+    when the pool is saturated cameras take turns instead of the busiest one
+    starving the rest. Busy and wait time are accounted per owner.
+    """
+
+    def __init__(self, engines):
+        self.engines = list(engines)
+        self._free = list(self.engines)
+        self._waiters = collections.deque()
+        self._cond = threading.Condition()
+        self.usage = {}
+
+    def _account(self, owner, key, seconds):
+        stats = self.usage.setdefault(owner, {"runs": 0, "busy_s": 0.0, "wait_s": 0.0})
+        stats[key] += seconds
+
+    @contextlib.contextmanager
+    def acquire(self, owner):
+        ticket = object()
+        t0 = time.perf_counter()
+        with self._cond:
+            self._waiters.append(ticket)
+            while self._waiters[0] is not ticket or not self._free:
+                self._cond.wait()
+            self._waiters.popleft()
+            engine = self._free.pop()
+            # the next waiter may be able to take another free engine
+            self._cond.notify_all()
+
+        t1 = time.perf_counter()
+        try:
+            yield engine
+        finally:
+            t2 = time.perf_counter()
+            with self._cond:
+                self._free.append(engine)
+                self._account(owner, "runs", 1)
+                self._account(owner, "wait_s", t1 - t0)
+                self._account(owner, "busy_s", t2 - t1)
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "engines": len(self.engines),
+                "free": len(self._free),
+                "waiting": len(self._waiters),
+                "usage": {owner: {k: round(v, 3) for k, v in u.items()} for owner, u in self.usage.items()},
+            }
@@ -1,456 +1,890 @@
+import time
+IMPORT_STARTED = time.perf_counter()  # for the startup report
 import cv2
 import numpy as np
-import time
-import traceback
 import os
-import subprocess
 import sys
-import requests
-from tflite_runtime.interpreter import Interpreter
-from alert_manager import (
-    init_firebase,
-    send_alert_to_firestore,
-    check_alert_response,
-    update_alert_status
-)
-from sound_manager import play_sound
-
-import serial
+import threading
+from concurrent.futures import Future
+from alert_manager import init_firebase
+from alert_dispatcher import AlertDispatcher, AlertStore, new_alert_id
+from outbox import Outbox, SyncWorker, encode_time
+from sound_manager import init_audio, play_deterrent, play_sound
+from pipeline import Pipeline, DROP_OLDEST, DROP_NEWEST
+from postprocess import decode_yolo, decode_outputs, batched_nms
+from roi import motion_boxes, merge_boxes, expand_box, map_to_frame
+from motion import MotionDetector
+from scheduler import DetectionScheduler
+from tracker import Tracker
+from model_registry import ModelRegistry
+from cameras import Camera
+from gsm_manager import GsmManager
+from startup import Startup
+from clip_buffer import ClipRecorder
+import metrics
+from metrics import FRAME_STAGE_SECONDS, FRAMES, MOTION_PIXELS, DETECTIONS, ALERTS, ALERT_NOTIFY_SECONDS, ESCALATIONS
+# uploader (requests) and the image viewer (starlette, uvicorn) are imported on first use
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
 
 # ---------------- Configuration ---------------- #
-MODEL_PATH = "models/best_animals.tflite"
+MODEL_PATH = "models/best_animals.tflite"   # YOLOv5n: screens every scheduled motion frame
 LABELS_PATH = "models/classes.txt"
+CASCADE_MODEL_PATH = "models/best_animals_v5s.tflite"  # YOLOv5s: second opinion on uncertain hits (None disables)
+CASCADE_LABELS_PATH = "models/classes(v5s).txt"
+MODEL_WARMUP_RUNS = 2   # blank-frame invokes at load, so the first real frame doesn't pay the cold start
 THREAT_ANIMALS = ["cattle", "camel", "sheep", "goat"]
-MOTION_THRESHOLD = 2500
-DETECTION_INTERVAL = 10  # detect every 10 frames
-FONT = cv2.FONT_HERSHEY_SIMPLEX
 INPUT_SIZE = (320, 320)
-ALERT_COOLDOWN = 30
-ALERT_DOC_ID = "alert_test_001"
+CONF_THRESHOLD = 0.4    # minimum score kept by the YOLO decoder
+NUM_THREADS = 4         # TFLite interpreter threads (Pi 4 has 4 cores)
+
+# ---------- Motion gate ----------
+MOTION_ALGORITHM = "mog2"   # "mog2", "knn" or "diff" (frame differencing, cheapest)
+MOTION_SCALE = 0.25         # background subtraction runs on a grayscale frame this much smaller (640x480 -> 160x120)
+MOTION_THRESHOLD = 2500     # foreground pixels (full-frame units) that start motion
+MOTION_OFF_THRESHOLD = 1250 # motion lasts until the count drops to this (hysteresis)
+MOTION_IDLE_STRIDE = 3      # while quiet, only every Nth frame is examined
+# per camera, CAMERA_SOURCES entries may add "ignore": [[(x, y), ...], ...] polygons in 0..1
+# frame coordinates and/or "ignore_mask": "masks/<camera>.png" (black = ignored)
+
+# ---------- Region-of-interest inference ----------
+ROI_INFERENCE = True        # run the model on crops around motion blobs instead of the whole frame
+ROI_MAX_CROPS = 4           # more blobs than this -> full frame; also the interpreter batch size
+ROI_MIN_AREA = 400          # ignore foreground blobs smaller than this (pixels)
+ROI_MERGE_GAP = 24          # merge blobs closer than this (pixels)
+ROI_PAD = 16                # context added around each blob (pixels)
+ROI_MIN_SIZE = 160          # crops are grown to at least this size per side
+ROI_FULL_FRAME_RATIO = 0.5  # crops covering more of the frame than this -> full frame
+ALERT_CONFIDENCE = 0.8  # a track must reach this score before it can alert
+ALERT_COOLDOWN = 30     # seconds; per camera and animal, also when it comes back as a new track
+
+# ---------- Model cascade ----------
+CASCADE_LOW = CONF_THRESHOLD     # screening hits scoring in [CASCADE_LOW, CASCADE_HIGH) are uncertain
+CASCADE_HIGH = ALERT_CONFIDENCE  # ... and are re-examined by the cascade model, whose verdict replaces them
+CASCADE_PAD = 32                 # context around an uncertain box (pixels)
+
+# ---------- Tracking ----------
+TRACK_IOU_THRESHOLD = 0.3   # min IoU to continue a track
+TRACK_CENTROID_GATE = 0.15  # fallback match distance (fraction of the frame)
+TRACK_MAX_AGE = 3.0         # seconds a track survives without a matching detection (at least 1.5x DETECTION_MAX_INTERVAL)
+TRACK_MIN_HITS = 2          # detections needed before a track is confirmed
+FIRESTORE_REPLY_TIMEOUT = 300   # 5 minutes
+FIRESTORE_POLL_INTERVAL = 5     # only used when the snapshot listener is unavailable
+ALERT_RETRIES = 3               # Firestore write retries before falling back to GSM
+ALERT_RETRY_DELAY = 2           # seconds, doubled after every failed attempt
+ALARM_PATTERNS = True           # synthesized deterrent, a different pattern per alert (else the warning sound)
+ALARM_SECONDS = 20              # how long the deterrent plays
+
+# ---------- Alert clips ----------
+ALERT_CLIPS = True          # keep a short clip around every alert (state/clips) and upload it with the alert ID
+CLIP_PRE_SECONDS = 3.0      # before the alert frame
+CLIP_POST_SECONDS = 3.0     # after it
+CLIP_FPS = 5                # frames buffered per second while there is motion
+CLIP_IDLE_FPS = 1           # ... and while the scene is quiet
+CLIP_BUFFER_MB = 4          # fixed JPEG ring buffer per camera
+CLIP_JPEG_QUALITY = 80
+CLIP_KEEP = 50              # clips kept on the Pi
+
+# ---------- Detection scheduling (seconds between inferences during motion) ----------
+DETECTION_BASE_INTERVAL = 0.5
+DETECTION_MIN_INTERVAL = 0.1
+DETECTION_MAX_INTERVAL = 2.0
+INFERENCE_DUTY_CYCLE = 0.6  # max share of wall time spent in the model
+THERMAL_SOFT_LIMIT = 70.0   # °C, halve the inference rate above this
+THERMAL_HARD_LIMIT = 80.0   # °C, quarter the inference rate above this
+STATS_INTERVAL = 60         # seconds between status reports in the log
+STARTUP_REPORT_TIMEOUT = 60 # print the startup report by then even if a camera never delivered a frame
+
+# ---------- Metrics & tracing (/metrics and /traces on the image viewer) ----------
+ALERT_TRACING = True        # record a timeline of every alert, from frame capture to PROCESSED
+TRACE_SAMPLE_RATE = 0.1     # share of alert timelines kept for /traces
+TRACE_SLOW_SECONDS = 5.0    # alerts busier than this (farmer's thinking time excluded) are always kept and logged
+
+# ---------- Cameras ----------
+# "source" may be a V4L2 index or /dev/videoN, an RTSP/HTTP URL or a video file.
+CAMERA_SOURCES = [
+    {"id": "farm_camera_1", "source": 0, "width": 640, "height": 480},
+    # {"id": "gate", "source": 1, "ignore": [[(0.0, 0.0), (0.35, 0.0), (0.35, 0.3), (0.0, 0.3)]]},  # tree top-left
+    # {"id": "north_edge", "source": "rtsp://192.168.1.20:554/stream1"},
+    # {"id": "replay", "source": "recordings/goats.mp4"},
+]
+INFERENCE_WORKERS = 1   # TFLite interpreters shared by all cameras
+
+# ---------- Pipeline configuration ----------
+FRAME_QUEUE_SIZE = 2    # capture -> detection (per camera), oldest frame dropped when full
+ALERT_QUEUE_SIZE = 5    # detection -> alert dispatcher, new alerts dropped when full
+QUEUE_GET_TIMEOUT = 0.5
 
 # ---------- GSM configuration ----------
 GSM_SERIAL_PORT = "/dev/serial0"
 GSM_BAUDRATE = 115200
 GSM_PHONE_NUMBER = "+250791348732"
-GSM_POLL_INTERVAL = 10
 GSM_REPLY_TIMEOUT = 300  # 5 minutes
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CAPTURE_DIR = os.path.join(BASE_DIR, "captured_image")
 CAPTURE_PATH = os.path.join(CAPTURE_DIR, "latest.jpg")
+ALERT_STATE_PATH = os.path.join(BASE_DIR, "state", "alerts.json")  # in-flight alerts survive restarts
+ALERT_IMAGE_DIR = os.path.join(BASE_DIR, "state", "images")       # one JPEG per alert, kept with the outbox
+CLIP_DIR = os.path.join(BASE_DIR, "state", "clips")               # <alert_id>.avi + best frame <alert_id>.jpg
+
+# ---------------- Offline Outbox ---------------- #
+OUTBOX_PATH = os.path.join(BASE_DIR, "state", "outbox.sqlite3")
+OUTBOX_MAX_BYTES = 200 * 1024 * 1024   # database + alert images
+OUTBOX_RETENTION = 30 * 86400          # seconds synced history is kept locally
+OUTBOX_BATCH_SIZE = 100                # writes per Firestore batch (max 500)
+SYNC_MIN_BACKOFF = 5                   # seconds after the first failed sync
+SYNC_MAX_BACKOFF = 600                 # backoff cap during long outages
 os.makedirs(CAPTURE_DIR, exist_ok=True)
 
-FLASK_URL = "http://127.0.0.1:5000"
-FASTAPI_UPLOAD_URL = "https://capstone-project-hbck.onrender.com/upload"
+IMAGE_VIEWER = True      # local read-only viewer on port 5000 (latest alert image, live previews, clips)
+IMAGE_VIEWER_PORT = 5000
+IMAGE_VIEWER_URL = f"http://127.0.0.1:{IMAGE_VIEWER_PORT}"
+FASTAPI_URL = "https://capstone-project-hbck.onrender.com"
+FASTAPI_UPLOAD_URL = f"{FASTAPI_URL}/upload"
+FASTAPI_CLIP_URL = f"{FASTAPI_URL}/clips"
+FASTAPI_API_KEY = os.environ.get("FASTAPI_API_KEY")  # must match the API's API_KEY, sent as X-Api-Key
+REPORT_ALERT_EVENTS = True  # push alert state changes to the API's /events feed
+UPLOAD_QUEUE_SIZE = 4    # pending cloud uploads, oldest image dropped when full
+UPLOAD_RETRIES = 5
+UPLOAD_MAX_BACKOFF = 60  # seconds
+
+# ---------------- Local Image Viewer (optional) ---------------- #
+image_viewer = None  # the image_server module once it serves; frames are published to it in memory
 
-# ---------------- Start Flask Image Server ---------------- #
 def start_image_server():
+    """Serve the read-only viewer (ASGI, uvicorn) for phones on the farm LAN from a thread of this process."""
+    global image_viewer
     try:
-        server_path = os.path.join(BASE_DIR, "image_server.py")
-        print("Launching Flask server from:", server_path)
-
-        process = subprocess.Popen(
-            [sys.executable, server_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True
-        )
-
-        start_time = time.time()
-        flask_ready = False
-
-        while time.time() - start_time < 20:
-            try:
-                response = requests.get(f"{FLASK_URL}/status", timeout=2)
-                if response.status_code == 200:
-                    flask_ready = True
-                    print("Flask image server is reachable at http://127.0.0.1:5000")
-                    break
-            except:
-                pass
-
-            line = process.stdout.readline()
-            if line:
-                print("[Flask]", line.strip())
-            time.sleep(1)
-
-        if not flask_ready:
-            print("Flask server did not respond in time.")
-        return process
-
+        import image_server
+        server = image_server.make_server("0.0.0.0", IMAGE_VIEWER_PORT)
     except Exception as e:
         print("Could not start image server:", e)
         return None
-
-# ---------------- FastAPI Upload Helper ---------------- #
-def upload_to_flask(image_path):
-    try:
-        print("Uploading captured image to local Flask server...")
-        response = requests.post(f"{FLASK_URL}/upload", timeout=10)
-        if response.status_code == 200:
-            print("Image successfully forwarded to FastAPI.")
-        else:
-            print(f"Upload failed: {response.status_code}, {response.text}")
-    except Exception as e:
-        print("Upload error:", e)
+    threading.Thread(target=image_server.serve, args=(server,), name="image-viewer", daemon=True).start()
+    image_viewer = image_server
+    print(f"Image viewer is reachable at {IMAGE_VIEWER_URL}")
+    return server
+
+def publish_latest(jpeg):
+    if image_viewer is not None:
+        image_viewer.LATEST.publish(jpeg)
+
+def publish_live(camera_id, t, jpeg):
+    """ClipRecorder on_frame hook: its JPEGs double as the viewer's live preview (no extra encoding)."""
+    if image_viewer is not None:
+        image_viewer.publish_live(camera_id, t, jpeg)
+
+# ---------------- Cloud Image Upload ---------------- #
+uploader = None
+
+def upload_image(jpeg, **fields):
+    """Queue in-memory JPEG bytes (+ metadata for the API's history) for upload; never blocks."""
+    global uploader
+    if uploader is None:
+        from uploader import ImageUploader
+        uploader = ImageUploader(
+            FASTAPI_UPLOAD_URL,
+            queue_size=UPLOAD_QUEUE_SIZE,
+            retries=UPLOAD_RETRIES,
+            max_backoff=UPLOAD_MAX_BACKOFF,
+            api_key=FASTAPI_API_KEY,
+        )
+        uploader.start()
+    uploader.submit(jpeg, f"{fields.get('alert_id', 'latest')}.jpg", fields)
+
+clip_uploader = None
+
+def upload_clip(path, **fields):
+    """Queue an alert clip (MJPEG AVI) for upload with its alert ID; never blocks."""
+    global clip_uploader
+    if clip_uploader is None:
+        from uploader import ImageUploader
+        clip_uploader = ImageUploader(
+            FASTAPI_CLIP_URL,
+            queue_size=UPLOAD_QUEUE_SIZE,
+            retries=UPLOAD_RETRIES,
+            max_backoff=UPLOAD_MAX_BACKOFF,
+            content_type="video/x-msvideo",
+            name="clip-uploader",
+            api_key=FASTAPI_API_KEY,
+        )
+        clip_uploader.start()
+    with open(path, "rb") as f:
+        clip_uploader.submit(f.read(), os.path.basename(path), fields)
+
+event_reporter = None
+
+def report_alert_change(record):
+    """AlertDispatcher on_change hook: queue the new state for the API's live feed; never blocks."""
+    global event_reporter
+    if event_reporter is None:
+        from uploader import EventReporter
+        event_reporter = EventReporter(FASTAPI_URL, api_key=FASTAPI_API_KEY)
+        event_reporter.start()
+    event_reporter.submit(record.id, record.state, animal=record.animal, confidence=float(record.confidence),
+                          camera_id=record.camera_id, channel=record.channel, time=time.time())
 
 # ---------------- Model & Labels ---------------- #
-with open(LABELS_PATH, "r") as f:
-    LABELS = [line.strip().lower() for line in f.readlines()]
-
-interpreter = Interpreter(model_path=MODEL_PATH)
-interpreter.allocate_tensors()
-input_details = interpreter.get_input_details()
-output_details = interpreter.get_output_details()
-
-print("Model loaded successfully")
+LABELS = []
+engine_pool = None  # set by load_model(); until then frames only go through motion detection
+model_registry = ModelRegistry(warmup_runs=MODEL_WARMUP_RUNS)
+cascade = None          # Model re-examining uncertain hits; None until loaded, or when there is none
+cascade_classes = None  # cascade class id -> LABELS index (-1: a class the screening model lacks)
+
+def load_model(model_path=MODEL_PATH, labels_path=LABELS_PATH, num_threads=NUM_THREADS, input_size=INPUT_SIZE,
+               max_batch=ROI_MAX_CROPS, workers=INFERENCE_WORKERS):
+    """(Re)load and warm up the screening model and labels used by detect_animals()."""
+    global LABELS, engine_pool
+
+    # interpreter threads are split between the workers so they don't oversubscribe the CPU
+    threads = max(1, num_threads // workers) if num_threads else None
+    model = model_registry.load("screen", model_path, labels_path, threads, input_size, max_batch, workers)
+    LABELS = list(model.labels)
+    engine_pool = model.pool
+
+    print("Model loaded successfully")
+    return engine_pool
+
+def load_cascade_model(model_path=CASCADE_MODEL_PATH, labels_path=CASCADE_LABELS_PATH, num_threads=NUM_THREADS,
+                       max_batch=ROI_MAX_CROPS):
+    """Load and warm up the cascade model; its classes are mapped onto the screening model's LABELS."""
+    global cascade, cascade_classes
+    if not model_path:
+        return None
+    if not os.path.exists(model_path):
+        print(f"Cascade model {model_path} not found; the screening model's scores are final.")
+        return None
+    model = model_registry.load("cascade", model_path, labels_path, num_threads, None, max_batch)
+    cascade_classes = model.class_map(LABELS)
+    cascade = model
+    return model
 
 # ---------------- Firebase ---------------- #
-db = init_firebase()
+db = None
+FIREBASE_INIT_TIMEOUT = 60  # seconds the first alert waits for the background Firebase init
 
-# ---------------- Detection Memory ---------------- #
-detected_animals = {}
+_firebase_lock = threading.Lock()
 
-# ---------------- GSM helper functions ---------------- #
-def clear_all_sms(ser):
-    try:
-        ser.write(b'AT+CMGD=1,4\r')
-        time.sleep(0.4)
-        ser.read(ser.in_waiting or 64)
-        print("All old SMS cleared from SIM800L inbox")
-    except:
-        print("Failed to clear SMS (ignored)")
+def connect_firebase():
+    global db
+    with _firebase_lock:
+        if db is None:
+            db = init_firebase()
+    return db
 
-def init_gsm(port=GSM_SERIAL_PORT, baud=GSM_BAUDRATE, timeout=1):
-    try:
-        ser = serial.Serial(port, baud, timeout=timeout)
-        time.sleep(0.5)
-        ser.flushInput()
-        ser.flushOutput()
-        ser.write(b'AT\r')
-        time.sleep(0.3)
-        ser.read(ser.in_waiting or 64)
-        ser.write(b'AT+CMGF=1\r')
-        time.sleep(0.3)
-        ser.read(ser.in_waiting or 64)
-        # set CNMI to store incoming SMS (2,1) so poll can read them
-        ser.write(b'AT+CNMI=2,1,0,0,0\r')
-        time.sleep(0.3)
-        ser.read(ser.in_waiting or 64)
-
-        clear_all_sms(ser)
-
-        print("GSM modem initialized")
-        return ser
-    except Exception as e:
-        print("Could not initialize GSM:", e)
-        return None
+def firebase_client():
+    """Firestore client for the outbox sync; retries the connection while there is none."""
+    return db or connect_firebase()
 
-def send_sms_via_gsm(ser, to_number, message, write_timeout=5):
-    if ser is None:
-        print("GSM serial unavailable")
-        return False
+# ---------------- Startup ---------------- #
+startup = None  # Startup of the running main(); None when imported (benchmark)
 
-    try:
-        clear_all_sms(ser)
-
-        ser.write(b'AT+CMGF=1\r')
-        time.sleep(0.2)
-        ser.read(ser.in_waiting or 64)
-
-        cmd = f'AT+CMGS="{to_number}"\r'.encode()
-        ser.write(cmd)
-        time.sleep(0.5)
-        ser.write(message.encode() + b'\x1A')
-
-        t0 = time.time()
-        buf = b""
-        while time.time() - t0 < write_timeout:
-            time.sleep(0.5)
-            buf += ser.read(ser.in_waiting or 1)
-            if b"OK" in buf or b"+CMGS" in buf or b"ERROR" in buf:
-                break
-
-        out = buf.decode(errors='ignore')
-        if "ERROR" in out:
-            print("GSM send ERROR:", out)
-            return False
-
-        print("GSM send response:", out.strip().splitlines()[-1] if out.strip() else "<no response>")
-        return True
-    except Exception as e:
-        print("SMS send exception:", e)
-        return False
-
-def poll_gsm_for_reply(ser, timeout=GSM_REPLY_TIMEOUT, poll_interval=GSM_POLL_INTERVAL):
-    if ser is None:
+# ---------------- Helper Functions ---------------- #
+def label_for(class_id):
+    class_id = int(class_id)
+    return LABELS[class_id] if class_id < len(LABELS) else f"class_{class_id}"
+
+def roi_boxes(fg_mask, frame):
+    """
+    Crop boxes around the motion blobs of fg_mask, or None when the whole
+    frame should be used (no blobs, too many, or they cover most of it).
+    """
+    frame_h, frame_w = frame.shape[:2]
+    blobs = motion_boxes(fg_mask, ROI_MIN_AREA, ROI_MERGE_GAP)
+    if len(blobs) == 0 or len(blobs) > ROI_MAX_CROPS:
         return None
 
-    print(f"Waiting for SMS reply for up to {timeout} seconds...")
-
-    t_start = time.time()
-    while time.time() - t_start < timeout:
-        try:
-            ser.write(b'AT+CMGF=1\r')
-            time.sleep(0.2)
-            ser.read(ser.in_waiting or 64)
-
-            # first read any pushed URC that might have arrived
-            pushed = ser.read(ser.in_waiting or 0)
-            raw = b""
-            if pushed:
-                raw += pushed
-            ser.write(b'AT+CMGL="ALL"\r')
-            time.sleep(0.6)
-
-            t0 = time.time()
-            while time.time() - t0 < 1.0:
-                raw += ser.read(ser.in_waiting or 1)
-                time.sleep(0.05)
-
-            text = raw.decode(errors='ignore')
-
-            if "+CMGL:" in text or "+CMT:" in text:
-                lines = text.splitlines()
-                i = 0
-                while i < len(lines):
-                    line = lines[i].strip()
-                    if line.startswith("+CMGL:"):
-                        try:
-                            idx = int(line.split(":")[1].split(",")[0].strip())
-                        except:
-                            idx = None
-
-                        body = ""
-                        if i + 1 < len(lines):
-                            body = lines[i + 1].strip()
-
-                        if not body.strip():
-                            i += 2
-                            continue
-
-                        if body.startswith("1"):
-                            clear_all_sms(ser)
-                            return "1"
-                        elif body.startswith("0"):
-                            clear_all_sms(ser)
-                            return "0"
-
-                        if idx is not None:
-                            ser.write(f'AT+CMGD={idx}\r'.encode())
-
-                        i += 2
-                    elif line.startswith("+CMT:"):
-                        # pushed SMS format: +CMT: "<sender>",... then next line body
-                        body = ""
-                        if i + 1 < len(lines):
-                            body = lines[i + 1].strip()
-                        if not body.strip():
-                            i += 2
-                            continue
-                        if body.startswith("1"):
-                            clear_all_sms(ser)
-                            return "1"
-                        elif body.startswith("0"):
-                            clear_all_sms(ser)
-                            return "0"
-                        i += 2
-                    else:
-                        i += 1
-
-            time.sleep(poll_interval)
-
-        except Exception as e:
-            print("GSM poll exception:", e)
-            time.sleep(poll_interval)
-
-    return None
-
-# ---------------- Helper Functions ---------------- #
-def detect_animal(frame):
-    img_resized = cv2.resize(frame, INPUT_SIZE)
-    input_data = np.expand_dims(img_resized.astype(np.float32) / 255.0, axis=0)
-    interpreter.set_tensor(input_details[0]['index'], input_data)
-    interpreter.invoke()
-
-    if len(output_details) == 1:
-        output_data = interpreter.get_tensor(output_details[0]['index'])
-        return process_single_output(output_data)
+    boxes = merge_boxes([expand_box(b, frame_w, frame_h, ROI_PAD, ROI_MIN_SIZE) for b in blobs])
+    area = np.sum((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]))
+    if area > ROI_FULL_FRAME_RATIO * frame_w * frame_h:
+        return None
+    return boxes
+
+def detect_animals_roi(frame, boxes, engine, num_classes=None):
+    """Run the model on letterboxed crops (batched when possible); boxes come back in frame coordinates."""
+    num_classes = num_classes or len(LABELS)
+    frame_size = (frame.shape[1], frame.shape[0])
+    slots = engine.ensure_batch(len(boxes))
+    timings = {"resize": 0.0, "invoke": 0.0}
+    parts = []
+
+    for start in range(0, len(boxes), slots):
+        t0 = time.perf_counter()
+        transforms = [engine.set_input_letterbox(frame, box, slot)
+                      for slot, box in enumerate(boxes[start:start + slots])]
+        t1 = time.perf_counter()
+        engine.invoke()
+        timings["resize"] += t1 - t0
+        timings["invoke"] += time.perf_counter() - t1
+
+        outputs = engine.outputs()
+        for slot, transform in enumerate(transforms):
+            dets = decode_outputs([o[slot:slot + 1] for o in outputs], num_classes,
+                                  CONF_THRESHOLD, engine.input_size)
+            parts.append(map_to_frame(dets, transform, engine.input_size, frame_size))
+        del outputs
+
+    engine.last_timings = timings
+    dets = np.concatenate(parts)
+    # crops can overlap, so the same animal may be reported twice
+    return dets[batched_nms(dets["box"], dets["score"], dets["class_id"])]
+
+def detect_animals(frame, fg_mask=None, engine=None):
+    """
+    Run the model on a frame and return every detection (postprocess.DETECTION_DTYPE).
+    With a foreground mask and ROI_INFERENCE, only the motion regions are examined.
+    `engine` is an interpreter taken from engine_pool; defaults to the first one.
+    """
+    engine = engine or engine_pool.engines[0]
+
+    if ROI_INFERENCE and fg_mask is not None:
+        boxes = roi_boxes(fg_mask, frame)
+        if boxes is not None:
+            return detect_animals_roi(frame, boxes, engine)
+
+    engine.ensure_batch(1)
+    engine.run(frame)
+
+    if len(engine.output_details) == 1:
+        return process_single_output(engine.output(0), engine.input_size)
     else:
-        return process_multiple_outputs(interpreter, output_details)
-
-def process_single_output(output_data):
-    output = np.transpose(output_data[0])
-    scores = output[:, 4:]
-    best_conf, best_class = 0.0, "unknown"
-
-    for i in range(output.shape[0]):
-        class_scores = scores[i]
-        best_idx = np.argmax(class_scores)
-        conf = class_scores[best_idx]
-
-        if conf > best_conf and conf > 0.4:
-            best_conf = conf
-            best_class = LABELS[best_idx] if best_idx < len(LABELS) else f"class_{best_idx}"
+        return process_multiple_outputs(engine.outputs(), engine.input_size)
+
+def cascade_detections(frame, dets, owner=None):
+    """
+    Second opinion on uncertain screening hits (CASCADE_LOW <= score < CASCADE_HIGH):
+    the cascade model examines crops around them and its detections replace
+    them, so a hit it does not confirm is dropped. Confident hits are kept as
+    they are. Returns (detections, number of uncertain hits escalated).
+    """
+    if cascade is None or not len(dets):
+        return dets, 0
+    uncertain = (dets["score"] >= CASCADE_LOW) & (dets["score"] < CASCADE_HIGH)
+    if not uncertain.any():
+        return dets, 0
+
+    frame_h, frame_w = frame.shape[:2]
+    boxes = merge_boxes([expand_box(box, frame_w, frame_h, CASCADE_PAD, ROI_MIN_SIZE)
+                         for box in dets["box"][uncertain]])
+    with cascade.pool.acquire(owner) as eng:
+        second = detect_animals_roi(frame, boxes, eng, cascade.num_classes)
+    class_ids = cascade_classes[second["class_id"]]
+    second = second[class_ids >= 0]
+    second["class_id"] = class_ids[class_ids >= 0]
+
+    escalated = int(uncertain.sum())
+    ESCALATIONS.inc(owner, "confirmed" if len(second) else "rejected", amount=escalated)
+    merged = np.concatenate([dets[~uncertain], second])
+    return merged[batched_nms(merged["box"], merged["score"], merged["class_id"])], escalated
+
+def process_single_output(output_data, input_size=INPUT_SIZE):
+    return decode_yolo(output_data[0], len(LABELS), CONF_THRESHOLD, input_size)
+
+def process_multiple_outputs(outputs, input_size=INPUT_SIZE):
+    return decode_outputs(outputs, len(LABELS), CONF_THRESHOLD, input_size)
 
-    return best_class, best_conf
-
-def process_multiple_outputs(interpreter, output_details):
-    outputs = [interpreter.get_tensor(o['index'])[0] for o in output_details]
-    best_class, best_conf = "unknown", 0.0
-
-    for output in outputs:
-        if output.ndim == 2 and output.shape[1] >= len(LABELS):
-            best_idx = np.argmax(output)
-            best_conf = np.max(output)
-            best_class_idx = best_idx % len(LABELS)
-
-            if best_conf > 0.4:
-                best_class = LABELS[best_class_idx]
-                break
+def should_detect_animal(animal, confidence):
+    """Confidence gate for alerting; de-duplication is done per track by the Tracker."""
+    return confidence >= ALERT_CONFIDENCE
+
+# ---------------- Alert Clips ---------------- #
+clip_recorder = None
+
+def init_clip_recorder():
+    global clip_recorder
+    if ALERT_CLIPS and clip_recorder is None:
+        clip_recorder = ClipRecorder(
+            CLIP_DIR,
+            pre=CLIP_PRE_SECONDS,
+            post=CLIP_POST_SECONDS,
+            fps=CLIP_FPS,
+            idle_fps=CLIP_IDLE_FPS,
+            buffer_bytes=CLIP_BUFFER_MB * 1024 * 1024,
+            quality=CLIP_JPEG_QUALITY,
+            keep=CLIP_KEEP,
+            on_frame=publish_live,
+        )
+        clip_recorder.start()
+    return clip_recorder
 
-    return best_class, best_conf
+def make_clip_feed(camera_id, processors):
+    """Camera on_frame hook: hand frames to the clip buffer (denser while the camera sees motion)."""
+    if clip_recorder is None:
+        return None
 
-def should_detect_animal(animal, confidence):
-    now = time.time()
-    if confidence < 0.8:
-        return False
-    if animal in detected_animals and now - detected_animals[animal] < ALERT_COOLDOWN:
-        return False
-    detected_animals[animal] = now
-    return True
+    def feed(timestamp, frame):
+        processor = processors.get(camera_id)
+        clip_recorder.offer(camera_id, timestamp, frame, active=processor is not None and processor.motion.motion)
+    return feed
+
+def save_jpeg(path, jpeg):
+    # replaced atomically: the viewer never serves a half-written file
+    with open(path + ".tmp", "wb") as f:
+        f.write(jpeg)
+    os.replace(path + ".tmp", path)
+
+def clip_ready(alert_id, path, best, info):
+    """ClipRecorder callback: show and upload the best frame if it is not the alert frame, then the clip."""
+    if info["best_time"] != info["trigger_time"]:
+        save_jpeg(CAPTURE_PATH, best)
+        publish_latest(best)
+        confidence = round(info["best_score"], 4) if info["best_score"] >= 0 else info["confidence"]
+        upload_image(best, camera_id=info["camera_id"], animal=info["animal"], confidence=confidence,
+                     alert_id=alert_id, captured_at=info["best_time"])
+    upload_clip(path, alert_id=alert_id, camera_id=info["camera_id"], animal=info["animal"],
+                captured_at=info["trigger_time"])
+
+# ---------------- Alert Handling ---------------- #
+gsm = None
+_gsm_lock = threading.Lock()
+
+alert_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def init_gsm():
+    """Open the modem once; a failed open is retried by the next caller."""
+    global gsm
+    with _gsm_lock:
+        if gsm is None:
+            gsm = GsmManager.open(GSM_SERIAL_PORT, GSM_BAUDRATE)
+    return gsm
+
+def ask_farmer_via_gsm(record):
+    """
+    Send the alert SMS and return a Future of the farmer's reply ("1" / "0",
+    None if the SMS could not be sent). Never blocks.
+    """
+    if init_gsm() is None:
+        print("GSM unavailable -> playing sound.")
+        failed = Future()
+        failed.set_result(None)
+        return failed
+
+    sms_message = (
+        f"ALERT: {record.animal} detected Near to your farm ({record.camera_id}). "
+        f"Reply 1 to PLAY or 0 to Not play sound ."
+    )
+
+    def sent(ok):
+        if record.trace is not None:
+            record.trace.mark("sms send" if ok else "sms send failed")
+        if ok:
+            ALERT_NOTIFY_SECONDS.observe(time.time() - record.created, "gsm")
+
+    return gsm.ask(GSM_PHONE_NUMBER, sms_message, record.id[-4:].upper(), on_sent=sent)
+
+outbox = None
+sync_worker = None
+
+def init_outbox():
+    """Open the local outbox and start uploading its backlog to Firestore."""
+    global outbox, sync_worker
+    if outbox is None:
+        outbox = Outbox(OUTBOX_PATH, max_bytes=OUTBOX_MAX_BYTES, retention=OUTBOX_RETENTION)
+        sync_worker = SyncWorker(outbox, firebase_client, batch_size=OUTBOX_BATCH_SIZE,
+                                 min_backoff=SYNC_MIN_BACKOFF, max_backoff=SYNC_MAX_BACKOFF)
+        sync_worker.start()
+    return outbox
+
+def record_detection(camera_id, track, now):
+    """Log a newly confirmed track in the outbox (detection history)."""
+    if outbox is None:
+        return
+    outbox.record("detections", f"{camera_id}_{int(now * 1000)}_{track.id}", {
+        "animal": label_for(track.class_id),
+        "confidence": track.best_score,
+        "box": [round(float(v), 4) for v in track.box],
+        "track_id": track.id,
+        "camera_id": camera_id,
+        "timestamp": encode_time(now),
+    })
+
+def play_alarm(record):
+    if ALARM_PATTERNS:
+        play_deterrent(ALARM_SECONDS)
+    else:
+        play_sound("warning")
+
+def init_alert_dispatcher():
+    global alert_dispatcher
+    if startup is not None:
+        startup.wait("firebase", FIREBASE_INIT_TIMEOUT)
+    with _dispatcher_lock:
+        if alert_dispatcher is not None:
+            return alert_dispatcher
+        alert_dispatcher = AlertDispatcher(
+            db,
+            AlertStore(ALERT_STATE_PATH),
+            play_alarm=play_alarm,
+            ask_via_gsm=ask_farmer_via_gsm,
+            timeout=FIRESTORE_REPLY_TIMEOUT,
+            gsm_timeout=GSM_REPLY_TIMEOUT,
+            poll_interval=FIRESTORE_POLL_INTERVAL,
+            retries=ALERT_RETRIES,
+            retry_delay=ALERT_RETRY_DELAY,
+            outbox=init_outbox(),
+            on_change=report_alert_change if REPORT_ALERT_EVENTS else None,
+        ).start()
+    return alert_dispatcher
+
+def start_alert_trace(alert, camera_id):
+    """
+    Trace of an alert beginning when detection started on its frame; the
+    per-stage detection times are reconstructed from the alert's timings.
+    Frame timestamps follow the camera's clock (replay time in the benchmark),
+    so how long the frame waited is only recorded as the capture_age_s
+    attribute rather than mixed into the wall-clock timeline.
+    """
+    detected_at = alert.get("detected_at", time.time())
+    stages = [(stage, alert["timings"][stage]) for stage in ("motion", "resize", "invoke", "decode", "cascade")
+              if stage in alert.get("timings", {})]
+    at = detected_at - sum(seconds for _, seconds in stages)
+    capture_age = alert.get("capture_age", detected_at - alert.get("time", detected_at))
+    trace = metrics.TRACER.start("alert", start=at, camera=camera_id, animal=alert["animal"],
+                                 capture_age_s=round(capture_age, 3))
+    if trace is None:
+        return trace
+    for stage, seconds in stages:
+        at += seconds
+        trace.mark(stage, at)
+    trace.mark("alert queue")
+    return trace
+
+def handle_alert(alert):
+    """Encode and queue the frame for upload, then hand the threat to the alert dispatcher (returns at once)."""
+    animal = alert["animal"]
+    confidence = alert["confidence"]
+    frame = alert["frame"]
+    camera_id = alert.get("camera_id", CAMERA_SOURCES[0]["id"])
+    trace = start_alert_trace(alert, camera_id)
+
+    print(f"Threat on {camera_id}: {animal} ({confidence*100:.1f}%)")
+    for det in alert.get("detections", [])[1:]:
+        print(f"  also in frame: {det['animal']} ({det['confidence']*100:.1f}%) at {det['box']}")
+
+    alert_id = new_alert_id(camera_id)
+    image_path = os.path.join(ALERT_IMAGE_DIR, f"{alert_id}.jpg")
+    ok, jpeg = cv2.imencode(".jpg", frame)
+    if ok:
+        jpeg = jpeg.tobytes()
+        upload_image(jpeg, camera_id=camera_id, animal=animal, confidence=float(confidence),
+                     alert_id=alert_id, captured_at=alert.get("time", time.time()))
+        # local copies for the LAN viewer and the outbox history
+        os.makedirs(ALERT_IMAGE_DIR, exist_ok=True)
+        for path in (CAPTURE_PATH, image_path):
+            save_jpeg(path, jpeg)
+        publish_latest(jpeg)
+        print(f"Image saved to {CAPTURE_PATH}")
+    else:
+        image_path = None
+    if trace is not None:
+        trace.mark("encode and save")
+
+    if clip_recorder is not None:
+        clip_recorder.request(camera_id, alert_id, alert.get("time", time.time()), clip_ready,
+                              animal=animal, confidence=float(confidence))
+
+    return init_alert_dispatcher().submit(
+        animal, float(confidence), camera_id,
+        alert_id=alert_id,
+        image=image_path,
+        detections=alert.get("detections"),
+        trace=trace,
+    )
+
+# ---------------- Frame Processing ---------------- #
+class FrameProcessor:
+    """Motion gate + inference + tracking + alert gating for one camera stream."""
+
+    def __init__(self, camera_id=None, pool=None, ignore=(), ignore_mask=None):
+        self.camera_id = camera_id or CAMERA_SOURCES[0]["id"]
+        self.pool = pool
+        self.motion = MotionDetector(
+            MOTION_ALGORITHM,
+            scale=MOTION_SCALE,
+            on_threshold=MOTION_THRESHOLD,
+            off_threshold=MOTION_OFF_THRESHOLD,
+            idle_stride=MOTION_IDLE_STRIDE,
+            ignore=ignore,
+            ignore_image=ignore_mask,
+        )
+        self.scheduler = DetectionScheduler(
+            MOTION_THRESHOLD,
+            base_interval=DETECTION_BASE_INTERVAL,
+            min_interval=DETECTION_MIN_INTERVAL,
+            max_interval=DETECTION_MAX_INTERVAL,
+            duty_cycle=INFERENCE_DUTY_CYCLE,
+            temp_soft=THERMAL_SOFT_LIMIT,
+            temp_hard=THERMAL_HARD_LIMIT,
+            camera_id=self.camera_id,
+        )
+        self.tracker = Tracker(
+            iou_threshold=TRACK_IOU_THRESHOLD,
+            centroid_gate=TRACK_CENTROID_GATE,
+            # a track must outlive the longest gap between two inferences, or the
+            # same animal comes back as a new, immediately confirmed track
+            max_age=max(TRACK_MAX_AGE, 1.5 * self.scheduler.max_interval),
+            min_hits=TRACK_MIN_HITS,
+            confirm_score=ALERT_CONFIDENCE,
+        )
+        self.last_timings = {}
+        self.last_motion_pixels = 0
+        self.last_detections = None
+        self.last_alerts = {}  # animal -> time of its last alert on this camera
+
+    def process(self, frame, now=None):
+        """
+        Returns the list of alerts raised by this frame.
+        `now` lets replayed footage use its own clock; per-stage durations of
+        the call are left in `last_timings`.
+        """
+        if now is None:
+            now = time.time()
+        alerts = []
+        timings = self.last_timings = {}
+
+        t0 = time.perf_counter()
+        in_motion = self.motion.update(frame)
+        if self.motion.skipped:
+            FRAMES.inc(self.camera_id, "skipped")
+        else:
+            timings["motion"] = time.perf_counter() - t0
+            motion_pixels = self.last_motion_pixels = self.motion.pixels
+            FRAME_STAGE_SECONDS.observe(timings["motion"], self.camera_id, "motion")
+            MOTION_PIXELS.observe(motion_pixels, self.camera_id)
+
+        if not in_motion:
+            if not self.motion.skipped:
+                FRAMES.inc(self.camera_id, "quiet")
+            self.scheduler.on_quiet(now)
+            self.tracker.predict(now)
+            self.tracker.prune(now)
+            return alerts
+
+        pool = self.pool or engine_pool
+        if pool is None:
+            # model still loading in the background: motion detection only
+            FRAMES.inc(self.camera_id, "motion")
+            self.tracker.predict(now)
+            return alerts
+
+        if not self.scheduler.should_run(now, motion_pixels, settled=self.tracker.all_alerted()):
+            # keep tracks moving between detection frames
+            FRAMES.inc(self.camera_id, "motion")
+            self.tracker.predict(now)
+            return alerts
+
+        with pool.acquire(self.camera_id) as eng:
+            t0 = time.perf_counter()
+            dets = detect_animals(frame, self.motion.full_mask(frame) if ROI_INFERENCE else None, eng)
+            detect_time = time.perf_counter() - t0
+            engine_timings = eng.last_timings
+        timings.update(engine_timings)
+        timings["decode"] = detect_time - sum(engine_timings.values())
+        timings["detect"] = detect_time
+
+        if cascade is not None:
+            t0 = time.perf_counter()
+            dets, escalated = cascade_detections(frame, dets, self.camera_id)
+            if escalated:
+                timings["cascade"] = time.perf_counter() - t0
+                detect_time += timings["cascade"]
+        self.last_detections = dets
+        FRAMES.inc(self.camera_id, "inference")
+        for stage, seconds in timings.items():
+            if stage != "motion":
+                FRAME_STAGE_SECONDS.observe(seconds, self.camera_id, stage)
+        if len(dets):
+            class_ids, counts = np.unique(dets["class_id"], return_counts=True)
+            for class_id, count in zip(class_ids, counts):
+                DETECTIONS.inc(self.camera_id, label_for(class_id), amount=int(count))
+        self.scheduler.record_inference(now, detect_time, float(dets["score"].max()) if len(dets) else 0.0)
+
+        for track in self.tracker.update(dets, now):
+            print(f"[{self.camera_id}] Detected: {label_for(track.class_id)} "
+                  f"({track.best_score*100:.1f}%) track #{track.id}")
+            record_detection(self.camera_id, track, now)
+
+        # one alert per animal: every confirmed track seen in this frame alerts once,
+        # unless the same animal already alerted on this camera within ALERT_COOLDOWN
+        # (a track lost during a long motion pause comes back as a new one)
+        threats = []
+        for track in self.tracker.active():
+            if track.alerted or track.last_seen != now:
+                continue
+            animal = label_for(track.class_id)
+            if animal.lower() in THREAT_ANIMALS and should_detect_animal(animal, track.best_score):
+                track.alerted = True
+                last = self.last_alerts.get(animal)
+                if last is not None and 0 <= now - last < ALERT_COOLDOWN:
+                    print(f"[{self.camera_id}] {animal} track #{track.id} within the alert cooldown")
+                    continue
+                threats.append({
+                    "animal": animal,
+                    "confidence": track.best_score,
+                    "box": track.box.tolist(),
+                    "track_id": track.id,
+                })
+
+        if threats:
+            for threat in threats:
+                self.last_alerts[threat["animal"]] = now
+            best = max(threats, key=lambda t: t["confidence"])
+            ALERTS.inc(self.camera_id, best["animal"])
+            alerts.append({
+                "animal": best["animal"],
+                "confidence": best["confidence"],
+                "detections": threats,
+                "frame": frame,
+                "time": now,
+                "camera_id": self.camera_id,
+                "timings": dict(timings),     # for the alert's trace
+                "detected_at": time.time(),
+            })
+
+        return alerts
+
+# ---------------- Pipeline Stages ---------------- #
+def make_detection_step(processor, frame_queue, alert_queue, camera=None):
+    def step():
+        item = frame_queue.get(timeout=QUEUE_GET_TIMEOUT)
+        if item is None:
+            return
+        timestamp, frame = item
+        if camera is not None:
+            camera.processed += 1
+        if startup is not None and camera is not None and camera.processed == 1:
+            startup.mark(f"first frame {camera.id}")
+        alerts = processor.process(frame, timestamp)
+        if clip_recorder is not None and camera is not None and "detect" in processor.last_timings \
+                and len(processor.last_detections):
+            # frames the model looked at are kept with their score, for the best-frame choice
+            clip_recorder.offer(camera.id, timestamp, frame, score=float(processor.last_detections["score"].max()))
+        for alert in alerts:
+            if not alert_queue.put(alert):
+                print(f"Alert queue full -> dropped alert for {alert['animal']}")
+    return step
+
+def make_alert_step(alert_queue):
+    def step():
+        alert = alert_queue.get(timeout=QUEUE_GET_TIMEOUT)
+        if alert is not None:
+            handle_alert(alert)
+    return step
 
 # ---------------- Main Loop ---------------- #
-def main():
+def main(profile_startup=False):
+    """
+    Cameras and motion detection start at once; the model, Firebase (then
+    the alert dispatcher), audio, GSM and the image viewer initialize in
+    background threads. --profile-startup profiles those steps and exits
+    once everything is up and every camera has delivered a frame.
+    """
+    global startup
+    startup = Startup(profile=profile_startup, origin=IMPORT_STARTED)
+    startup.mark("imports done", IMPORT_SECONDS)
+    metrics.TRACER.enabled = ALERT_TRACING
+    metrics.TRACER.sample_rate = TRACE_SAMPLE_RATE
+    metrics.TRACER.slow_seconds = TRACE_SLOW_SECONDS
     print("Starting ChFarmGuard Headless Mode")
-    print(f"Using alert ID: {ALERT_DOC_ID}")
-
-    start_image_server()
-    time.sleep(3)
-
-    cap = cv2.VideoCapture(0)
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-
-    back_sub = cv2.createBackgroundSubtractorMOG2(history=100, varThreshold=50)
-
-    frame_count = 0
-    last_alert_time = 0
-    gsm_serial = None
-
-    while True:
-        try:
-            ret, frame = cap.read()
-            if not ret:
-                print("Camera read error.")
-                break
-
-            fg_mask = back_sub.apply(frame)
-            motion_pixels = cv2.countNonZero(fg_mask)
-
-            if motion_pixels > MOTION_THRESHOLD:
-                frame_count += 1
-
-                if frame_count % DETECTION_INTERVAL == 0:
-                    animal, confidence = detect_animal(frame)
-                    if should_detect_animal(animal, confidence):
-                        print(f"Detected: {animal} ({confidence*100:.1f}%)")
-
-                        if animal.lower() in THREAT_ANIMALS and confidence > 0.6:
-                            now = time.time()
-
-                            if now - last_alert_time > 15:
-                                print(f"Threat: {animal} ({confidence*100:.1f}%)")
-
-                                cv2.imwrite(CAPTURE_PATH, frame)
-                                print(f"Image saved to {CAPTURE_PATH}")
-
-                                upload_to_flask(CAPTURE_PATH)
-
-                                conf_val = float(confidence)
-                                online = send_alert_to_firestore(db, animal, conf_val, ALERT_DOC_ID)
-
-                                if online:
-                                    print("Waiting for farmer response (5 min)...")
-                                    wait_start = time.time()
-                                    responded = False
-
-                                    while time.time() - wait_start < 300:
-                                        resp = check_alert_response(db, ALERT_DOC_ID)
-                                        if resp == "PLAY":
-                                            play_sound("warning")
-                                            update_alert_status(db, ALERT_DOC_ID, "PROCESSED")
-                                            responded = True
-                                            break
-                                        elif resp == "NOT_PLAY":
-                                            update_alert_status(db, ALERT_DOC_ID, "PROCESSED")
-                                            responded = True
-                                            break
-                                        time.sleep(5)
-
-                                    if not responded:
-                                        print("No response -> auto-play.")
-                                        update_alert_status(db, ALERT_DOC_ID, "PROCESSED")
-                                        play_sound("warning")
-
-                                else:
-                                    print("Firebase offline -> GSM mode.")
-
-                                    if gsm_serial is None:
-                                        gsm_serial = init_gsm()
-
-                                    clear_all_sms(gsm_serial)
-
-                                    sms_message = (
-                                        f"ALERT: {animal} detected Near to your farm. "
-                                        f"Reply 1 to PLAY or 0 to Not play sound ."
-                                    )
-
-                                    sent = send_sms_via_gsm(gsm_serial, GSM_PHONE_NUMBER, sms_message)
-
-                                    if not sent:
-                                        print("Failed SMS -> playing sound.")
-                                        play_sound("warning")
-                                    else:
-                                        print("SMS sent -> waiting for reply...")
-
-                                        reply = poll_gsm_for_reply(
-                                            gsm_serial,
-                                            timeout=GSM_REPLY_TIMEOUT,
-                                            poll_interval=GSM_POLL_INTERVAL
-                                        )
-
-                                        if reply == "1":
-                                            print("Farmer replied 1 -> playing sound.")
-                                            play_sound("warning")
-                                        elif reply == "0":
-                                            print("Farmer replied 0 -> skipping sound.")
-                                        else:
-                                            print("No SMS reply -> playing sound.")
-                                            play_sound("warning")
-
-                                    try:
-                                        update_alert_status(db, ALERT_DOC_ID, "PROCESSED")
-                                    except:
-                                        pass
-
-                                last_alert_time = now
-
-            else:
-                frame_count = 0
-
-        except Exception as e:
-            print("Error in loop:", e)
-            traceback.print_exc()
-            time.sleep(2)
-
-    cap.release()
+    print(f"Alert state: {ALERT_STATE_PATH}")
+
+    startup.run("model", load_model)
+    startup.run("cascade model", load_cascade_model, after=("model",))
+    startup.run("firebase", connect_firebase)
+    startup.run("audio", init_audio)  # decoded now so the first alarm starts in milliseconds
+    startup.run("alerts", init_alert_dispatcher, after=("firebase",))
+    startup.run("gsm", init_gsm)
+    if IMAGE_VIEWER:
+        startup.run("viewer", start_image_server)
+
+    init_clip_recorder()
+    pipeline = Pipeline()
+    alert_queue = pipeline.add_queue("alerts", ALERT_QUEUE_SIZE, DROP_NEWEST)
+
+    cameras, processors, capture_stages = [], {}, []
+    for config in CAMERA_SOURCES:
+        frame_queue = pipeline.add_queue(f"frames:{config['id']}", FRAME_QUEUE_SIZE, DROP_OLDEST)
+        camera = Camera(config, frame_queue, on_frame=make_clip_feed(config["id"], processors))
+        # picks up engine_pool once the model is loaded
+        processor = FrameProcessor(camera.id, ignore=config.get("ignore", ()), ignore_mask=config.get("ignore_mask"))
+        cameras.append(camera)
+        processors[camera.id] = processor
+
+        capture_stages.append(pipeline.add_stage(f"capture:{camera.id}", camera.capture_step))
+        pipeline.add_stage(f"detection:{camera.id}",
+                           make_detection_step(processor, frame_queue, alert_queue, camera))
+
+    startup.mark("cameras opened")
+    metrics.QUEUE_DEPTH.set_function(lambda: {(name,): q["size"] for name, q in pipeline.stats().items()})
+    metrics.QUEUE_DROPPED.set_function(lambda: {(name,): q["dropped"] for name, q in pipeline.stats().items()})
+    alert_stage = pipeline.add_stage("alerts", make_alert_step(alert_queue))
+    pipeline.start()
+    startup.mark("pipeline started")
+    print(f"Watching {len(cameras)} camera(s); model loading in the background")
+
+    def report():
+        print("Pipeline stats:", pipeline.stats())
+        if engine_pool is not None:
+            print("Models:", model_registry.stats())
+        if alert_dispatcher is not None:
+            print("Alerts:", alert_dispatcher.stats())
+        if sync_worker is not None:
+            print("Outbox:", sync_worker.stats())
+        if uploader is not None:
+            print("Uploads:", uploader.stats())
+        if event_reporter is not None:
+            print("Alert events:", event_reporter.stats())
+        if clip_recorder is not None:
+            print("Clips:", clip_recorder.stats())
+        for camera in cameras:
+            print(f"Camera {camera.id}:", camera.stats(),
+                  "motion:", processors[camera.id].motion.stats(),
+                  "scheduler:", processors[camera.id].scheduler.stats())
+
+    last_stats = time.time()
+    startup_reported = False
+    try:
+        # a dead camera does not stop the others
+        while alert_stage.is_alive() and any(s.is_alive() for s in capture_stages):
+            time.sleep(0.1 if not startup_reported else 1)
+            first_frames = all(f"first frame {c.id}" in startup.marks for c in cameras)
+            if not startup_reported and startup.done() and \
+                    (first_frames or startup.elapsed() > STARTUP_REPORT_TIMEOUT):
+                startup_reported = True
+                startup.report()
+                if profile_startup:
+                    startup.print_profiles()
+                    break
+            if time.time() - last_stats >= STATS_INTERVAL:
+                last_stats = time.time()
+                report()
+    except KeyboardInterrupt:
+        print("Stopping ChFarmGuard...")
+
+    pipeline.stop()
+    if alert_dispatcher is not None:
+        alert_dispatcher.stop(wait=False)
+    report()
+    if sync_worker is not None:
+        sync_worker.stop()
+    if clip_recorder is not None:
+        clip_recorder.stop()
+    if uploader is not None:
+        uploader.stop()
+    if clip_uploader is not None:
+        clip_uploader.stop()
+    if event_reporter is not None:
+        event_reporter.stop()
+
+    for camera in cameras:
+        camera.release()
 
     try:
-        if gsm_serial:
-            gsm_serial.close()
+        if gsm:
+            gsm.close()
     except:
         pass
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(profile_startup="--profile-startup" in sys.argv)
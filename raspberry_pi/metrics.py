@@ -0,0 +1,311 @@
+# metrics.py
+"""
+Prometheus-style counters, gauges and histograms for the Pi agent, rendered
+in the text exposition format by the image viewer's /metrics, plus sampled
+tracing of alerts (/traces).
+"""
+import bisect
+import collections
+import random
+import threading
+import time
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds; covers a motion-gate pass (<1 ms) up to an alert waiting on a weak network
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+MOTION_BUCKETS = (100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 200000, 400000)
+SIZE_BUCKETS = (16384, 65536, 131072, 262144, 524288, 1048576, 4194304)
+THERMAL_ZONE_PATH = "/sys/class/thermal/thermal_zone0/temp"
+
+
+def read_cpu_temperature(path=THERMAL_ZONE_PATH):
+    """CPU temperature in °C, or None when the sensor is not available."""
+    try:
+        with open(path, "r") as f:
+            return int(f.read().strip()) / 1000.0
+    except (OSError, ValueError):
+        return None
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# ---------------- Metrics ---------------- #
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in list(self.metrics):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+
+class Counter(_Metric):
+    """Monotonic count; label values are passed positionally: inc("goat")."""
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(v)}" for key, v in items]
+
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down. With set_function(fn) it is read at
+    scrape time instead: fn returns a number, or {label values: number}.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), registry=REGISTRY, fn=None):
+        super().__init__(name, help, labels, registry)
+        self.fn = fn
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def set_function(self, fn):
+        self.fn = fn
+
+    def samples(self):
+        if self.fn is not None:
+            try:
+                value = self.fn()
+            except Exception:
+                value = None
+            items = sorted(value.items()) if isinstance(value, dict) else [((), value)]
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(v)}" for key, v in items if v is not None]
+
+
+class Histogram(_Metric):
+    """Bucketed observations; observe() is a bisect and three additions under a lock."""
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), registry=REGISTRY, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, *labels):
+        entry = self._values.get(labels)
+        return entry[2] if entry else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total, n)) for key, (counts, total, n) in self._values.items())
+        lines = []
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = _labels(self.labelnames, key, [("le", _number(bound))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {n}")
+        return lines
+
+
+# ---------------- Catalog ---------------- #
+FRAME_STAGE_SECONDS = Histogram("farmguard_frame_stage_seconds",
+                                "Time per frame stage (capture, motion, resize, invoke, decode, detect, cascade).",
+                                ("camera", "stage"))
+FRAMES = Counter("farmguard_frames_total", "Frames processed, by outcome (skipped, quiet, motion, inference).",
+                 ("camera", "outcome"))
+MOTION_PIXELS = Histogram("farmguard_motion_pixels", "Foreground pixels per examined frame (full-frame units).",
+                          ("camera",), buckets=MOTION_BUCKETS)
+DETECTIONS = Counter("farmguard_detections_total", "Model detections above the confidence threshold, by class.",
+                     ("camera", "animal"))
+SCHEDULER_DECISIONS = Counter("farmguard_scheduler_decisions_total",
+                              "Detection scheduler decisions on motion frames, by decision (run, skip) and reason.",
+                              ("camera", "decision", "reason"))
+ESCALATIONS = Counter("farmguard_cascade_escalations_total",
+                      "Uncertain screening hits re-examined by the cascade model, by outcome (confirmed, rejected).",
+                      ("camera", "outcome"))
+ALERTS = Counter("farmguard_alerts_total", "Alerts raised, by animal.", ("camera", "animal"))
+ALERT_STATES = Counter("farmguard_alert_transitions_total", "Alert state transitions.", ("state", "channel"))
+FIRESTORE_WRITE_SECONDS = Histogram("farmguard_firestore_write_seconds", "Alert document writes to Firestore.",
+                                    ("result",))
+ALERT_NOTIFY_SECONDS = Histogram("farmguard_alert_notify_seconds",
+                                 "Alert created until the farmer was notified, by channel.", ("channel",))
+ALERT_ROUNDTRIP_SECONDS = Histogram("farmguard_alert_roundtrip_seconds",
+                                    "Alert created until it was decided, by channel and decision.",
+                                    ("channel", "decision"))
+SMS_SEND_SECONDS = Histogram("farmguard_sms_send_seconds", "AT+CMGS until the modem confirmed the SMS.", ("result",))
+SMS_REPLY_SECONDS = Histogram("farmguard_sms_reply_seconds", "SMS question sent until the farmer's reply arrived.")
+UPLOAD_BYTES = Counter("farmguard_upload_bytes_total", "JPEG bytes uploaded to the cloud API.")
+UPLOAD_FAILURES = Counter("farmguard_upload_failures_total", "Failed upload attempts.", ("reason",))
+UPLOAD_SECONDS = Histogram("farmguard_upload_seconds", "Successful image upload requests.")
+UPLOAD_SIZE = Histogram("farmguard_upload_size_bytes", "Size of uploaded JPEGs.", buckets=SIZE_BUCKETS)
+CLIP_ENCODE_SECONDS = Histogram("farmguard_clip_encode_seconds", "JPEG encoding of a frame for the clip buffer.")
+CLIPS = Counter("farmguard_clips_total", "Alert clips written, by result.", ("result",))
+PREVIEW_FRAMES = Counter("farmguard_preview_frames_total",
+                        "Live preview frames sent to viewers, or dropped for a client that was not ready.",
+                        ("camera", "result"))
+PREVIEW_CLIENTS = Gauge("farmguard_preview_clients", "Open live preview streams.", ("camera",))
+QUEUE_DEPTH = Gauge("farmguard_queue_depth", "Items waiting in a pipeline queue.", ("queue",))
+QUEUE_DROPPED = Gauge("farmguard_queue_dropped", "Items dropped by a full pipeline queue.", ("queue",))
+CPU_TEMPERATURE = Gauge("farmguard_cpu_temperature_celsius", "SoC temperature (read at scrape time).",
+                        fn=read_cpu_temperature)
+UPTIME = Gauge("farmguard_uptime_seconds", "Seconds since the agent started.",
+               fn=lambda started=time.time(): time.time() - started)
+
+
+# ---------------- Tracing ---------------- #
+class Trace:
+    """
+    Timeline of one alert as consecutive segments: mark(name) closes the
+    segment that started at the previous mark (or the trace start).
+    Segments marked `wait` (the farmer thinking) do not count towards `busy`.
+    """
+
+    def __init__(self, tracer, name, start, attrs, sampled):
+        self.tracer = tracer
+        self.name = name
+        self.start = start
+        self.attrs = attrs
+        self.sampled = sampled
+        self.marks = []  # (segment, end time, wait)
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def mark(self, segment, at=None, wait=False):
+        with self._lock:
+            self.marks.append((segment, time.time() if at is None else at, wait))
+
+    def segments(self):
+        with self._lock:
+            marks = sorted(self.marks, key=lambda m: m[1])
+        previous = self.start
+        for segment, end, wait in marks:
+            yield segment, previous, end, wait
+            previous = max(previous, end)
+
+    def duration(self):
+        end = self.finished if self.finished is not None else time.time()
+        return end - self.start
+
+    def busy(self):
+        return sum(end - start for _, start, end, wait in self.segments() if not wait)
+
+    def finish(self, at=None):
+        if self.finished is None:
+            self.finished = time.time() if at is None else at
+            self.tracer._finished(self)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "start": self.start,
+            "duration_s": round(self.duration(), 4),
+            "busy_s": round(self.busy(), 4),
+            "attrs": self.attrs,
+            "segments": [{"name": name, "offset_s": round(start - self.start, 4),
+                          "duration_s": round(end - start, 4), "wait": wait}
+                         for name, start, end, wait in self.segments()],
+        }
+
+    def format(self):
+        lines = [f"Trace {self.name} {self.attrs}: {self.duration():.2f}s ({self.busy():.2f}s excluding waits)"]
+        for name, start, end, wait in self.segments():
+            lines.append(f"  +{start - self.start:8.3f}s  {name:<28} {(end - start) * 1000:9.1f} ms"
+                         f"{'  (wait)' if wait else ''}")
+        return "\n".join(lines)
+
+
+class Tracer:
+    """
+    Keeps the last `keep` finished traces that were sampled (`sample_rate`)
+    or slow (more than `slow_seconds` of non-waiting time); slow ones are
+    also printed, so the log shows where the time went.
+    """
+
+    def __init__(self, sample_rate=0.1, slow_seconds=5.0, keep=50, enabled=True):
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.enabled = enabled
+        self.recent = collections.deque(maxlen=keep)
+        self.started = 0
+        self.slow = 0
+
+    def start(self, name, start=None, **attrs):
+        """A new trace, or None when tracing is disabled."""
+        if not self.enabled:
+            return None
+        self.started += 1
+        return Trace(self, name, time.time() if start is None else start, attrs,
+                     random.random() < self.sample_rate)
+
+    def _finished(self, trace):
+        slow = self.slow_seconds is not None and trace.busy() > self.slow_seconds
+        if slow:
+            self.slow += 1
+            print(f"Slow {trace.format()}")
+        if slow or trace.sampled:
+            self.recent.append(trace)
+
+    def traces(self):
+        return [trace.to_dict() for trace in list(self.recent)]
+
+
+TRACER = Tracer()
@@ -0,0 +1,106 @@
+# model_registry.py
+import os
+import threading
+import time
+
+import numpy as np
+
+from inference import InferenceEngine, EnginePool
+
+
+class Model:
+    """A loaded detection model: its interpreter pool, labels and warm-up timings."""
+
+    def __init__(self, name, path, labels, pool, load_s, warmup_ms):
+        self.name = name
+        self.path = path
+        self.labels = labels
+        self.pool = pool
+        self.load_s = load_s
+        self.warmup_ms = warmup_ms  # batch size -> ms per warm-up invoke; the first is the cold start
+
+    @property
+    def num_classes(self):
+        return len(self.labels)
+
+    def class_map(self, labels):
+        """Index of each of this model's classes in `labels` (-1 when `labels` lacks it)."""
+        index = {label: i for i, label in enumerate(labels)}
+        return np.array([index.get(label, -1) for label in self.labels], dtype=np.int32)
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "classes": self.num_classes,
+            "input_size": list(self.pool.engines[0].input_size),
+            "load_s": round(self.load_s, 3),
+            "warmup_ms": {batch: [round(ms, 1) for ms in times] for batch, times in self.warmup_ms.items()},
+            "pool": self.pool.stats(),
+        }
+
+
+def read_labels(path):
+    with open(path, "r") as f:
+        return [line.strip().lower() for line in f if line.strip()]
+
+
+class ModelRegistry:
+    """
+    Named TFLite detection models loaded once at startup.
+
+    Each model is invoked `warmup_runs` times on a blank frame as soon as it
+    is loaded, so the interpreter's one-off costs (tensor allocation, XNNPACK
+    weight packing, first-touch page faults) are paid before the first real
+    frame instead of delaying the first alert. Engines that batch ROI crops
+    are warmed up at their max_batch first, then left at batch 1 for the
+    full-frame path.
+    """
+
+    def __init__(self, warmup_runs=2):
+        self.warmup_runs = warmup_runs
+        self.models = {}
+        self._lock = threading.Lock()
+
+    def load(self, name, model_path, labels_path, num_threads=None, input_size=None, max_batch=1, workers=1):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"model {name} not found: {model_path}")
+        t0 = time.perf_counter()
+        labels = read_labels(labels_path)
+        pool = EnginePool([
+            InferenceEngine(model_path, num_threads=num_threads, input_size=input_size, max_batch=max_batch)
+            for _ in range(workers)
+        ])
+        # every worker is warmed up; the first one's timings are reported
+        warmup_ms = [self.warm_up(engine) for engine in pool.engines][0]
+        model = Model(name, model_path, labels, pool, time.perf_counter() - t0, warmup_ms)
+        with self._lock:
+            self.models[name] = model
+        warmups = "; ".join(f"batch {batch}: {', '.join(f'{ms:.0f}' for ms in times)}"
+                            for batch, times in warmup_ms.items())
+        print(f"Model {name} ready in {model.load_s:.2f}s (warm-up {warmups} ms)")
+        return model
+
+    def warm_up(self, engine):
+        """Warm-up invoke times in ms, by batch size: max_batch (if above 1), then 1."""
+        width, height = engine.input_size
+        blank = np.zeros((height, width, 3), np.uint8)
+        times = {}
+        for batch in sorted({engine.max_batch, 1}, reverse=True):
+            engine.ensure_batch(batch, force=True)
+            times[batch] = []
+            for _ in range(self.warmup_runs):
+                t0 = time.perf_counter()
+                for slot in range(batch):
+                    engine.set_input(blank, slot)
+                engine.invoke()
+                engine.outputs()
+                times[batch].append((time.perf_counter() - t0) * 1000)
+        engine.last_timings = {}
+        return times
+
+    def get(self, name):
+        return self.models.get(name)
+
+    def stats(self):
+        with self._lock:
+            return {name: model.stats() for name, model in self.models.items()}
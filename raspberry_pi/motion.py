@@ -0,0 +1,153 @@
+# motion.py
+import cv2
+import numpy as np
+
+MOG2 = "mog2"
+KNN = "knn"
+DIFF = "diff"
+ALGORITHMS = (MOG2, KNN, DIFF)
+
+
+def ignore_mask(size, polygons=(), image_path=None):
+    """
+    uint8 mask of `size` (w, h): 255 where motion counts, 0 where it is ignored.
+    `polygons` are lists of (x, y) points normalised to [0, 1] of the frame;
+    `image_path` is a mask picture of any resolution where black is ignored.
+    """
+    w, h = size
+    mask = np.full((h, w), 255, np.uint8)
+    for polygon in polygons:
+        points = np.round(np.asarray(polygon, np.float32) * [w - 1, h - 1]).astype(np.int32)
+        cv2.fillPoly(mask, [points], 0)
+    if image_path:
+        image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            print(f" Could not read ignore mask {image_path}, watching the whole frame.")
+        else:
+            image = cv2.resize(image, (w, h), interpolation=cv2.INTER_NEAREST)
+            mask[image < 128] = 0
+    return mask
+
+
+class MotionDetector:
+    """
+    Cheap motion gate in front of the model.
+
+    Every examined frame is converted to grayscale and shrunk by `scale`
+    (640x480 -> 160x120 at 0.25) before background subtraction, with
+    MOG2, KNN or differencing against a running average ("diff", the
+    cheapest). Foreground in ignored regions (swaying trees, a road) is
+    cleared. `pixels` is reported in full-frame pixels, so the thresholds
+    do not depend on the scale.
+
+    Hysteresis: motion starts above `on_threshold` pixels and lasts until
+    the count drops to `off_threshold` or below. While the scene is quiet
+    only every `idle_stride`-th frame is examined; the others cost nothing.
+    """
+
+    def __init__(self, algorithm=MOG2, scale=0.25, on_threshold=2500, off_threshold=None, idle_stride=1,
+                 ignore=(), ignore_image=None, history=100, var_threshold=50, diff_threshold=25,
+                 diff_alpha=0.05):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"unknown motion algorithm {algorithm!r}, expected one of {ALGORITHMS}")
+        self.algorithm = algorithm
+        self.scale = scale
+        self.on_threshold = on_threshold
+        self.off_threshold = off_threshold if off_threshold is not None else on_threshold
+        self.idle_stride = max(1, int(idle_stride))
+        self.ignore = ignore
+        self.ignore_image = ignore_image
+        self.history = history
+        self.var_threshold = var_threshold
+        self.diff_threshold = diff_threshold
+        self.diff_alpha = diff_alpha
+
+        if algorithm == MOG2:
+            self.subtractor = cv2.createBackgroundSubtractorMOG2(history=history, varThreshold=var_threshold)
+        elif algorithm == KNN:
+            self.subtractor = cv2.createBackgroundSubtractorKNN(history=history)
+        else:
+            self.subtractor = None
+        self._background = None  # running average for DIFF
+        self._size = None        # (w, h) of the downscaled frame
+        self._mask = None        # ignore mask at that size, None when nothing is ignored
+        self._area_ratio = 1.0   # full-frame pixels per downscaled pixel
+
+        self.motion = False
+        self.pixels = 0
+        self.fg_mask = None      # foreground of the last examined frame, downscaled
+        self.skipped = False
+        self._frame_index = 0
+        self.examined = 0
+        self.skipped_frames = 0
+        self.episodes = 0
+
+    def _setup(self, frame):
+        h, w = frame.shape[:2]
+        if self.scale >= 1.0:
+            self._size = (w, h)
+        else:
+            self._size = (max(1, int(round(w * self.scale))), max(1, int(round(h * self.scale))))
+        self._area_ratio = (w * h) / float(self._size[0] * self._size[1])
+        if self.ignore or self.ignore_image:
+            self._mask = ignore_mask(self._size, self.ignore, self.ignore_image)
+
+    def update(self, frame):
+        """Examine (or skip) one BGR frame; returns whether the scene is in motion."""
+        self._frame_index += 1
+        if not self.motion and self._frame_index % self.idle_stride:
+            self.skipped = True
+            self.skipped_frames += 1
+            return False
+
+        if self._size is None:
+            self._setup(frame)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        if gray.shape[1] != self._size[0] or gray.shape[0] != self._size[1]:
+            gray = cv2.resize(gray, self._size, interpolation=cv2.INTER_AREA)
+
+        if self.subtractor is not None:
+            fg_mask = self.subtractor.apply(gray)
+        else:
+            gray = cv2.GaussianBlur(gray, (5, 5), 0)
+            if self._background is None:
+                self._background = gray.astype(np.float32)
+            fg_mask = cv2.absdiff(gray, cv2.convertScaleAbs(self._background))
+            _, fg_mask = cv2.threshold(fg_mask, self.diff_threshold, 255, cv2.THRESH_BINARY)
+            # foreground is blended in 10x slower, so a passing animal leaves no ghost
+            # behind while something that stays (a parked car) still becomes background
+            cv2.accumulateWeighted(gray, self._background, self.diff_alpha, mask=cv2.bitwise_not(fg_mask))
+            cv2.accumulateWeighted(gray, self._background, self.diff_alpha / 10, mask=fg_mask)
+        if self._mask is not None:
+            fg_mask = cv2.bitwise_and(fg_mask, self._mask)
+
+        self.fg_mask = fg_mask
+        self.skipped = False
+        self.examined += 1
+        self.pixels = int(cv2.countNonZero(fg_mask) * self._area_ratio)
+        if self.motion:
+            self.motion = self.pixels > self.off_threshold
+        elif self.pixels > self.on_threshold:
+            self.motion = True
+            self.episodes += 1
+        return self.motion
+
+    def full_mask(self, frame):
+        """The last foreground mask scaled back to the frame's size (for motion_boxes)."""
+        h, w = frame.shape[:2]
+        if self.fg_mask is None:
+            return np.zeros((h, w), np.uint8)
+        if self.fg_mask.shape[:2] == (h, w):
+            return self.fg_mask
+        return cv2.resize(self.fg_mask, (w, h), interpolation=cv2.INTER_NEAREST)
+
+    def stats(self):
+        return {
+            "algorithm": self.algorithm,
+            "size": list(self._size) if self._size else None,
+            "examined": self.examined,
+            "skipped": self.skipped_frames,
+            "episodes": self.episodes,
+            "in_motion": self.motion,
+            "pixels": self.pixels,
+        }
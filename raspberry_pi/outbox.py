@@ -0,0 +1,316 @@
+# outbox.py
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+HELD = "held"        # kept locally until the record is final (e.g. alert still waiting for the farmer)
+QUEUED = "queued"    # waiting for the sync worker
+SYNCED = "synced"    # in Firestore, kept as local history until compaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    collection TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    file TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS outbox_state ON outbox (state, id);
+CREATE INDEX IF NOT EXISTS outbox_doc ON outbox (collection, doc_id, state);
+"""
+
+
+def encode_time(t):
+    """Marks an epoch time so it is uploaded as a Firestore timestamp."""
+    return {"__time__": float(t)}
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if set(value) == {"__time__"}:
+            return datetime.fromtimestamp(value["__time__"], tz=timezone.utc)
+        return {k: _decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+
+# ---------------- Outbox ---------------- #
+class Outbox:
+    """
+    Durable store-and-forward queue of Firestore document writes (SQLite, WAL).
+
+    Every record is a merge-write of `data` into collection/doc_id. Writes to
+    a document that is not synced yet are merged into the same row, so a
+    long outage leaves one row per document rather than one per update.
+    Rows can be held back until they are final (hold=True) and may reference
+    a local file (alert image) that is deleted together with the row.
+
+    Disk use is bounded by compact(): synced rows older than `retention`
+    seconds go first, then the oldest synced rows, then the oldest
+    low-priority unsynced rows, until database + files fit in `max_bytes`.
+    """
+
+    def __init__(self, path, max_bytes=50 * 1024 * 1024, retention=30 * 86400):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.retention = retention
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")]
+        if "version" not in columns:  # outbox written by an older release
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    # ---------------- Writes ---------------- #
+    def record(self, collection, doc_id, data, hold=False, priority=0, file=None):
+        """Queue a merge-write of `data`; merged into the document's unsynced row if there is one."""
+        with self._lock:
+            now = time.time()
+            row = self._conn.execute(
+                "SELECT id, payload, state, file FROM outbox WHERE collection=? AND doc_id=? AND state!=? "
+                "ORDER BY id DESC LIMIT 1", (collection, doc_id, SYNCED)).fetchone()
+            if row is None:
+                self._conn.execute(
+                    "INSERT INTO outbox (collection, doc_id, payload, state, priority, file, created, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (collection, doc_id, json.dumps(data), HELD if hold else QUEUED, priority, file, now, now))
+            else:
+                row_id, payload, state, old_file = row
+                merged = json.loads(payload)
+                merged.update(data)
+                state = HELD if hold and state == HELD else QUEUED
+                self._conn.execute(
+                    "UPDATE outbox SET payload=?, state=?, priority=MAX(priority, ?), file=?, updated=?, "
+                    "version=version+1 WHERE id=?",
+                    (json.dumps(merged), state, priority, file or old_file, now, row_id))
+        if not hold:
+            self._changed.set()
+
+    def mark_synced(self, collection, doc_id, keep=()):
+        """
+        The document was written to Firestore directly. Fields listed in
+        `keep` were not part of that write and stay queued (held) for upload.
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, payload, state, priority FROM outbox WHERE collection=? AND doc_id=? AND state!=?",
+                (collection, doc_id, SYNCED)).fetchall()
+            self._conn.execute(
+                "UPDATE outbox SET state=?, updated=? WHERE collection=? AND doc_id=? AND state!=?",
+                (SYNCED, now, collection, doc_id, SYNCED))
+            rest, state, priority = {}, HELD, 0
+            for _, payload, row_state, row_priority in rows:
+                data = json.loads(payload)
+                rest.update({k: data[k] for k in keep if k in data})
+                state = QUEUED if row_state == QUEUED else state
+                priority = max(priority, row_priority)
+            if rest:
+                self._conn.execute(
+                    "INSERT INTO outbox (collection, doc_id, payload, state, priority, created, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (collection, doc_id, json.dumps(rest), state, priority, now, now))
+
+    # ---------------- Sync ---------------- #
+    def pending(self, limit):
+        """Queued rows as (id, version, collection, doc_id, data), oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, version, collection, doc_id, payload FROM outbox WHERE state=? ORDER BY id LIMIT ?",
+                (QUEUED, limit)).fetchall()
+        return [(row_id, version, collection, doc_id, _decode(json.loads(payload)))
+                for row_id, version, collection, doc_id, payload in rows]
+
+    def acknowledge(self, rows):
+        """
+        Mark uploaded (id, version) rows synced. A row merged with newer data
+        during the upload has a higher version and stays queued.
+        """
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE outbox SET state=?, attempts=attempts+1 WHERE id=? AND version=?",
+                [(SYNCED, row_id, version) for row_id, version in rows])
+
+    def failed(self, row_ids):
+        with self._lock:
+            self._conn.executemany("UPDATE outbox SET attempts=attempts+1 WHERE id=?", [(i,) for i in row_ids])
+
+    def wait_for_changes(self, timeout):
+        changed = self._changed.wait(timeout)
+        self._changed.clear()
+        return changed
+
+    # ---------------- Compaction ---------------- #
+    def size_bytes(self):
+        with self._lock:
+            pages = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+            files = [f for (f,) in self._conn.execute("SELECT file FROM outbox WHERE file IS NOT NULL")]
+        total = pages * page_size
+        for path in files:
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+    def _delete(self, where, args=()):
+        rows = self._conn.execute(f"SELECT id, file FROM outbox WHERE {where}", args).fetchall()
+        for row_id, path in rows:
+            self._conn.execute("DELETE FROM outbox WHERE id=?", (row_id,))
+            if path:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return len(rows)
+
+    def compact(self):
+        """Apply the retention and size limits. Returns the number of rows removed."""
+        removed = 0
+        with self._lock:
+            removed += self._delete("state=? AND updated<?", (SYNCED, time.time() - self.retention))
+        # evict one slice at a time until the database and files fit again;
+        # only unsynced rows count as dropped
+        for where, args, lost in (("state=?", (SYNCED,), False),
+                                  ("state!=? AND priority<=0", (SYNCED,), True),
+                                  ("1", (), True)):
+            while self.size_bytes() > self.max_bytes:
+                with self._lock:
+                    victims = self._conn.execute(
+                        f"SELECT id FROM outbox WHERE {where} ORDER BY id LIMIT 50", args).fetchall()
+                    if not victims:
+                        break
+                    n = self._delete("id IN (%s)" % ",".join(str(v[0]) for v in victims))
+                    if lost:
+                        self.dropped += n
+                    removed += n
+                    self._conn.execute("PRAGMA incremental_vacuum")
+        if removed:
+            with self._lock:
+                self._conn.execute("PRAGMA incremental_vacuum")
+        return removed
+
+    def counts(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM outbox GROUP BY state").fetchall()
+        counts = {HELD: 0, QUEUED: 0, SYNCED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ---------------- Sync Worker ---------------- #
+class SyncWorker(threading.Thread):
+    """
+    Uploads queued outbox rows with Firestore batched writes (merge=True).
+    `get_db()` is asked for the client before every batch and returns None
+    while Firebase is unreachable, so a Pi that booted offline starts
+    syncing once it connects. After a failed commit, or without a client,
+    it waits with exponential backoff (plus jitter) from `min_backoff` to
+    `max_backoff` seconds; a success resets it.
+    """
+
+    def __init__(self, outbox, get_db, batch_size=100, min_backoff=5.0, max_backoff=600.0,
+                 commit_timeout=30.0, compact_interval=3600.0):
+        super().__init__(name="outbox-sync", daemon=True)
+        self.outbox = outbox
+        self.get_db = get_db
+        self.batch_size = min(batch_size, 500)  # Firestore batch limit
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.commit_timeout = commit_timeout
+        self.compact_interval = compact_interval
+        self.backoff = 0.0
+        self.uploaded = 0
+        self.batches = 0
+        self.failures = 0
+        self.last_sync = None
+        self.last_error = None
+        self._stopping = threading.Event()
+        self._last_compact = 0.0
+
+    def run(self):
+        while not self._stopping.is_set():
+            if time.time() - self._last_compact >= self.compact_interval:
+                self._last_compact = time.time()
+                self.outbox.compact()
+
+            if not self.sync_once():
+                self._stopping.wait(self.backoff)
+            elif not self.outbox.pending(1):
+                self.outbox.wait_for_changes(self.min_backoff)
+
+    def sync_once(self):
+        """Upload one batch. Returns True when the outbox was reachable (or empty)."""
+        rows = self.outbox.pending(self.batch_size)
+        if not rows:
+            return True
+
+        db = self.get_db()
+        if db is None:
+            self._back_off("Firestore not connected")
+            return False
+
+        try:
+            batch = db.batch()
+            for _, _, collection, doc_id, data in rows:
+                batch.set(db.collection(collection).document(doc_id), data, merge=True)
+            batch.commit(timeout=self.commit_timeout)
+        except Exception as e:
+            self.outbox.failed([row[0] for row in rows])
+            self._back_off(f"{len(rows)} writes failed: {e}")
+            return False
+
+        self.outbox.acknowledge([(row[0], row[1]) for row in rows])
+        if self.backoff:
+            print(" Outbox sync restored.")
+        self.backoff = 0.0
+        self.batches += 1
+        self.uploaded += len(rows)
+        self.last_sync = time.time()
+        return True
+
+    def _back_off(self, error):
+        self.failures += 1
+        self.last_error = error
+        self.backoff = min(self.max_backoff, max(self.min_backoff, self.backoff * 2))
+        self.backoff *= random.uniform(0.8, 1.2)
+        print(f" Outbox sync failed ({error}), retrying in {self.backoff:.0f}s")
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self.outbox._changed.set()
+        self.join(timeout)
+
+    def stats(self):
+        return dict(
+            self.outbox.counts(),
+            uploaded=self.uploaded,
+            batches=self.batches,
+            failures=self.failures,
+            dropped=self.outbox.dropped,
+            backoff_s=round(self.backoff, 1),
+            last_error=self.last_error,
+        )
@@ -0,0 +1,135 @@
+# pipeline.py
+import queue
+import threading
+import time
+import traceback
+
+# ---------------- Backpressure Policies ---------------- #
+DROP_OLDEST = "drop_oldest"   # keep the freshest items (camera frames)
+DROP_NEWEST = "drop_newest"   # keep what is already queued (alerts)
+BLOCK = "block"               # producer waits for room
+
+
+class BoundedQueue:
+    """Fixed-size queue between two pipeline stages with a backpressure policy."""
+
+    def __init__(self, name, maxsize, policy=DROP_OLDEST):
+        if policy not in (DROP_OLDEST, DROP_NEWEST, BLOCK):
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        self.name = name
+        self.policy = policy
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.put_count = 0
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def put(self, item, timeout=None):
+        """Queue an item. Returns False if the item itself was dropped."""
+        if self.policy == BLOCK:
+            try:
+                self._queue.put(item, timeout=timeout)
+            except queue.Full:
+                self.dropped += 1
+                return False
+            self.put_count += 1
+            return True
+
+        with self._lock:
+            self.put_count += 1
+            try:
+                self._queue.put_nowait(item)
+                return True
+            except queue.Full:
+                self.dropped += 1
+                if self.policy == DROP_NEWEST:
+                    return False
+
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._queue.put_nowait(item)
+            return True
+
+    def get(self, timeout=None):
+        """Return the next item, or None if nothing arrived within timeout."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "size": self.qsize(),
+            "maxsize": self.maxsize,
+            "policy": self.policy,
+            "put": self.put_count,
+            "dropped": self.dropped,
+        }
+
+
+# ---------------- Stage Threads ---------------- #
+class Stage(threading.Thread):
+    """
+    Daemon thread that calls `step()` until the pipeline is stopped.
+    `step` returns False to end the stage (e.g. camera closed).
+    """
+
+    def __init__(self, name, step, stop_event, error_delay=2):
+        super().__init__(name=name, daemon=True)
+        self.step = step
+        self.stop_event = stop_event
+        self.error_delay = error_delay
+        self.iterations = 0
+
+    def run(self):
+        print(f"[{self.name}] stage started")
+        while not self.stop_event.is_set():
+            try:
+                if self.step() is False:
+                    break
+                self.iterations += 1
+            except Exception as e:
+                print(f"[{self.name}] error in stage: {e}")
+                traceback.print_exc()
+                time.sleep(self.error_delay)
+        print(f"[{self.name}] stage stopped")
+
+
+class Pipeline:
+    """Owns the stage threads and queues so they can be started and stopped together."""
+
+    def __init__(self):
+        self.stop_event = threading.Event()
+        self.queues = {}
+        self.stages = []
+
+    def add_queue(self, name, maxsize, policy=DROP_OLDEST):
+        q = BoundedQueue(name, maxsize, policy)
+        self.queues[name] = q
+        return q
+
+    def add_stage(self, name, step):
+        stage = Stage(name, step, self.stop_event)
+        self.stages.append(stage)
+        return stage
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def stop(self, timeout=5):
+        self.stop_event.set()
+        for stage in self.stages:
+            if stage is not threading.current_thread():
+                stage.join(timeout)
+
+    def is_running(self):
+        return not self.stop_event.is_set() and all(s.is_alive() for s in self.stages)
+
+    def stats(self):
+        return {name: q.stats() for name, q in self.queues.items()}
@@ -0,0 +1,148 @@
+# postprocess.py
+import numpy as np
+
+CONF_THRESHOLD = 0.4
+IOU_THRESHOLD = 0.45
+MAX_DETECTIONS = 50
+
+# One row per detection: box is (x1, y1, x2, y2) normalised to the model input (0..1)
+DETECTION_DTYPE = np.dtype([
+    ("box", np.float32, (4,)),
+    ("class_id", np.int32),
+    ("score", np.float32),
+])
+
+
+def empty_detections():
+    return np.zeros(0, dtype=DETECTION_DTYPE)
+
+
+def make_detections(boxes, class_ids, scores):
+    dets = np.empty(len(scores), dtype=DETECTION_DTYPE)
+    dets["box"] = boxes
+    dets["class_id"] = class_ids
+    dets["score"] = scores
+    return dets
+
+
+def xywh_to_xyxy(xywh):
+    half = xywh[:, 2:4] / 2
+    return np.concatenate((xywh[:, 0:2] - half, xywh[:, 0:2] + half), axis=1)
+
+
+# ---------------- Non-Maximum Suppression ---------------- #
+def nms(boxes, scores, iou_threshold=IOU_THRESHOLD, max_detections=MAX_DETECTIONS):
+    """Greedy NMS. Returns indices of kept boxes, highest score first."""
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    order = np.argsort(-scores)
+    keep = []
+
+    while order.size > 0 and len(keep) < max_detections:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+
+        w = np.maximum(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0)
+        h = np.maximum(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+
+        order = rest[iou <= iou_threshold]
+
+    return np.asarray(keep, dtype=np.int64)
+
+
+def batched_nms(boxes, scores, class_ids, iou_threshold=IOU_THRESHOLD, max_detections=MAX_DETECTIONS):
+    """Class-aware NMS: boxes of different classes never suppress each other."""
+    if len(scores) == 0:
+        return np.zeros(0, dtype=np.int64)
+    # shift every class into its own coordinate range
+    offset = class_ids[:, None].astype(np.float32) * (float(boxes.max()) + 1.0)
+    return nms(boxes + offset, scores, iou_threshold, max_detections)
+
+
+# ---------------- YOLO Decoding ---------------- #
+def decode_yolo(output, num_classes, conf_threshold=CONF_THRESHOLD, input_size=None):
+    """
+    Decode one image worth of YOLO output into a DETECTION_DTYPE array.
+
+    Accepts both export layouts:
+      - YOLOv5: rows of (cx, cy, w, h, objectness, class scores...)
+      - YOLOv8: rows of (cx, cy, w, h, class scores...)
+    either anchor-major (N, C) or channel-major (C, N).
+    Boxes given in input pixels are normalised using input_size (w, h).
+    """
+    output = np.asarray(output)
+    if output.ndim == 3:
+        output = output[0]
+
+    if output.shape[0] in (num_classes + 4, num_classes + 5) and output.shape[1] > output.shape[0]:
+        output = output.T
+
+    has_objectness = output.shape[1] == num_classes + 5
+    cls_start = 5 if has_objectness else 4
+    class_scores = output[:, cls_start:]
+
+    class_ids = np.argmax(class_scores, axis=1)
+    scores = np.take_along_axis(class_scores, class_ids[:, None], axis=1)[:, 0]
+    if has_objectness:
+        scores = scores * output[:, 4]
+
+    mask = scores > conf_threshold
+    if not mask.any():
+        return empty_detections()
+
+    boxes = xywh_to_xyxy(output[mask, :4].astype(np.float32))
+    scores = scores[mask].astype(np.float32)
+    class_ids = class_ids[mask].astype(np.int32)
+
+    if input_size is not None and boxes.max() > 2.0:
+        boxes /= np.array([input_size[0], input_size[1], input_size[0], input_size[1]], dtype=np.float32)
+
+    keep = batched_nms(boxes, scores, class_ids)
+    return make_detections(np.clip(boxes[keep], 0.0, 1.0), class_ids[keep], scores[keep])
+
+
+def decode_ssd(boxes, class_ids, scores, count=None, conf_threshold=CONF_THRESHOLD):
+    """Decode TFLite_Detection_PostProcess outputs (boxes are ymin, xmin, ymax, xmax)."""
+    boxes, class_ids, scores = boxes[0], class_ids[0], scores[0]
+    if count is not None:
+        n = int(np.asarray(count).reshape(-1)[0])
+        boxes, class_ids, scores = boxes[:n], class_ids[:n], scores[:n]
+
+    mask = scores > conf_threshold
+    xyxy = boxes[mask][:, [1, 0, 3, 2]].astype(np.float32)
+    return make_detections(np.clip(xyxy, 0.0, 1.0), class_ids[mask].astype(np.int32), scores[mask])
+
+
+def decode_outputs(outputs, num_classes, conf_threshold=CONF_THRESHOLD, input_size=None):
+    """Decode the full list of output tensors of a detection model."""
+    if len(outputs) == 1:
+        return decode_yolo(outputs[0], num_classes, conf_threshold, input_size)
+
+    # SSD-style post-processed model: boxes [1,N,4], classes [1,N], scores [1,N], count [1]
+    boxes = [o for o in outputs if o.ndim == 3 and o.shape[-1] == 4]
+    flat = [o for o in outputs if o.ndim == 2]
+    if len(boxes) == 1 and len(flat) >= 2:
+        counts = [o for o in outputs if o.ndim == 1]
+        # class ids are whole numbers, scores are not
+        integral = [bool(np.all(o == np.round(o))) for o in flat[:2]]
+        class_out, score_out = flat[:2] if integral[0] or not integral[1] else flat[1::-1]
+        return decode_ssd(boxes[0], class_out, score_out, counts[0] if counts else None, conf_threshold)
+
+    # Multi-head YOLO export: decode every head and merge
+    parts = [decode_yolo(o, num_classes, conf_threshold, input_size)
+             for o in outputs if o.ndim >= 2 and o.shape[-1] >= num_classes + 4]
+    if not parts:
+        return empty_detections()
+    dets = np.concatenate(parts)
+    keep = batched_nms(dets["box"], dets["score"], dets["class_id"])
+    return dets[keep]
+
+
+def best_detection(dets):
+    """Index of the highest scoring detection, or None."""
+    if len(dets) == 0:
+        return None
+    return int(np.argmax(dets["score"]))
@@ -0,0 +1,103 @@
+# roi.py
+import cv2
+import numpy as np
+
+LETTERBOX_COLOR = 114  # grey padding, same as YOLO training letterbox
+
+
+# ---------------- Motion Blobs ---------------- #
+def motion_boxes(fg_mask, min_area=400, merge_gap=24):
+    """
+    Bounding boxes (x1, y1, x2, y2) of the foreground blobs in a MOG2 mask.
+    Shadow pixels (127) are ignored; boxes closer than merge_gap pixels are merged.
+    """
+    _, binary = cv2.threshold(fg_mask, 200, 255, cv2.THRESH_BINARY)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    if count <= 1:
+        return np.zeros((0, 4), dtype=np.int32)
+
+    stats = stats[1:]  # label 0 is the background
+    stats = stats[stats[:, cv2.CC_STAT_AREA] >= min_area]
+    if len(stats) == 0:
+        return np.zeros((0, 4), dtype=np.int32)
+
+    x, y = stats[:, cv2.CC_STAT_LEFT], stats[:, cv2.CC_STAT_TOP]
+    boxes = np.stack([x, y, x + stats[:, cv2.CC_STAT_WIDTH], y + stats[:, cv2.CC_STAT_HEIGHT]], axis=1)
+    return merge_boxes(boxes, merge_gap)
+
+
+def merge_boxes(boxes, gap=0):
+    """Repeatedly union boxes that overlap once grown by `gap` pixels."""
+    boxes = [list(b) for b in boxes]
+    merged = True
+    while merged and len(boxes) > 1:
+        merged = False
+        out = []
+        while boxes:
+            a = boxes.pop()
+            i = 0
+            while i < len(boxes):
+                b = boxes[i]
+                if (a[0] - gap <= b[2] and b[0] - gap <= a[2] and
+                        a[1] - gap <= b[3] and b[1] - gap <= a[3]):
+                    a = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    boxes.pop(i)
+                    merged = True
+                else:
+                    i += 1
+            out.append(a)
+        boxes = out
+    return np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+
+
+def expand_box(box, frame_w, frame_h, pad=16, min_size=160):
+    """Pad a box and grow it to at least min_size per side, kept inside the frame."""
+    x1, y1, x2, y2 = box
+    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+    w = min(max(x2 - x1 + 2 * pad, min_size), frame_w)
+    h = min(max(y2 - y1 + 2 * pad, min_size), frame_h)
+
+    x1 = int(round(min(max(cx - w / 2, 0), frame_w - w)))
+    y1 = int(round(min(max(cy - h / 2, 0), frame_h - h)))
+    return x1, y1, x1 + int(w), y1 + int(h)
+
+
+# ---------------- Letterbox ---------------- #
+def letterbox_into(frame, box, dst):
+    """
+    Resize frame[box] into dst (H, W, 3) keeping aspect ratio, grey padded.
+    Returns the transform (scale, pad_x, pad_y, x1, y1) used by map_to_frame.
+    """
+    x1, y1, x2, y2 = box
+    crop = frame[y1:y2, x1:x2]
+    dst_h, dst_w = dst.shape[:2]
+    scale = min(dst_w / crop.shape[1], dst_h / crop.shape[0])
+    new_w = max(1, min(dst_w, int(round(crop.shape[1] * scale))))
+    new_h = max(1, min(dst_h, int(round(crop.shape[0] * scale))))
+    pad_x, pad_y = (dst_w - new_w) // 2, (dst_h - new_h) // 2
+
+    dst[...] = LETTERBOX_COLOR
+    cv2.resize(crop, (new_w, new_h), dst=dst[pad_y:pad_y + new_h, pad_x:pad_x + new_w])
+    return scale, pad_x, pad_y, x1, y1
+
+
+def map_to_frame(dets, transform, input_size, frame_size):
+    """
+    Convert detections normalised to a letterboxed crop into detections
+    normalised to the full frame (same convention as full-frame inference).
+    """
+    if len(dets) == 0:
+        return dets
+    scale, pad_x, pad_y, x1, y1 = transform
+    in_w, in_h = input_size
+    frame_w, frame_h = frame_size
+
+    boxes = dets["box"] * np.array([in_w, in_h, in_w, in_h], dtype=np.float32)
+    boxes -= np.array([pad_x, pad_y, pad_x, pad_y], dtype=np.float32)
+    boxes /= scale
+    boxes += np.array([x1, y1, x1, y1], dtype=np.float32)
+    boxes /= np.array([frame_w, frame_h, frame_w, frame_h], dtype=np.float32)
+
+    mapped = dets.copy()
+    mapped["box"] = np.clip(boxes, 0.0, 1.0)
+    return mapped
@@ -0,0 +1,148 @@
+# scheduler.py
+import os
+
+from metrics import SCHEDULER_DECISIONS, THERMAL_ZONE_PATH, read_cpu_temperature
+
+
+class DetectionScheduler:
+    """
+    Decides on which motion frames the model runs.
+
+    The first frame of every motion episode is always classified (an episode
+    ends after `quiet_reset` seconds without motion). After that
+    the gap between inferences starts at `base_interval` seconds and is:
+      - shortened for strong motion (up to 4x for 16x the motion threshold),
+      - shortened when the last result was uncertain, lengthened when it was
+        already confident,
+      - never shorter than measured latency / duty_cycle, so inference uses at
+        most that share of the CPU,
+      - doubled when every tracked animal has already been alerted on,
+      - stretched 2x above `temp_soft` and 4x above `temp_hard` (°C),
+    and always kept within [min_interval, max_interval], so tracks kept for
+    longer than `max_interval` survive the gap between two inferences.
+    Every decision is counted in farmguard_scheduler_decisions_total.
+    """
+
+    def __init__(self, motion_threshold, base_interval=0.5, min_interval=0.1, max_interval=2.0,
+                 duty_cycle=0.6, confident_score=0.8, uncertain_score=0.4,
+                 quiet_reset=1.0, temp_soft=70.0, temp_hard=80.0,
+                 thermal_path=THERMAL_ZONE_PATH, thermal_period=5.0, camera_id=""):
+        self.camera_id = camera_id
+        self.motion_threshold = motion_threshold
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.duty_cycle = duty_cycle
+        self.confident_score = confident_score
+        self.uncertain_score = uncertain_score
+        self.quiet_reset = quiet_reset
+        self.temp_soft = temp_soft
+        self.temp_hard = temp_hard
+        self.thermal_path = thermal_path
+        self.thermal_period = thermal_period
+
+        self.in_motion = False
+        self.quiet_since = None
+        self.last_run = None
+        self.last_score = None
+        self.avg_latency = None
+        self.temperature = None
+        self._thermal_checked = None
+
+        self.interval = base_interval
+        self.last_reason = None
+        self.decisions = 0
+        self.runs = 0
+        self.episodes = 0
+        self.reasons = {}
+
+    # ---------------- Inputs ---------------- #
+    def on_quiet(self, now):
+        """Call on every frame below the motion threshold."""
+        if self.quiet_since is None:
+            self.quiet_since = now
+
+    def record_inference(self, now, latency, best_score):
+        """Feed back how long the model took and the best score it produced."""
+        self.last_score = best_score
+        if self.avg_latency is None:
+            self.avg_latency = latency
+        else:
+            self.avg_latency = 0.8 * self.avg_latency + 0.2 * latency
+
+    def _temperature(self, now):
+        if self.thermal_path and (self._thermal_checked is None or now - self._thermal_checked >= self.thermal_period):
+            self._thermal_checked = now
+            self.temperature = read_cpu_temperature(self.thermal_path)
+        return self.temperature
+
+    # ---------------- Decision ---------------- #
+    def compute_interval(self, now, motion_pixels, settled=False):
+        interval = self.base_interval
+        if settled:
+            interval *= 2.0
+
+        ratio = motion_pixels / float(self.motion_threshold or 1)
+        interval /= min(max(ratio, 1.0) ** 0.5, 4.0)
+
+        if self.last_score is not None:
+            if self.last_score >= self.confident_score:
+                interval *= 2.0
+            elif self.last_score >= self.uncertain_score:
+                interval *= 0.5
+
+        if self.avg_latency is not None and self.duty_cycle > 0:
+            interval = max(interval, self.avg_latency / self.duty_cycle)
+
+        temp = self._temperature(now)
+        if temp is not None:
+            if temp >= self.temp_hard:
+                interval *= 4.0
+            elif temp >= self.temp_soft:
+                interval *= 2.0
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def should_run(self, now, motion_pixels, settled=False):
+        """
+        Call on every frame above the motion threshold. `settled` means the
+        tracker has nothing new to confirm, so the model can run less often.
+        """
+        self.decisions += 1
+
+        if self.quiet_since is not None and now - self.quiet_since >= self.quiet_reset:
+            self.in_motion = False
+            self.last_score = None
+        self.quiet_since = None
+
+        if not self.in_motion:
+            self.in_motion = True
+            self.episodes += 1
+            return self._decide(now, True, "first_motion")
+
+        self.interval = self.compute_interval(now, motion_pixels, settled)
+        if self.last_run is None or now - self.last_run >= self.interval:
+            return self._decide(now, True, "interval")
+        return self._decide(now, False, "waiting")
+
+    def _decide(self, now, run, reason):
+        self.last_reason = reason
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        SCHEDULER_DECISIONS.inc(self.camera_id, "run" if run else "skip", reason)
+        if run:
+            self.runs += 1
+            self.last_run = now
+        return run
+
+    def stats(self):
+        return {
+            "decisions": self.decisions,
+            "runs": self.runs,
+            "skipped": self.decisions - self.runs,
+            "episodes": self.episodes,
+            "reasons": dict(self.reasons),
+            "interval_s": round(self.interval, 3),
+            "avg_latency_ms": round(self.avg_latency * 1000, 2) if self.avg_latency is not None else None,
+            "temperature_c": self.temperature,
+            "load_avg": os.getloadavg()[0] if hasattr(os, "getloadavg") else None,
+            "last_reason": self.last_reason,
+        }
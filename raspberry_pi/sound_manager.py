@@ -1,7 +1,10 @@
 import platform
-import time
 import os
-import subprocess
+import random
+import threading
+
+from audio_engine import AudioEngine
+from sound_synth import WaveformCache, deterrent_specs
 
 # ---------------------------------------------------------
 # BASE DIRECTORY
@@ -10,29 +13,101 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SOUND_DIR = os.path.join(BASE_DIR, "sounds")
 os.makedirs(SOUND_DIR, exist_ok=True)
 
-# WAV files (must exist)
-WARNING_WAV = os.path.join(SOUND_DIR, "warning.wav")
-ALERT_WAV = os.path.join(SOUND_DIR, "alert.wav")
-NOTIF_WAV = os.path.join(SOUND_DIR, "notification.wav")
-ALARM_LONG_WAV = os.path.join(SOUND_DIR, "alarm_long.wav")  # 60-second alarm!
+# Candidate files per sound, first one found wins (WAV, MP3, AAC, ...)
+SOUND_FILES = {
+    "warning": ("warning.wav", "warning_sound.mp3"),
+    "alert": ("alert.wav", "warning_sound.mp3"),
+    "notification": ("notification.wav",),
+    "alarm_long": ("alarm_long.wav",),  # 60-second alarm, optional
+}
+SOUND_PRIORITY = {"notification": 0, "warning": 1, "alert": 1, "alarm_long": 2}
+LONG_ALARM_SECONDS = 60
+
+# "auto" = sounddevice, else one persistent aplay; "null" discards audio (headless)
+AUDIO_BACKEND = os.environ.get("AUDIO_BACKEND", "auto")
+
+# Synthesized deterrents: a different pattern per alert so livestock and predators don't habituate
+DETERRENT_VARIANTS = 6   # patterns kept ready (rendered once, then loaded from the disk cache)
+DETERRENT_SECONDS = 12   # length of one rendered pattern; looped for the alarm duration
+SYNTH_CACHE_DIR = os.path.join(SOUND_DIR, "cache")
+
+engine = None
+deterrents = []          # clip names of the loaded deterrent patterns
+_last_deterrent = None
+_init_lock = threading.Lock()  # init_audio() can be called from several threads at once
+
+
+# ---------------------------------------------------------
+# AUDIO ENGINE (decoded once, one long-lived output)
+# ---------------------------------------------------------
+def init_audio(backend=AUDIO_BACKEND):
+    """Decode every available clip into memory and open the output. Safe to call repeatedly."""
+    global engine
+    with _init_lock:
+        if engine is not None:
+            return engine
+
+        audio = AudioEngine()
+        decoded = {}
+        for name, files in SOUND_FILES.items():
+            for filename in files:
+                path = os.path.join(SOUND_DIR, filename)
+                if path in decoded:
+                    audio.clips[name] = decoded[path]  # same file as another sound: share the PCM
+                    break
+                if not os.path.isfile(path):
+                    continue
+                try:
+                    clip = decoded[path] = audio.load(name, path)
+                    print(f" Loaded {name} sound from {filename} ({clip.duration:.1f}s)")
+                    break
+                except Exception as e:
+                    print(f" Could not decode {path}: {e}")
+
+        if audio.start(backend) is None:
+            print(" No audio output available -> console bell fallback")
+        else:
+            print(f" Audio engine ready ({audio.backend}, {len(audio.clips)} clips)")
+        engine = audio
+        # rendering is only needed on the first run; either way it never delays startup
+        threading.Thread(target=_load_deterrents, args=(audio,), name="deterrent-loader", daemon=True).start()
+        return engine
+
+
+def _load_deterrents(audio):
+    cache = WaveformCache(SYNTH_CACHE_DIR)
+    for spec in deterrent_specs(DETERRENT_VARIANTS, DETERRENT_SECONDS):
+        try:
+            path = cache.get(spec, audio.rate, audio.channels)
+            name = os.path.splitext(os.path.basename(path))[0]
+            audio.load(name, path, mmap=True)
+            deterrents.append(name)
+        except Exception as e:
+            print(f" Could not prepare deterrent {spec}: {e}")
+    print(f" {len(deterrents)} deterrent patterns ready ({cache.misses} rendered, {cache.hits} from cache)")
+
+
+def stop_sound():
+    """Silence whatever is playing."""
+    if engine is not None:
+        engine.stop()
 
 
 # ---------------------------------------------------------
 # MAIN PLAY SOUND
 # ---------------------------------------------------------
-def play_sound(sound_type="warning"):
-    """General sound function with OS detection."""
+def play_sound(sound_type="warning", loop=False, duration=None):
+    """Start a sound and return at once; a more important sound preempts a lesser one."""
     try:
-        system = platform.system()
         print(f" Playing {sound_type} sound...")
+        audio = init_audio()
+        if audio.play(sound_type, loop=loop, duration=duration, priority=SOUND_PRIORITY.get(sound_type, 0)):
+            return True
 
-        if system == "Linux":
-            play_linux_sound(sound_type)
-        elif system == "Windows":
+        if platform.system() == "Windows":
             play_windows_beep(sound_type)
         else:
             play_console_bell(sound_type)
-
         return True
 
     except Exception as e:
@@ -42,51 +117,44 @@ def play_sound(sound_type="warning"):
 
 
 # ---------------------------------------------------------
-# RASPBERRY PI SOUND VIA APLAY
+#  LONG CONTINUOUS 60-SECOND ALARM
 # ---------------------------------------------------------
-def play_linux_sound(sound_type):
-    """Play sounds using WAV files + aplay (flawless on Raspberry Pi)."""
-
-    sound_map = {
-        "warning": WARNING_WAV,
-        "alert": ALERT_WAV,
-        "notification": NOTIF_WAV,
-    }
-
-    sound_file = sound_map.get(sound_type, NOTIF_WAV)
-
-    if not os.path.isfile(sound_file):
-        print(f" Missing WAV file: {sound_file}")
-        play_console_bell(sound_type)
-        return
-
-    try:
-        subprocess.run(["aplay", "-q", sound_file])
-    except Exception as e:
-        print(f" aplay error: {e}")
-        play_console_bell(sound_type)
+def play_long_alarm(duration=LONG_ALARM_SECONDS):
+    """
+    Plays alarm_long.wav, or loops the warning sound for `duration`
+    seconds when it is missing. Returns at once; stop_sound() ends it.
+    """
+    print(f" Playing {duration}-second continuous alarm...")
+    audio = init_audio()
+    priority = SOUND_PRIORITY["alarm_long"]
+    if audio.play("alarm_long", duration=duration, priority=priority):
+        return True
+    if audio.play("warning", loop=True, duration=duration, priority=priority):
+        return True
+    print(" No alarm sound available!")
+    play_console_bell("warning")
+    return False
 
 
 # ---------------------------------------------------------
-#  LONG CONTINUOUS 60-SECOND ALARM
+# DETERRENT (new synthesized pattern per alert)
 # ---------------------------------------------------------
-def play_long_alarm():
+def play_deterrent(duration=LONG_ALARM_SECONDS):
     """
-    Plays the 60-second alarm sound file (alarm_long.wav)
-    No loops, no gaps — perfect continuous alarm.
+    Loop a randomly chosen deterrent pattern (never the same one twice in a
+    row) for `duration` seconds. Falls back to the long alarm while the
+    patterns are still being prepared. Returns at once.
     """
-    print(" Playing 60-second continuous alarm...")
-
-    if not os.path.isfile(ALARM_LONG_WAV):
-        print(" Missing alarm_long.wav! Cannot play alarm.")
-        play_console_bell("warning")
-        return
-
-    try:
-        subprocess.run(["aplay", "-q", ALARM_LONG_WAV])
-    except Exception as e:
-        print(" Alarm playback failed:", e)
-        play_console_bell("warning")
+    global _last_deterrent
+    audio = init_audio()
+    choices = [name for name in deterrents if name != _last_deterrent] or list(deterrents)
+    if choices:
+        name = random.choice(choices)
+        print(f" Playing deterrent {name} for {duration}s...")
+        if audio.play(name, loop=True, duration=duration, priority=SOUND_PRIORITY["alarm_long"]):
+            _last_deterrent = name
+            return True
+    return play_long_alarm(duration)
 
 
 # ---------------------------------------------------------
@@ -0,0 +1,196 @@
+# sound_synth.py
+import hashlib
+import json
+import os
+import random
+import wave
+
+import numpy as np
+
+RATE = 44100
+CHANNELS = 2
+CHUNK = 4096          # frames rendered per step; memory use does not grow with the duration
+FADE = 0.005          # seconds of ramp on every on/off edge, so pulses do not click
+SYNTH_VERSION = 1     # part of the cache key; bump when the generators change
+TWO_PI = np.float32(2 * np.pi)
+
+
+# ---------------- Building Blocks ---------------- #
+def _oscillate(freqs, phase, rate):
+    """Sine for a per-sample frequency array; returns (samples, next phase). Phase is kept in [0, 2π)."""
+    steps = np.cumsum(freqs, dtype=np.float64) * (2 * np.pi / rate)
+    samples = np.sin(phase + steps).astype(np.float32)
+    return samples, float((phase + steps[-1]) % (2 * np.pi))
+
+
+def _gate(positions, on_frames, fade_frames):
+    """1 inside [0, on_frames) with linear ramps at both ends, 0 outside."""
+    return np.clip(np.minimum(positions, on_frames - positions) / fade_frames, 0.0, 1.0).astype(np.float32)
+
+
+# ---------------- Patterns ---------------- #
+def pulse(duration, frequency=1000.0, on=0.6, off=0.6, volume=0.7, rate=RATE, chunk=CHUNK):
+    """A tone switched on for `on` and off for `off` seconds (the classic alarm)."""
+    total = int(round(duration * rate))
+    period = max(1, int(round((on + off) * rate)))
+    on_frames = int(round(on * rate))
+    fade = max(1.0, FADE * rate)
+    phase = 0.0
+    for start in range(0, total, chunk):
+        n = min(chunk, total - start)
+        tone, phase = _oscillate(np.full(n, frequency, np.float32), phase, rate)
+        positions = (np.arange(start, start + n) % period).astype(np.float32)
+        yield tone * _gate(positions, on_frames, fade) * np.float32(volume)
+
+
+def sweep(duration, low=600.0, high=2400.0, period=1.5, shape="updown", volume=0.7, rate=RATE, chunk=CHUNK):
+    """A siren gliding between `low` and `high` Hz: "up" (saw) or "updown" (triangle) every `period` s."""
+    total = int(round(duration * rate))
+    period_frames = max(2, int(round(period * rate)))
+    phase = 0.0
+    for start in range(0, total, chunk):
+        n = min(chunk, total - start)
+        position = (np.arange(start, start + n) % period_frames).astype(np.float32) / period_frames
+        if shape == "updown":
+            position = 1.0 - np.abs(2.0 * position - 1.0)
+        freqs = np.float32(low) + np.float32(high - low) * position
+        tone, phase = _oscillate(freqs, phase, rate)
+        yield tone * np.float32(volume)
+
+
+def bursts(duration, seed=0, volume=0.8, rate=RATE, chunk=CHUNK):
+    """
+    Irregular predator-like sounds separated by random gaps: low growls
+    (rough harmonic tone), barks (decaying noise bursts) and screeches
+    (falling high sweeps). Seeded, so a spec always renders the same audio.
+    """
+    rng = np.random.default_rng(seed)
+    total = int(round(duration * rate))
+    done = 0
+    while done < total:
+        gap = min(total - done, int(rng.uniform(0.1, 1.2) * rate))
+        for start in range(0, gap, chunk):
+            yield np.zeros(min(chunk, gap - start), np.float32)
+        done += gap
+
+        n = min(total - done, int(rng.uniform(0.15, 0.8) * rate))
+        if n <= 0:
+            break
+        t = np.arange(n, dtype=np.float32) / np.float32(rate)
+        kind = rng.choice(("growl", "bark", "screech"))
+        if kind == "growl":
+            base = rng.uniform(90, 220)
+            sound = np.zeros(n, np.float32)
+            for harmonic in range(1, 6):
+                sound += np.sin(TWO_PI * np.float32(base * harmonic) * t) / np.float32(harmonic)
+            sound *= np.float32(0.6) + np.float32(0.4) * np.sin(TWO_PI * np.float32(rng.uniform(20, 40)) * t)
+            sound /= np.float32(2.3)
+        elif kind == "bark":
+            sound = rng.standard_normal(n).astype(np.float32)
+            sound = np.convolve(sound, np.ones(8, np.float32) / 8, mode="same")  # duller than white noise
+            sound *= np.exp(-t * np.float32(rng.uniform(6, 14)))
+        else:
+            freqs = np.linspace(rng.uniform(2500, 4000), rng.uniform(900, 1500), n).astype(np.float32)
+            sound, _ = _oscillate(freqs, 0.0, rate)
+        ramp = _gate(np.arange(n, dtype=np.float32), n, max(1.0, FADE * rate))
+        sound = np.clip(sound * ramp * np.float32(volume), -1.0, 1.0)
+        for start in range(0, n, chunk):
+            yield sound[start:start + chunk]
+        done += n
+
+
+PATTERNS = {"pulse": pulse, "sweep": sweep, "bursts": bursts}
+
+
+def render(spec, rate=RATE, chunk=CHUNK):
+    """Float32 chunks in [-1, 1] for a spec like {"pattern": "sweep", "duration": 10, "low": 500}."""
+    params = dict(spec)
+    generator = PATTERNS[params.pop("pattern")]
+    return generator(rate=rate, chunk=chunk, **params)
+
+
+def to_int16(samples):
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def write_wav(chunks, path, rate=RATE, channels=CHANNELS):
+    """Stream float chunks into a 16-bit WAV file (channels duplicated)."""
+    with wave.open(path, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        for samples in chunks:
+            w.writeframes(np.repeat(to_int16(samples), channels).tobytes())
+
+
+# ---------------- Variants ---------------- #
+def deterrent_specs(variants=6, duration=12.0, seed=0):
+    """
+    A fixed, varied set of deterrent specs: pulses, sirens and bursts with
+    randomized parameters. Deterministic for a seed, so they are rendered
+    once and then found in the cache on every later start.
+    """
+    rng = random.Random(seed)
+    specs = []
+    for i in range(variants):
+        kind = ("pulse", "sweep", "bursts")[i % 3]
+        if kind == "pulse":
+            on = round(rng.uniform(0.15, 0.6), 2)
+            spec = {"frequency": rng.choice((880, 1200, 1800, 2500, 3200)), "on": on,
+                    "off": round(on * rng.uniform(0.5, 1.5), 2)}
+        elif kind == "sweep":
+            low = rng.choice((400, 600, 800))
+            spec = {"low": low, "high": low * rng.choice((3, 4, 5)), "period": round(rng.uniform(0.4, 2.0), 2),
+                    "shape": rng.choice(("up", "updown"))}
+        else:
+            spec = {"seed": rng.randrange(1 << 30)}
+        specs.append(dict(spec, pattern=kind, duration=duration))
+    return specs
+
+
+# ---------------- Disk Cache ---------------- #
+class WaveformCache:
+    """
+    Rendered patterns as WAV files named by a hash of their spec, rate,
+    channels and SYNTH_VERSION. get() renders (streaming) only on a miss;
+    the least recently used files beyond `max_files` are removed.
+    """
+
+    def __init__(self, directory, max_files=32):
+        self.directory = directory
+        self.max_files = max_files
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, spec, rate=RATE, channels=CHANNELS):
+        text = json.dumps({"spec": spec, "rate": rate, "channels": channels, "version": SYNTH_VERSION},
+                          sort_keys=True)
+        return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+    def path(self, spec, rate=RATE, channels=CHANNELS):
+        return os.path.join(self.directory, f"{spec['pattern']}-{self.key(spec, rate, channels)}.wav")
+
+    def get(self, spec, rate=RATE, channels=CHANNELS):
+        path = self.path(spec, rate, channels)
+        if os.path.exists(path):
+            self.hits += 1
+            os.utime(path)
+            return path
+        self.misses += 1
+        tmp = f"{path}.{os.getpid()}.tmp"
+        write_wav(render(spec, rate), tmp, rate, channels)
+        os.replace(tmp, path)
+        self._evict()
+        return path
+
+    def _evict(self):
+        files = [os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith(".wav")]
+        if len(files) <= self.max_files:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - self.max_files]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,116 @@
+# startup.py
+import cProfile
+import io
+import pstats
+import threading
+import time
+from concurrent.futures import Future
+
+
+class _Task:
+    def __init__(self, name):
+        self.name = name
+        self.future = Future()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.result = None
+        self.profile = None
+
+
+class Startup:
+    """
+    Runs initialization tasks (model, Firebase, GSM, ...) in background
+    threads so the cameras can start at once, and records when each one
+    started and finished, plus one-off milestones such as the first frame.
+    With `profile` (--profile-startup) every task runs under cProfile; as
+    only one profiler can be active at a time, tasks then run one by one.
+    """
+
+    def __init__(self, profile=False, origin=None):
+        self.origin = origin if origin is not None else time.perf_counter()
+        self.profile = profile
+        self.tasks = {}
+        self.marks = {}
+        self._lock = threading.Lock()
+        self._serial = threading.Lock()
+
+    def elapsed(self):
+        return time.perf_counter() - self.origin
+
+    def mark(self, name, at=None):
+        """Record a milestone once (later calls with the same name are ignored)."""
+        with self._lock:
+            if name not in self.marks:
+                self.marks[name] = self.elapsed() if at is None else at
+
+    def run(self, name, fn, *args, after=()):
+        """Start fn(*args) in a thread once the tasks named in `after` are done."""
+        task = self.tasks[name] = _Task(name)
+        thread = threading.Thread(target=self._run, args=(task, fn, args, after),
+                                  name=f"startup-{name}", daemon=True)
+        thread.start()
+        return task.future
+
+    def _run(self, task, fn, args, after):
+        for dependency in after:
+            self.wait(dependency)
+        if self.profile:
+            self._serial.acquire()
+        task.started = self.elapsed()
+        profiler = cProfile.Profile() if self.profile else None
+        result, error = None, None
+        try:
+            result = profiler.runcall(fn, *args) if profiler else fn(*args)
+        except Exception as e:
+            error = e
+            print(f"Startup task {task.name} failed: {e}")
+        task.finished = self.elapsed()
+        if self.profile:
+            self._serial.release()
+        task.profile = profiler
+        task.error = error
+        task.result = result
+        if error is None:
+            task.future.set_result(result)
+        else:
+            task.future.set_exception(error)
+
+    def wait(self, name, timeout=None):
+        """Result of a task (None if it failed, timed out or was never started)."""
+        task = self.tasks.get(name)
+        if task is None:
+            return None
+        try:
+            return task.future.result(timeout)
+        except Exception:
+            return None
+
+    def done(self):
+        return all(task.future.done() for task in self.tasks.values())
+
+    # ---------------- Report ---------------- #
+    def report(self):
+        lines = ["Startup timing (seconds since launch):"]
+        rows = [(at, f"  {name:<28} {at:7.2f}") for name, at in self.marks.items()]
+        for task in self.tasks.values():
+            if task.finished is None:
+                status = "running"
+            elif task.error is not None:
+                status = f"FAILED ({task.error})"
+            else:
+                status = "ok" if task.result is not None else "unavailable"
+            start = task.started if task.started is not None else self.elapsed()
+            end = task.finished if task.finished is not None else self.elapsed()
+            rows.append((end, f"  {'task ' + task.name:<28} {end:7.2f}  ({start:.2f} -> +{end - start:.2f}s) {status}"))
+        lines += [text for _, text in sorted(rows)]
+        print("\n".join(lines))
+
+    def print_profiles(self, limit=15):
+        for task in self.tasks.values():
+            if task.profile is None:
+                continue
+            out = io.StringIO()
+            pstats.Stats(task.profile, stream=out).sort_stats("cumulative").print_stats(limit)
+            print(f"\n---------------- Profile: {task.name} ---------------- ")
+            print(out.getvalue().strip())
@@ -0,0 +1,106 @@
+# test_clip_buffer.py
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from api.avi import read_avi
+from clip_buffer import NO_SCORE, ClipRecorder, FrameRing, best_frame, write_avi
+
+
+def jpeg(value, size=(32, 24)):
+    frame = np.full((size[1], size[0], 3), value, np.uint8)
+    return cv2.imencode(".jpg", frame)[1].tobytes()
+
+
+def test_ring_returns_frames_in_window():
+    ring = FrameRing(10_000)
+    for t in range(5):
+        ring.append(float(t), bytes([t]) * 10)
+    frames = ring.window(1.0, 3.0)
+    assert [f[0] for f in frames] == [1.0, 2.0, 3.0]
+    assert frames[0][1] == b"\x01" * 10
+    assert ring.latest_time() == 4.0
+
+
+def test_ring_overwrites_oldest_when_bytes_run_out():
+    ring = FrameRing(100)
+    for t in range(12):
+        assert ring.append(float(t), bytes([t]) * 30)
+    frames = ring.window(0.0, 100.0)
+    assert [f[0] for f in frames] == [9.0, 10.0, 11.0]
+    assert all(f[1] == bytes([int(f[0])]) * 30 for f in frames)  # no frame was torn by the wrap
+    assert ring.evicted == 9
+    assert not ring.append(12.0, b"x" * 101)
+
+
+def test_ring_overwrites_oldest_when_entries_run_out():
+    ring = FrameRing(10_000, max_frames=4)
+    for t in range(6):
+        ring.append(float(t), b"x")
+    assert [f[0] for f in ring.window(0.0, 10.0)] == [2.0, 3.0, 4.0, 5.0]
+
+
+def test_annotate_keeps_the_best_score():
+    ring = FrameRing(1000)
+    ring.append(1.0, b"a")
+    assert ring.annotate(1.0, 0.4)
+    assert ring.annotate(1.0, 0.2)
+    assert ring.window(1.0, 1.0)[0][2] == np.float32(0.4)
+    assert not ring.annotate(2.0, 0.9)
+
+
+def test_best_frame_prefers_sharp_frames_near_the_top_score():
+    frames = [(0.0, b"a", 0.90, 10.0), (1.0, b"b", 0.85, 50.0), (2.0, b"c", 0.5, 99.0), (3.0, b"d", NO_SCORE, 500.0)]
+    assert best_frame(frames)[1] == b"b"
+    assert best_frame([f for f in frames if f[2] == NO_SCORE])[1] == b"d"
+    assert best_frame([]) is None
+
+
+def test_avi_round_trip(tmp_path):
+    path = str(tmp_path / "clip.avi")
+    jpegs = [jpeg(v) for v in (0, 100, 200)]
+    jpegs.append(jpegs[0] + b"\0")  # odd length, padded in the file
+    write_avi(path, jpegs, 5.0, 32, 24)
+    with open(path, "rb") as f:
+        fps, frames = read_avi(f.read())
+    assert fps == 5.0
+    assert frames == jpegs
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_avi_opens_with_opencv(tmp_path):
+    path = str(tmp_path / "clip.avi")
+    write_avi(path, [jpeg(v) for v in range(0, 250, 50)], 5.0, 32, 24)
+    cap = cv2.VideoCapture(path)
+    count = 0
+    while cap.read()[0]:
+        count += 1
+    cap.release()
+    assert count == 5
+
+
+def test_recorder_writes_the_clip_around_an_alert(tmp_path):
+    recorder = ClipRecorder(str(tmp_path), pre=1.0, post=1.0, fps=5.0, queue_size=64)
+    done = threading.Event()
+    results = {}
+
+    def on_done(alert_id, path, best, info):
+        results.update(alert_id=alert_id, path=path, best=best, info=info)
+        done.set()
+
+    frame = np.zeros((24, 32, 3), np.uint8)
+    for i in range(16):
+        recorder.offer("cam1", i * 0.25, frame, active=True)
+    recorder.request("cam1", "alert_1", 2.0, on_done, animal="goat")
+    recorder.start()
+    assert done.wait(10)
+    recorder.stop()
+
+    assert results["alert_id"] == "alert_1"
+    assert results["info"]["camera_id"] == "cam1"
+    assert results["info"]["frames"] == 9  # 1.0s .. 3.0s, 0.25s apart
+    with open(results["path"], "rb") as f:
+        assert len(read_avi(f.read())[1]) == 9
+    assert os.path.exists(str(tmp_path / "alert_1.jpg"))
@@ -0,0 +1,98 @@
+# test_gsm_manager.py
+import time
+
+import pytest
+import serial
+
+from fakes import FakeModem
+from gsm_manager import GsmManager, ModemTimeout, Sim800
+
+
+@pytest.fixture
+def modem():
+    fake = FakeModem(reply="1").start()
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def manager(modem):
+    gsm = GsmManager.open(modem.port, 115200)
+    assert gsm is not None
+    yield gsm
+    gsm.close()
+
+
+def test_setup_configures_text_mode(manager, modem):
+    assert modem.commands[:5] == ["AT", "ATE0", "AT+CMGF=1", "AT+CNMI=2,1,0,0,0", "AT+CMGD=1,4"]
+    assert not modem.echo
+
+
+def test_send_sms_returns_message_reference(manager, modem):
+    assert manager.modem.send_sms("+250700000001", "hello").result(timeout=5) == 1
+    assert modem.sent_messages == ["hello"]
+    assert manager.modem.counts["sms_sent"] == 1
+
+
+def test_ask_resolves_with_the_farmer_reply(manager, modem):
+    reply = manager.ask("+250700000001", "Goat at cam1. Reply 1 to play.", "A1")
+    assert reply.result(timeout=5) == "1"
+    assert modem.sent_messages == ["Goat at cam1. Reply 1 to play. Ref A1"]
+    assert manager.stats()["waiting"] == 0
+
+
+def test_reply_with_reference_goes_to_that_alert(modem):
+    modem.reply = None  # answered by hand below
+    gsm = GsmManager.open(modem.port, 115200)
+    try:
+        first = gsm.ask("+250700000001", "First.", "A1")
+        second = gsm.ask("+250700000001", "Second.", "B2")
+        deadline = time.time() + 5
+        while len(modem.sent_messages) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        gsm._on_sms("+250700000000", "0 a1")
+        assert first.result(timeout=1) == "0"
+        assert not second.done()
+        gsm._on_sms("+250700000000", "1")  # bare answer: the latest alert still waiting
+        assert second.result(timeout=1) == "1"
+    finally:
+        gsm.close()
+
+
+def test_open_returns_none_without_a_modem(tmp_path):
+    assert GsmManager.open(str(tmp_path / "ttyNone"), 115200) is None
+
+
+class BrokenSerial:
+    """Serial port that accepts commands but never answers and fails on ESC."""
+
+    in_waiting = 0
+
+    def __init__(self):
+        self.written = []
+
+    def write(self, data):
+        if data == b"\x1b":
+            raise serial.SerialException("device disconnected")
+        self.written.append(data)
+
+    def read(self, size):
+        time.sleep(0.01)
+        return b""
+
+    def close(self):
+        pass
+
+
+def test_writer_survives_a_failed_escape():
+    ser = BrokenSerial()
+    sim = Sim800(ser, command_timeout=0.2).start()
+    try:
+        with pytest.raises(ModemTimeout):
+            sim.command('AT+CMGS="+250700000001"', body="hi").result(timeout=2)
+        with pytest.raises(ModemTimeout):
+            sim.command("AT").result(timeout=2)
+        assert ser.written[-1] == b"AT\r"
+        assert sim.counts["timeouts"] == 2
+    finally:
+        sim.close()
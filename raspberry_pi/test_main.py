@@ -0,0 +1,102 @@
+# test_main.py
+import contextlib
+
+import numpy as np
+import pytest
+
+import main
+from postprocess import make_detections
+
+GOAT = make_detections(np.array([[0.4, 0.4, 0.6, 0.6]], np.float32), np.array([0], np.int32),
+                       np.array([0.9], np.float32))
+
+
+class FakeMotion:
+    """Motion gate stand-in: reports motion while `motion` is True."""
+
+    def __init__(self):
+        self.motion = True
+        self.skipped = False
+        self.pixels = main.MOTION_THRESHOLD  # weak motion: no shortening of the interval
+
+    def update(self, frame):
+        return self.motion
+
+    def full_mask(self, frame):
+        return None
+
+
+class FakeEngine:
+    last_timings = {}
+
+
+class FakePool:
+    @contextlib.contextmanager
+    def acquire(self, camera_id):
+        yield FakeEngine()
+
+
+@pytest.fixture
+def scene(monkeypatch, tmp_path):
+    """A FrameProcessor whose model sees whatever is in scene['dets']."""
+    state = {"dets": GOAT, "inferences": []}
+
+    def detect_animals(frame, mask, eng):
+        state["inferences"].append(state["now"])
+        return state["dets"]
+
+    monkeypatch.setattr(main, "LABELS", ["goat", "dog"])
+    monkeypatch.setattr(main, "detect_animals", detect_animals)
+    monkeypatch.setattr(main, "record_detection", lambda camera_id, track, now: None)
+    monkeypatch.setattr(main, "cascade", None)
+
+    hot = tmp_path / "temp"
+    hot.write_text("85000")  # above THERMAL_HARD_LIMIT: every interval is stretched 4x
+    processor = main.FrameProcessor(camera_id="cam1", pool=FakePool())
+    processor.motion = FakeMotion()
+    processor.scheduler.thermal_path = str(hot)
+    state["processor"] = processor
+
+    frame = np.zeros((48, 64, 3), np.uint8)
+
+    def run(start, end, fps=4):
+        alerts = []
+        for i in range(int((end - start) * fps)):
+            state["now"] = start + i / fps
+            alerts += processor.process(frame, state["now"])
+        return alerts
+
+    state["run"] = run
+    return state
+
+
+def test_hot_cpu_never_stretches_inference_past_max_interval(scene):
+    scene["run"](0.0, 60.0)
+    gaps = np.diff(scene["inferences"])
+    assert gaps.max() <= main.DETECTION_MAX_INTERVAL
+
+
+def test_animal_standing_still_alerts_once(scene):
+    alerts = scene["run"](0.0, 120.0)
+    assert len(alerts) == 1
+    assert scene["processor"].tracker.total_tracks == 1
+
+
+def test_returning_animal_waits_for_the_cooldown(scene):
+    processor = scene["processor"]
+    assert len(scene["run"](0.0, 2.0)) == 1
+
+    # the goat walks off: motion stops and its track expires during the pause
+    processor.motion.motion = False
+    scene["run"](2.0, 10.0)
+    assert processor.tracker.tracks == []
+
+    # back within ALERT_COOLDOWN: a new track, but no new alert
+    processor.motion.motion = True
+    assert scene["run"](10.0, 12.0) == []
+    assert processor.tracker.total_tracks == 2
+
+    processor.motion.motion = False
+    scene["run"](12.0, 20.0)
+    processor.motion.motion = True
+    assert len(scene["run"](main.ALERT_COOLDOWN + 5.0, main.ALERT_COOLDOWN + 7.0)) == 1
@@ -0,0 +1,125 @@
+# test_outbox.py
+import sqlite3
+
+import pytest
+
+from fakes import FakeBatch, FakeFirestore
+from outbox import HELD, QUEUED, SYNCED, Outbox, SyncWorker
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    box = Outbox(str(tmp_path / "outbox.db"))
+    yield box
+    box.close()
+
+
+def test_updates_to_an_unsynced_document_are_merged(outbox):
+    outbox.record("alerts", "a1", {"status": "PENDING", "animal": "goat"})
+    outbox.record("alerts", "a1", {"status": "PROCESSED"})
+    rows = outbox.pending(10)
+    assert len(rows) == 1
+    _, version, collection, doc_id, data = rows[0]
+    assert (collection, doc_id) == ("alerts", "a1")
+    assert data == {"status": "PROCESSED", "animal": "goat"}
+    assert version == 1
+
+
+def test_held_rows_are_not_uploaded_until_released(outbox):
+    outbox.record("alerts", "a1", {"status": "PENDING"}, hold=True)
+    assert outbox.pending(10) == []
+    assert outbox.counts()[HELD] == 1
+    outbox.record("alerts", "a1", {"status": "PROCESSED"})
+    assert len(outbox.pending(10)) == 1
+
+
+def test_sync_uploads_and_acknowledges(outbox):
+    db = FakeFirestore()
+    outbox.record("alerts", "a1", {"status": "PROCESSED"})
+    worker = SyncWorker(outbox, lambda: db)
+    assert worker.sync_once()
+    assert db.docs[("alerts", "a1")] == {"status": "PROCESSED"}
+    assert outbox.counts() == {HELD: 0, QUEUED: 0, SYNCED: 1}
+
+
+def test_merge_during_upload_stays_queued(outbox, monkeypatch):
+    """A merge landing while the batch is committed must not be acknowledged with it."""
+    db = FakeFirestore()
+    outbox.record("alerts", "a1", {"status": "PENDING"})
+    commit = FakeBatch.commit
+
+    def commit_racing_a_merge(batch, timeout=None):
+        outbox.record("alerts", "a1", {"status": "PROCESSED"})
+        return commit(batch, timeout)
+
+    monkeypatch.setattr(FakeBatch, "commit", commit_racing_a_merge)
+    worker = SyncWorker(outbox, lambda: db)
+    assert worker.sync_once()
+    assert db.docs[("alerts", "a1")] == {"status": "PENDING"}
+    assert outbox.counts()[QUEUED] == 1
+
+    monkeypatch.undo()
+    assert worker.sync_once()
+    assert db.docs[("alerts", "a1")] == {"status": "PROCESSED"}
+    assert outbox.counts()[QUEUED] == 0
+
+
+def test_failed_sync_backs_off_and_keeps_rows(outbox):
+    db = FakeFirestore()
+    db.online = False
+    outbox.record("alerts", "a1", {"status": "PENDING"})
+    worker = SyncWorker(outbox, lambda: db, min_backoff=5.0, max_backoff=60.0)
+    assert not worker.sync_once()
+    assert 4.0 <= worker.backoff <= 6.0
+    assert worker.failures == 1
+    assert outbox.counts()[QUEUED] == 1
+
+
+def test_sync_starts_once_firestore_connects(outbox):
+    clients = [None]
+    outbox.record("alerts", "a1", {"status": "PENDING"})
+    worker = SyncWorker(outbox, lambda: clients[-1])
+    assert not worker.sync_once()
+    assert worker.last_error == "Firestore not connected"
+    assert outbox.counts()[QUEUED] == 1
+
+    clients.append(FakeFirestore())
+    assert worker.sync_once()
+    assert clients[-1].docs[("alerts", "a1")] == {"status": "PENDING"}
+    assert worker.backoff == 0.0
+
+
+def test_mark_synced_keeps_fields_of_later_writes(outbox):
+    outbox.record("alerts", "a1", {"status": "PENDING", "image": "a1.jpg"})
+    outbox.mark_synced("alerts", "a1", keep=("image",))
+    (_, _, _, _, data), = outbox.pending(10)
+    assert data == {"image": "a1.jpg"}
+
+
+def test_compact_drops_synced_history_first(tmp_path):
+    box = Outbox(str(tmp_path / "outbox.db"), max_bytes=0)
+    path = tmp_path / "a1.jpg"
+    path.write_bytes(b"x" * 1000)
+    box.record("alerts", "a1", {"status": "PROCESSED"}, file=str(path))
+    box.acknowledge([(row[0], row[1]) for row in box.pending(10)])
+    assert box.compact() >= 1
+    assert not path.exists()
+    assert box.dropped == 0
+    box.close()
+
+
+def test_old_database_gets_the_version_column(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, collection TEXT NOT NULL, "
+                 "doc_id TEXT NOT NULL, payload TEXT NOT NULL, state TEXT NOT NULL, "
+                 "priority INTEGER NOT NULL DEFAULT 0, file TEXT, created REAL NOT NULL, updated REAL NOT NULL, "
+                 "attempts INTEGER NOT NULL DEFAULT 0)")
+    conn.execute("INSERT INTO outbox (collection, doc_id, payload, state, created, updated) "
+                 "VALUES ('alerts', 'a1', '{}', 'queued', 0, 0)")
+    conn.commit()
+    conn.close()
+
+    box = Outbox(path)
+    assert [row[:2] for row in box.pending(10)] == [(1, 0)]
+    box.close()
@@ -0,0 +1,77 @@
+# test_pipeline.py
+import threading
+
+import pytest
+
+from pipeline import BLOCK, DROP_NEWEST, DROP_OLDEST, BoundedQueue, Pipeline
+
+
+def drain(q):
+    items = []
+    while True:
+        item = q.get(timeout=0)
+        if item is None:
+            return items
+        items.append(item)
+
+
+def test_drop_oldest_keeps_freshest_items():
+    q = BoundedQueue("frames", 2, DROP_OLDEST)
+    assert all(q.put(i) for i in range(5))
+    assert drain(q) == [3, 4]
+    assert q.dropped == 3
+    assert q.stats()["put"] == 5
+
+
+def test_drop_newest_keeps_queued_items():
+    q = BoundedQueue("alerts", 2, DROP_NEWEST)
+    results = [q.put(i) for i in range(4)]
+    assert results == [True, True, False, False]
+    assert drain(q) == [0, 1]
+    assert q.dropped == 2
+
+
+def test_block_waits_for_room():
+    q = BoundedQueue("replay", 1, BLOCK)
+    assert q.put("a")
+    assert not q.put("b", timeout=0.01)
+    assert q.dropped == 1
+
+    done = threading.Event()
+
+    def producer():
+        q.put("c", timeout=5)
+        done.set()
+
+    thread = threading.Thread(target=producer)
+    thread.start()
+    assert not done.wait(0.1)  # still full
+    assert q.get(timeout=1) == "a"
+    thread.join(5)
+    assert done.is_set()
+    assert q.get(timeout=1) == "c"
+
+
+def test_get_times_out_with_none():
+    assert BoundedQueue("empty", 1).get(timeout=0.01) is None
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        BoundedQueue("bad", 1, "drop_random")
+
+
+def test_stage_ends_when_step_returns_false():
+    pipeline = Pipeline()
+    calls = []
+
+    def step():
+        calls.append(1)
+        return len(calls) < 3
+
+    stage = pipeline.add_stage("counter", step)
+    pipeline.start()
+    stage.join(5)
+    assert not stage.is_alive()
+    assert len(calls) == 3
+    pipeline.stop()
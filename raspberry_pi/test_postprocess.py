@@ -0,0 +1,70 @@
+# test_postprocess.py
+import numpy as np
+
+from postprocess import batched_nms, best_detection, decode_yolo, nms
+
+
+def yolo_rows(rows, num_classes, objectness=True):
+    """(cx, cy, w, h, [obj,] class scores) rows from (cx, cy, w, h, class_id, score) tuples."""
+    width = 5 + num_classes if objectness else 4 + num_classes
+    out = np.zeros((len(rows), width), np.float32)
+    for i, (cx, cy, w, h, class_id, score) in enumerate(rows):
+        out[i, :4] = cx, cy, w, h
+        if objectness:
+            out[i, 4] = 1.0
+            out[i, 5 + class_id] = score
+        else:
+            out[i, 4 + class_id] = score
+    return out
+
+
+def test_nms_suppresses_overlaps_highest_first():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [50, 50, 60, 60]], np.float32)
+    scores = np.array([0.8, 0.9, 0.7], np.float32)
+    assert nms(boxes, scores).tolist() == [1, 2]
+
+
+def test_batched_nms_keeps_overlapping_boxes_of_other_classes():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [0, 0, 10, 10]], np.float32)
+    scores = np.array([0.9, 0.8, 0.7], np.float32)
+    class_ids = np.array([0, 0, 1], np.int32)
+    assert sorted(batched_nms(boxes, scores, class_ids).tolist()) == [0, 2]
+
+
+def test_batched_nms_empty():
+    empty = np.zeros((0, 4), np.float32)
+    assert len(batched_nms(empty, np.zeros(0, np.float32), np.zeros(0, np.int32))) == 0
+
+
+def test_decode_yolov5_anchor_major():
+    out = yolo_rows([(0.5, 0.5, 0.2, 0.2, 2, 0.9),
+                     (0.51, 0.5, 0.2, 0.2, 2, 0.6),   # same object, suppressed
+                     (0.2, 0.2, 0.1, 0.1, 0, 0.3)],   # below the threshold
+                    num_classes=3)
+    dets = decode_yolo(out[None], num_classes=3)
+    assert len(dets) == 1
+    assert dets[0]["class_id"] == 2
+    assert np.isclose(dets[0]["score"], 0.9)
+    assert np.allclose(dets[0]["box"], [0.4, 0.4, 0.6, 0.6])
+
+
+def test_decode_yolov5_multiplies_objectness():
+    out = yolo_rows([(0.5, 0.5, 0.2, 0.2, 1, 0.9)], num_classes=2)
+    out[0, 4] = 0.5
+    dets = decode_yolo(out, num_classes=2)
+    assert np.isclose(dets[0]["score"], 0.45)
+
+
+def test_decode_yolov8_channel_major_in_pixels():
+    rows = [(160, 160, 64, 64, 1, 0.8)] + [(0, 0, 1, 1, 0, 0.0)] * 9
+    out = yolo_rows(rows, num_classes=2, objectness=False).T  # (C, N)
+    dets = decode_yolo(out, num_classes=2, input_size=(320, 320))
+    assert len(dets) == 1
+    assert dets[0]["class_id"] == 1
+    assert np.allclose(dets[0]["box"], [0.4, 0.4, 0.6, 0.6])
+
+
+def test_decode_without_detections():
+    dets = decode_yolo(np.zeros((10, 7), np.float32), num_classes=2)
+    assert len(dets) == 0
+    assert best_detection(dets) is None
@@ -0,0 +1,15 @@
+# test_scheduler.py
+from metrics import SCHEDULER_DECISIONS
+from scheduler import DetectionScheduler
+
+
+def test_decisions_are_counted_by_reason():
+    scheduler = DetectionScheduler(100, base_interval=0.5, thermal_path=None, camera_id="test_cam")
+    assert scheduler.should_run(0.0, 100)      # first frame of the episode
+    assert not scheduler.should_run(0.1, 100)  # within the interval
+    assert scheduler.should_run(0.6, 100)
+
+    assert SCHEDULER_DECISIONS.value("test_cam", "run", "first_motion") == 1
+    assert SCHEDULER_DECISIONS.value("test_cam", "skip", "waiting") == 1
+    assert SCHEDULER_DECISIONS.value("test_cam", "run", "interval") == 1
+    assert scheduler.stats()["skipped"] == 1
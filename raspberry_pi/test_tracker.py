@@ -0,0 +1,69 @@
+# test_tracker.py
+import numpy as np
+
+from postprocess import empty_detections, make_detections
+from tracker import Tracker
+
+
+def dets(*rows):
+    """Detections from (x1, y1, x2, y2, class_id, score) rows."""
+    if not rows:
+        return empty_detections()
+    rows = np.array(rows, np.float32)
+    return make_detections(rows[:, :4], rows[:, 4].astype(np.int32), rows[:, 5])
+
+
+def test_track_is_confirmed_after_min_hits():
+    tracker = Tracker(min_hits=2, confirm_score=0.95)
+    assert tracker.update(dets((0.1, 0.1, 0.3, 0.3, 0, 0.6)), now=0.0) == []
+    confirmed = tracker.update(dets((0.12, 0.1, 0.32, 0.3, 0, 0.6)), now=1.0)
+    assert [t.id for t in confirmed] == [1]
+    # already confirmed: not reported again
+    assert tracker.update(dets((0.14, 0.1, 0.34, 0.3, 0, 0.6)), now=2.0) == []
+    assert tracker.total_tracks == 1
+
+
+def test_confident_detection_confirms_at_once():
+    tracker = Tracker(min_hits=3, confirm_score=0.8)
+    assert len(tracker.update(dets((0.1, 0.1, 0.3, 0.3, 0, 0.9)), now=0.0)) == 1
+
+
+def test_centroid_fallback_keeps_identity_of_a_fast_animal():
+    tracker = Tracker(iou_threshold=0.3, centroid_gate=0.15)
+    tracker.update(dets((0.10, 0.1, 0.20, 0.2, 0, 0.9)), now=0.0)
+    tracker.update(dets((0.22, 0.1, 0.32, 0.2, 0, 0.9)), now=1.0)  # no overlap, centroid 0.12 away
+    assert [t.id for t in tracker.tracks] == [1]
+
+
+def test_prediction_follows_velocity():
+    tracker = Tracker()
+    tracker.update(dets((0.1, 0.1, 0.2, 0.2, 0, 0.9)), now=0.0)
+    tracker.update(dets((0.2, 0.1, 0.3, 0.2, 0, 0.9)), now=1.0)
+    tracker.predict(2.0)
+    assert tracker.tracks[0].box[0] > 0.2
+
+
+def test_class_vote_resists_a_single_flip():
+    tracker = Tracker()
+    for now, class_id, score in ((0.0, 1, 0.9), (1.0, 1, 0.9), (2.0, 2, 0.7)):
+        tracker.update(dets((0.1, 0.1, 0.3, 0.3, class_id, score)), now=now)
+    assert tracker.tracks[0].class_id == 1
+
+
+def test_tracks_expire_after_max_age():
+    tracker = Tracker(max_age=3.0)
+    tracker.update(dets((0.1, 0.1, 0.3, 0.3, 0, 0.9)), now=0.0)
+    tracker.update(dets(), now=3.0)
+    assert len(tracker.tracks) == 1
+    tracker.update(dets(), now=3.5)
+    assert tracker.tracks == []
+
+
+def test_all_alerted():
+    tracker = Tracker()
+    assert not tracker.all_alerted()
+    tracker.update(dets((0.1, 0.1, 0.3, 0.3, 0, 0.9), (0.6, 0.6, 0.8, 0.8, 1, 0.9)), now=0.0)
+    tracker.tracks[0].alerted = True
+    assert not tracker.all_alerted()
+    tracker.tracks[1].alerted = True
+    assert tracker.all_alerted()
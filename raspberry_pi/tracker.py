@@ -0,0 +1,164 @@
+# tracker.py
+import itertools
+
+import numpy as np
+
+
+def iou_matrix(a, b):
+    """Pairwise IoU between (N, 4) and (M, 4) xyxy boxes."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def centroid_distance(a, b):
+    ca = (a[:, 0:2] + a[:, 2:4]) / 2
+    cb = (b[:, 0:2] + b[:, 2:4]) / 2
+    return np.linalg.norm(ca[:, None, :] - cb[None, :, :], axis=2)
+
+
+class Track:
+    """One animal followed across frames. Boxes are normalised xyxy frame coordinates."""
+
+    def __init__(self, track_id, box, class_id, score, now):
+        self.id = track_id
+        self.box = np.asarray(box, dtype=np.float32).copy()
+        self.velocity = np.zeros(4, dtype=np.float32)  # box units per second
+        self.class_scores = {int(class_id): float(score)}
+        self.score = float(score)
+        self.best_score = float(score)
+        self.hits = 1
+        self.first_seen = now
+        self.last_seen = now
+        self.last_predicted = now
+        self.alerted = False
+
+    @property
+    def class_id(self):
+        # score-weighted vote, so one goat/sheep flip does not relabel the track
+        return max(self.class_scores, key=self.class_scores.get)
+
+    def predict(self, now):
+        dt = now - self.last_predicted
+        if dt > 0:
+            self.box += self.velocity * dt
+            self.last_predicted = now
+
+    def update(self, box, class_id, score, now):
+        box = np.asarray(box, dtype=np.float32)
+        dt = now - self.last_seen
+        if dt > 0:
+            # box propagated by predict() already includes the old velocity;
+            # measure against it and blend the correction in
+            observed = (box - self.box) / dt + self.velocity
+            self.velocity = 0.5 * self.velocity + 0.5 * observed
+        self.box = box.copy()
+        self.class_scores[int(class_id)] = self.class_scores.get(int(class_id), 0.0) + float(score)
+        self.score = float(score)
+        self.best_score = max(self.best_score, float(score))
+        self.hits += 1
+        self.last_seen = now
+        self.last_predicted = now
+
+
+class Tracker:
+    """
+    SORT-style tracker in plain NumPy.
+
+    Detections are matched to tracks by IoU against the propagated boxes, with
+    a centroid-distance fallback for animals that moved further than their
+    own size between two (possibly sparse) detection frames. Between detection
+    frames predict() moves every track along its estimated velocity, so the
+    model does not have to run on every frame to keep identities.
+    """
+
+    def __init__(self, iou_threshold=0.3, centroid_gate=0.15, max_age=3.0, min_hits=2, confirm_score=0.8):
+        self.iou_threshold = iou_threshold
+        self.centroid_gate = centroid_gate
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.confirm_score = confirm_score
+        self.tracks = []
+        self.total_tracks = 0
+        self._ids = itertools.count(1)
+
+    def is_confirmed(self, track):
+        return track.hits >= self.min_hits or track.best_score >= self.confirm_score
+
+    def predict(self, now):
+        for track in self.tracks:
+            track.predict(now)
+
+    def _match(self, boxes):
+        """Greedy assignment. Returns list of (track_index, detection_index)."""
+        if not self.tracks or len(boxes) == 0:
+            return []
+
+        track_boxes = np.stack([t.box for t in self.tracks])
+        score = iou_matrix(track_boxes, boxes)
+
+        # pairs below the IoU threshold but close enough score under every IoU match
+        dist = centroid_distance(track_boxes, boxes)
+        fallback = (score < self.iou_threshold) & (dist < self.centroid_gate)
+        score = np.where(score >= self.iou_threshold, 1.0 + score, 0.0)
+        score = np.where(fallback, 1.0 - dist / self.centroid_gate, score)
+
+        pairs = []
+        used_tracks, used_dets = set(), set()
+        for flat in np.argsort(-score, axis=None):
+            ti, di = np.unravel_index(flat, score.shape)
+            if score[ti, di] <= 0:
+                break
+            if ti in used_tracks or di in used_dets:
+                continue
+            used_tracks.add(ti)
+            used_dets.add(di)
+            pairs.append((int(ti), int(di)))
+        return pairs
+
+    def update(self, dets, now):
+        """
+        Feed the detections (postprocess.DETECTION_DTYPE) of one inference.
+        Returns the tracks that became confirmed on this call.
+        """
+        self.predict(now)
+        was_confirmed = {t.id for t in self.tracks if self.is_confirmed(t)}
+
+        boxes = dets["box"] if len(dets) else np.zeros((0, 4), dtype=np.float32)
+        matched_dets = set()
+        for ti, di in self._match(boxes):
+            det = dets[di]
+            self.tracks[ti].update(det["box"], det["class_id"], det["score"], now)
+            matched_dets.add(di)
+
+        for di in range(len(dets)):
+            if di not in matched_dets:
+                det = dets[di]
+                self.tracks.append(Track(next(self._ids), det["box"], det["class_id"], det["score"], now))
+                self.total_tracks += 1
+
+        self.prune(now)
+        return [t for t in self.tracks if self.is_confirmed(t) and t.id not in was_confirmed]
+
+    def prune(self, now):
+        self.tracks = [t for t in self.tracks if now - t.last_seen <= self.max_age]
+
+    def active(self):
+        return [t for t in self.tracks if self.is_confirmed(t)]
+
+    def all_alerted(self):
+        """True when there are live tracks and every one of them has been alerted on."""
+        active = self.active()
+        return bool(active) and all(t.alerted for t in active)
+
+    def stats(self):
+        return {
+            "live": len(self.tracks),
+            "confirmed": len(self.active()),
+            "total": self.total_tracks,
+        }
@@ -0,0 +1,185 @@
+# uploader.py
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import UPLOAD_BYTES, UPLOAD_FAILURES, UPLOAD_SECONDS, UPLOAD_SIZE
+from pipeline import BoundedQueue, DROP_OLDEST
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+
+
+def keep_alive_session(api_key=None):
+    """A requests session holding one persistent connection per host, sending `api_key` as X-Api-Key."""
+    session = requests.Session()
+    if api_key:
+        session.headers["X-Api-Key"] = api_key
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+    session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+    return session
+
+
+class ImageUploader(threading.Thread):
+    """
+    Posts alert JPEGs to the cloud API from a background thread.
+
+    submit() takes bytes already encoded in memory and returns at once. The
+    queue is bounded and drops the oldest image when full: the API only
+    keeps the latest picture, so a newer alert makes older uploads moot.
+    One keep-alive session is reused for every request. A failed upload is
+    retried with exponential backoff, unless a newer image is waiting.
+    With another `content_type` (video/x-msvideo) it uploads alert clips.
+    """
+
+    def __init__(self, url, queue_size=4, retries=5, min_backoff=1.0, max_backoff=60.0,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), content_type="image/jpeg", name="image-uploader",
+                 api_key=None):
+        super().__init__(name=name, daemon=True)
+        self.url = url
+        self.content_type = content_type
+        self.retries = retries
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.queue = BoundedQueue("uploads", queue_size, DROP_OLDEST)
+
+        self.session = keep_alive_session(api_key)
+
+        self.uploaded = 0
+        self.failed = 0
+        self.superseded = 0
+        self.last_latency = None
+        self.last_error = None
+        self._stopping = threading.Event()
+
+    def submit(self, jpeg, filename="latest.jpg", fields=None):
+        """
+        Queue JPEG bytes for upload, with optional form `fields` (camera_id,
+        animal, confidence, alert_id, captured_at) for the API's history index.
+        """
+        return self.queue.put((jpeg, filename, fields or {}, time.time()))
+
+    def run(self):
+        while not self._stopping.is_set():
+            item = self.queue.get(timeout=0.5)
+            if item is not None:
+                self._upload(*item)
+
+    def _upload(self, jpeg, filename, fields, queued_at):
+        backoff = self.min_backoff
+        for attempt in range(self.retries + 1):
+            t0 = time.perf_counter()
+            try:
+                response = self.session.post(
+                    self.url,
+                    files={"file": (filename, jpeg, self.content_type)},
+                    data=fields,
+                    timeout=self.timeout,
+                )
+                if response.status_code == 200:
+                    self.uploaded += 1
+                    self.last_latency = time.perf_counter() - t0
+                    UPLOAD_SECONDS.observe(self.last_latency)
+                    UPLOAD_BYTES.inc(amount=len(jpeg))
+                    UPLOAD_SIZE.observe(len(jpeg))
+                    print(f"{filename} uploaded to cloud API in {self.last_latency*1000:.0f} ms "
+                          f"({len(jpeg)/1024:.0f} KB, {time.time() - queued_at:.1f}s after capture)")
+                    return True
+                self.last_error = f"HTTP {response.status_code}: {response.text[:200]}"
+                UPLOAD_FAILURES.inc("http")
+            except requests.RequestException as e:
+                self.last_error = str(e)
+                UPLOAD_FAILURES.inc("network")
+
+            if attempt == self.retries or self._stopping.is_set():
+                break
+            if self.queue.qsize():
+                self.superseded += 1
+                print("Upload failed, newer image queued -> skipping retry.")
+                return False
+            print(f"Upload failed ({self.last_error}), retrying in {backoff:.1f}s")
+            if self._stopping.wait(backoff):
+                break
+            backoff = min(backoff * 2, self.max_backoff)
+
+        self.failed += 1
+        print(f"Upload gave up: {self.last_error}")
+        return False
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self.join(timeout)
+        self.session.close()
+
+    def stats(self):
+        return {
+            "uploaded": self.uploaded,
+            "failed": self.failed,
+            "superseded": self.superseded,
+            "queued": self.queue.qsize(),
+            "dropped": self.queue.dropped,
+            "last_latency_ms": round(self.last_latency * 1000, 1) if self.last_latency is not None else None,
+            "last_error": self.last_error,
+        }
+
+
+class EventReporter(threading.Thread):
+    """
+    Posts alert state changes to the cloud API, which pushes them to the
+    app over /events. Best effort: Firestore stays the record of alerts,
+    so an event that still fails after `retries` attempts is dropped.
+    """
+
+    def __init__(self, base_url, queue_size=64, retries=2, backoff=1.0, timeout=(CONNECT_TIMEOUT, 10), api_key=None):
+        super().__init__(name="event-reporter", daemon=True)
+        self.base_url = base_url.rstrip("/")
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.queue = BoundedQueue("alert-events", queue_size, DROP_OLDEST)
+        self.session = keep_alive_session(api_key)
+        self.sent = 0
+        self.failed = 0
+        self.last_error = None
+        self._stopping = threading.Event()
+
+    def submit(self, alert_id, state, **fields):
+        return self.queue.put((alert_id, dict(fields, state=state)))
+
+    def run(self):
+        while not self._stopping.is_set():
+            item = self.queue.get(timeout=0.5)
+            if item is not None:
+                self._post(*item)
+
+    def _post(self, alert_id, body):
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.post(f"{self.base_url}/alerts/{alert_id}", json=body, timeout=self.timeout)
+                if response.status_code == 200:
+                    self.sent += 1
+                    return True
+                self.last_error = f"HTTP {response.status_code}"
+            except requests.RequestException as e:
+                self.last_error = str(e)
+            if attempt < self.retries and self._stopping.wait(self.backoff * 2 ** attempt):
+                break
+        self.failed += 1
+        return False
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self.join(timeout)
+        self.session.close()
+
+    def stats(self):
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "queued": self.queue.qsize(),
+            "dropped": self.queue.dropped,
+            "last_error": self.last_error,
+        }